@@ -1,16 +1,57 @@
+import multiprocessing
+import os
+import tempfile
+
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 
 import sirenity.app as sirenity
+from sirenity.broker import run_server
 
 
 def main():
-    """Starts the web server"""
-    configuration = uvicorn.Config(
-        sirenity.app,
-        host="0.0.0.0",
+    """
+    Starts the web server
+
+    Set SIRENITY_WORKERS to run more than one worker process, the workers then
+    share rooms through a broker server on a unix socket. Set SIRENITY_WS_DEFLATE
+    to 0 to turn off permessage-deflate compression of websocket messages. Set
+    SIRENITY_JOURNAL to a directory to keep games on disk, so they survive a restart.
+    """
+    workers = int(os.environ.get("SIRENITY_WORKERS", 1))
+    deflate = os.environ.get("SIRENITY_WS_DEFLATE", "1") != "0"
+    if workers <= 1:
+        configuration = uvicorn.Config(
+            sirenity.app,
+            host="0.0.0.0",
+            ws_per_message_deflate=deflate,
+        )
+        server = sirenity.Server(configuration)
+        server.run()
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sirenity-"), "broker.sock")
+    broker = multiprocessing.Process(
+        target=run_server,
+        args=(path, os.environ.get("SIRENITY_JOURNAL")),
+        daemon=True,
     )
-    server = uvicorn.Server(configuration)
-    server.run()
+    broker.start()
+    # Workers are started in new processes, which inherit the environment
+    os.environ["SIRENITY_BROKER"] = f"unix://{path}"
+    try:
+        configuration = uvicorn.Config(
+            "sirenity.app:app",
+            host="0.0.0.0",
+            workers=workers,
+            ws_per_message_deflate=deflate,
+        )
+        # As uvicorn.run does, but with the server keeping the rooms on shutdown
+        server = sirenity.Server(configuration)
+        sockets = [configuration.bind_socket()]
+        Multiprocess(configuration, target=server.run, sockets=sockets).run()
+    finally:
+        broker.terminate()
 
 
 if __name__ == "__main__":
@@ -1,88 +1,218 @@
-import json
+import os
 import pathlib
+import secrets
+import time
+from types import FrameType
+from urllib.parse import parse_qs
 
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
+import jinja2
+import uvicorn
+from fastapi import (
+    FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+)
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
-from .game_manager import GameManager
-from .message import JoinMessage, Message
+from . import metrics, profiler
+from .broker import create_broker
+from .client import PING_INTERVAL, PING_TIMEOUT, QUEUE_SIZE, OverflowPolicy
+from .code import SandboxExecutor
+from .encoding import MSGPACK
+from .game_manager import PEOPLE_PER_GAME, GameManager
+from .message import (
+    JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, RESUME_SUBPROTOCOL_PREFIX,
+    JoinMessage, Message
+)
+from .room_manager import RoomManager, RoomNotFoundError
+from .static_files import VERSION_PARAMETER, PrecompressedStaticFiles
 
 ROOT = pathlib.Path(__file__).parent
+# Longest profile an admin can take, in seconds
+MAX_PROFILE_SECONDS = 60
 
 
 app = FastAPI()
 
-app.mount("/static", StaticFiles(directory=ROOT / "static"), name="static")
+static = PrecompressedStaticFiles(directory=ROOT / "static")
+app.mount("/static", static, name="static")
 templates = Jinja2Templates(directory=ROOT / "templates")
 
 
+@jinja2.pass_context
+def static_url(context: dict, path: str) -> str:
+    """
+    Returns the URL of a static file, which changes with the content of the file
+
+    :param context: Template context, with the request
+    :param path: Path of the file in the static directory
+
+    :return: URL
+    """
+    url = context["request"].url_for("static", path=path)
+    version = static.version(path)
+    return url if version is None else f"{url}?{VERSION_PARAMETER}={version}"
+
+
+templates.env.globals["static_url"] = static_url
+
+
 @app.get("/")
 def index(request: Request):
     """The main site page"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    rooms = app.room_manager.open_rooms.values()  # type: ignore
+    return templates.TemplateResponse(
+        "index.html",
+        {"request": request, "rooms": [room for room in rooms if room.is_open]},
+    )
 
 
 @app.get("/create")
 def game(request: Request):
     """The game creation form"""
-    return templates.TemplateResponse("create.html", {"request": request})
+    return templates.TemplateResponse(
+        "create.html", {"request": request, "people_per_game": PEOPLE_PER_GAME}
+    )
+
+
+@app.post("/game")
+async def create_game(request: Request):
+    """
+    Creates a room from the game creation form and joins it
+
+    The form is parsed here, since starlette needs python-multipart to parse any form.
+    """
+    form = parse_qs((await request.body()).decode())
+    name = form.get("name", [""])[0]
+    try:
+        amount = int(form.get("amount", [""])[0])
+    except ValueError:
+        amount = PEOPLE_PER_GAME
+    room = await app.room_manager.create_room(  # type: ignore
+        name=name, people_per_game=min(max(amount, 2), 8)
+    )
+    # See other, so the browser follows the redirect with a GET
+    return RedirectResponse(f"/web-ide?room={room.room_id}", status_code=303)
+
+
+def select_subprotocol(offered: list[str]) -> str | None:
+    """
+    Picks the encoding of a connection from the subprotocols the client offered
+
+    :param offered: Subprotocols the client offered
+
+    :return: Subprotocol to accept, or None if the client offered none we speak
+    """
+    if MSGPACK and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def resume_token(offered: list[str]) -> str | None:
+    """
+    Finds the token of the session a client resumes among the subprotocols it offered
+
+    :param offered: Subprotocols the client offered
+
+    :return: Token, or None if the client does not resume a session
+    """
+    for subprotocol in offered:
+        if subprotocol.startswith(RESUME_SUBPROTOCOL_PREFIX):
+            return subprotocol.removeprefix(RESUME_SUBPROTOCOL_PREFIX)
+    return None
+
+
+def observe_message(
+    room: GameManager, client_id: int, message: Message, seconds: float
+) -> None:
+    """
+    Records the time spent handling a message, for the metrics and a running profile
+
+    :param room: Room of the message
+    :param client_id: ID of the client sending the message
+    :param message: Message handled
+    :param seconds: Time spent handling the message
+    """
+    if metrics.ENABLED:
+        metrics.observe_message(room.room_id, message.action, seconds)
+    if profiler.current is not None:
+        action = getattr(message.action, "value", "other")
+        profiler.current.record_handler(action, room.room_id, client_id, seconds)
 
 
 @app.websocket("/update-code")
-async def update_Code(websocket: WebSocket):
-    """Handles changes between clients"""
-    game_manager = app.game_manager  # type: ignore
-    if game_manager is None:
-        raise Exception("No GameManager instance")
-    await websocket.accept()
-    client_id, token = await game_manager.add_client(websocket)
-    await websocket.send_text(
-        str(
+async def update_Code(websocket: WebSocket, room: str | None = None):
+    """
+    Handles changes between clients
+
+    Clients are authenticated once, when they connect. A client reconnecting
+    offers the token it was given as a sirenity.resume.<token> subprotocol to
+    resume its session, which keeps the token out of the logged URL. Clients
+    asking for the sirenity.msgpack subprotocol are sent compact MessagePack
+    instead of JSON. Clients are pinged, and removed once they stop sending anything.
+    """
+    room_manager: RoomManager = app.room_manager  # type: ignore
+    offered = websocket.scope.get("subprotocols", [])
+    subprotocol = select_subprotocol(offered)
+    resume = resume_token(offered)
+    binary = subprotocol == MSGPACK_SUBPROTOCOL
+    # Accepted first, so the client sees why it is closed if it cannot join
+    await websocket.accept(subprotocol=subprotocol)
+    if room is None:
+        game_manager = await room_manager.find_room()
+    else:
+        try:
+            game_manager = await room_manager.get_room(room)
+        except RoomNotFoundError:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    session = None
+    if resume is not None:
+        session = await game_manager.resume_client(websocket, resume, binary=binary)
+    if session is None:
+        if not game_manager.is_open:
+            # Only the players of a game that started or filled up can come back to it
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        session = await game_manager.add_client(websocket, binary=binary)
+    client_id, token = session
+    client = game_manager.clients[client_id]
+    try:
+        client.send(
             JoinMessage(
                 action="assign_id",
                 user_id=client_id,
                 token=token,
-                data={"problems": game_manager.get_problems()},
-            )
+                data={
+                    "problems": await game_manager.get_problems(),
+                    "room": game_manager.room_id,
+                },
+            ).frame()
         )
-    )
-
-    if game_manager.game_ended:
-        await websocket.send_text(
-            str(
-                Message(
-                    json.dumps(
-                        {
-                            "action": "game_end",
-                        }
-                    )
-                )
-            )
-        )
-    try:
+        # A player reconnecting after the game started is told where it is at
+        game_manager.send_state(client_id)
         while True:
-            data = Message(await websocket.receive_text())
-            if data.action == "submitCode":
-                code = game_manager.get_code(data)
-                code  # run and check code
-                continue
-            elif data.action == "vote":
-                await game_manager.vote(data)
-                continue
-            elif data.action == "requestCode" and game_manager.started:
-
-                await game_manager.request_code(websocket)
-            if game_manager.waiting_for_code_request:
-                if (
-                    game_manager.clients[data.user_id].websocket
-                    == game_manager.first_client
-                ):
-                    await game_manager.send_requested_code(data)
-
-            await game_manager.broadcast(client_id, data)
+            if binary:
+                data = Message(await websocket.receive_bytes())
+            else:
+                data = Message(await websocket.receive_text())
+            client.last_received = time.monotonic()
+            if client.closed:
+                break
+            if metrics.ENABLED or profiler.current is not None:
+                start = time.perf_counter()
+                await game_manager.handle_message(client_id, data)
+                observe_message(
+                    game_manager, client_id, data, time.perf_counter() - start
+                )
+            else:
+                await game_manager.handle_message(client_id, data)
     except WebSocketDisconnect:
-        game_manager.remove_client(client_id)
+        pass
+    finally:
+        # Errors leave the room too, so a bad message does not leave a ghost behind
+        await game_manager.remove_client(client_id, client)
 
 
 @app.get("/web-ide")
@@ -91,13 +221,88 @@ def web_ide(request: Request):
     return templates.TemplateResponse("send-code.html", {"request": request})
 
 
+@app.get("/metrics")
+def get_metrics():
+    """Metrics of this worker, in the Prometheus text format"""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/profile")
+async def profile(
+    request: Request,
+    seconds: float = 10,
+    interval: float = profiler.INTERVAL,
+    format: str = "json",
+):
+    """
+    Profiles the event loop of this worker, for admins
+
+    Requests need the header "Authorization: Bearer <token>", with the token
+    set in SIRENITY_ADMIN_TOKEN. The endpoint does not exist without it.
+    format=collapsed returns the stacks alone, for flame graph tools.
+    """
+    token = os.environ.get("SIRENITY_ADMIN_TOKEN", "")
+    authorization = request.headers.get("authorization", "")
+    if not token or not secrets.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    ):
+        raise HTTPException(status_code=404)
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    interval = min(max(interval, 0.001), 1.0)
+    try:
+        report = await profiler.Profile(interval).run(seconds)
+    except profiler.ProfileRunningError:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    if format == "collapsed":
+        return PlainTextResponse(
+            report["stacks"],
+            headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+        )
+    return report
+
+
 @app.on_event("startup")
-def startup():
-    """Sets GameManager"""
-    app.game_manager = GameManager()  # type: ignore
+async def startup():
+    """Connects to the broker, starts the sandbox and sets RoomManager"""
+    broker = create_broker(
+        os.environ.get("SIRENITY_BROKER", "memory://"),
+        os.environ.get("SIRENITY_JOURNAL"),
+    )
+    await broker.connect()
+    executor = SandboxExecutor()
+    await executor.start()
+    app.room_manager = RoomManager(  # type: ignore
+        database=os.environ.get("SIRENITY_DATABASE", "problems.db"),
+        broker=broker,
+        executor=executor,
+        ping_interval=float(os.environ.get("SIRENITY_PING_INTERVAL", PING_INTERVAL)),
+        ping_timeout=float(os.environ.get("SIRENITY_PING_TIMEOUT", PING_TIMEOUT)),
+        queue_size=int(os.environ.get("SIRENITY_QUEUE_SIZE", QUEUE_SIZE)),
+        overflow_policy=OverflowPolicy(
+            os.environ.get("SIRENITY_OVERFLOW_POLICY", OverflowPolicy.DROP_CURSOR.value)
+        ),
+    )
+    app.room_manager.start_heartbeat()  # type: ignore
+    metrics.watch_rooms(app.room_manager.rooms)  # type: ignore
+
+
+class Server(uvicorn.Server):
+    """Uvicorn server keeping the rooms as they are while it shuts down"""
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        """Tells the rooms the server shuts down, before it closes the connections"""
+        room_manager: RoomManager | None = getattr(app, "room_manager", None)
+        if room_manager is not None:
+            room_manager.shut_down()
+        super().handle_exit(sig, frame)
 
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     """Closes resources"""
-    del app.game_manager
+    app.room_manager.close()  # type: ignore
+    await app.room_manager.broker.close()  # type: ignore
+    app.room_manager.executor.close()  # type: ignore
+    del app.room_manager
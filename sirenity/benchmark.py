@@ -0,0 +1,671 @@
+import abc
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+from .code import SandboxExecutor
+from .encoding import BACKEND, dumps, loads
+from .euler import Problem, ProblemManager
+from .game_manager import AMOUNT_OF_PROBLEMS, PEOPLE_PER_GAME, GameManager
+from .message import Message
+from .room_manager import RoomManager
+
+# Sequence numbers the benchmark adds to the data of the messages it sends
+SEQUENCE = re.compile(r'"seq":\s*(\d+)')
+# Action of a frame, which comes first in every frame the benchmark sends
+ACTION = re.compile(r'"action":\s*"(\w+)"')
+# Seconds without frames after which the fan-out is considered done
+SETTLE_TIME = 0.2
+# Seconds to wait for a frame before giving up on it
+WAIT_TIMEOUT = 30
+# Characters typed by the players
+ALPHABET = string.ascii_lowercase + " ()=+:"
+# Metrics where a higher value is better, the others are better lower
+HIGHER_IS_BETTER = frozenset(("messages_per_second", "frames_per_second"))
+
+
+@dataclass
+class BenchmarkConfig:
+    """Settings of a benchmark run"""
+
+    rooms: int = 20
+    people_per_game: int = PEOPLE_PER_GAME
+    # Messages each player sends, and how many they send per second on average
+    messages: int = 200
+    rate: float = 20.0
+    # inprocess drives the rooms directly, socket serves the app on a local port
+    mode: str = "inprocess"
+    seed: int = 0
+
+
+def percentiles(values: list[float]) -> dict[str, float] | None:
+    """
+    Returns the percentiles of latencies, in milliseconds
+
+    :param values: Latencies in seconds
+
+    :return: p50, p90, p99 and max, or None without values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def percentile(fraction: float) -> float:
+        return round(ordered[round(fraction * (len(ordered) - 1))] * 1000, 3)
+
+    return {
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": percentile(1),
+    }
+
+
+def make_trace(
+    rng: random.Random, length: int, problem_ids: list[int]
+) -> list[dict[str, Any]]:
+    """
+    Returns the messages of a player typing, like send-code.js sends them
+
+    Players mostly type one character at a time and move their cursor, and
+    sometimes delete, paste a few edits at once, change problem or chat.
+
+    :param rng: Random number generator
+    :param length: Number of messages
+    :param problem_ids: Problems of the game
+
+    :return: Messages
+    """
+    trace: list[dict[str, Any]] = []
+    problem_id = rng.choice(problem_ids)
+    row = column = 0
+
+    def insert() -> dict[str, Any]:
+        nonlocal row, column
+        start = {"row": row, "column": column}
+        if rng.random() < 0.1:
+            text = ["", ""]
+            row, column = row + 1, 0
+        else:
+            text = [rng.choice(ALPHABET)]
+            column += 1
+        end = {"row": row, "column": column}
+        data = {"text": text, "start": start, "end": end}
+        return {"action": "insert", "problem_id": problem_id, "data": data}
+
+    while len(trace) < length:
+        roll = rng.random()
+        if roll < 0.5:
+            trace.append(insert())
+        elif roll < 0.6 and column > 0:
+            column -= 1
+            data = {
+                "text": ["x"],
+                "start": {"row": row, "column": column},
+                "end": {"row": row, "column": column + 1},
+            }
+            trace.append({"action": "remove", "problem_id": problem_id, "data": data})
+        elif roll < 0.7:
+            ops = [insert() for _ in range(rng.randint(2, 5))]
+            trace.append({"action": "batch", "problem_id": -1, "data": {"ops": ops}})
+        elif roll < 0.73:
+            problem_id = rng.choice(problem_ids)
+            row = column = 0
+            data = {"pos": {"row": row, "column": column}}
+            trace.append(
+                {"action": "cursorMove", "problem_id": problem_id, "data": data}
+            )
+        elif roll < 0.75:
+            data = {"message": "".join(rng.choices(ALPHABET, k=20))}
+            trace.append({"action": "chat_message", "problem_id": -1, "data": data})
+        else:
+            data = {"pos": {"row": row, "column": column}}
+            trace.append(
+                {"action": "cursorMove", "problem_id": problem_id, "data": data}
+            )
+    return trace
+
+
+class Recorder:
+    """Times the messages sent until their frames reach the other players"""
+
+    def __init__(self) -> None:
+        """Sets attributes"""
+        self._counter = itertools.count()
+        # Time and action of every message sent, by sequence number
+        self.sent: dict[int, tuple[float, str]] = {}
+        self.latencies: dict[str, list[float]] = collections.defaultdict(list)
+        self.frames = 0
+        self.last_frame = 0.0
+
+    def stamp(self, message: dict[str, Any]) -> None:
+        """
+        Numbers a message about to be sent
+
+        :param message: Message to send
+        """
+        sequence = next(self._counter)
+        message["data"]["seq"] = sequence
+        self.sent[sequence] = (time.perf_counter(), message["action"])
+
+    def received(self, text: str) -> None:
+        """
+        Records a frame received by a player
+
+        :param text: Text of the frame
+        """
+        now = self.last_frame = time.perf_counter()
+        self.frames += 1
+        for match in SEQUENCE.finditer(text):
+            sent = self.sent.get(int(match.group(1)))
+            if sent is not None:
+                self.latencies[sent[1]].append(now - sent[0])
+
+    async def settle(self) -> None:
+        """Waits for the frames still on their way"""
+        while time.perf_counter() - self.last_frame < SETTLE_TIME:
+            await asyncio.sleep(SETTLE_TIME / 4)
+
+
+class Player(abc.ABC):
+    """A simulated player, waiting for the frames it is sent"""
+
+    def __init__(self, recorder: Recorder) -> None:
+        """
+        Sets attributes
+
+        :param recorder: Recorder of the run
+        """
+        self.recorder = recorder
+        self.id: int | None = None
+        self.received_actions: dict[str, asyncio.Event] = collections.defaultdict(
+            asyncio.Event
+        )
+
+    def received(self, text: str) -> None:
+        """
+        Records a frame
+
+        :param text: Text of the frame
+        """
+        self.recorder.received(text)
+        action = ACTION.search(text)
+        if action is not None:
+            self.received_actions[action.group(1)].set()
+
+    async def wait_for(self, action: str) -> None:
+        """
+        Waits for a frame
+
+        :param action: Action of the frame
+        """
+        await asyncio.wait_for(self.received_actions[action].wait(), WAIT_TIMEOUT)
+
+    @abc.abstractmethod
+    async def connect(self, room: GameManager) -> None:
+        """
+        Joins a room
+
+        :param room: Room to join
+        """
+
+    @abc.abstractmethod
+    async def send(self, message: dict[str, Any]) -> None:
+        """
+        Sends a message
+
+        :param message: Message to send
+        """
+
+    async def close(self) -> None:
+        """Leaves the room"""
+
+
+class InProcessPlayer(Player):
+    """A player handing messages to its room directly, as the app does"""
+
+    async def connect(self, room: GameManager) -> None:
+        """Joins a room"""
+        self.room = room
+        self.id, _ = await room.add_client(self)  # type: ignore
+
+    async def send(self, message: dict[str, Any]) -> None:
+        """Sends a message"""
+        await self.room.handle_message(self.id, Message(dumps(message)))  # type: ignore
+
+    async def send_text(self, text: str) -> None:
+        """Receives a frame, as the websocket of the player"""
+        self.received(text)
+
+    async def close(self) -> None:
+        """Leaves the room, or closes the websocket of the player"""
+        if self.id is not None and self.id in self.room.clients:
+            await self.room.remove_client(self.id)
+
+
+class SocketPlayer(Player):
+    """A player connected to the app through a websocket"""
+
+    def __init__(self, recorder: Recorder, url: str) -> None:
+        """
+        Sets attributes
+
+        :param recorder: Recorder of the run
+        :param url: URL of the app, like ws://127.0.0.1:8000
+        """
+        super().__init__(recorder)
+        self.url = url
+
+    async def connect(self, room: GameManager) -> None:
+        """Joins a room"""
+        import websockets
+
+        self.websocket = await websockets.connect(
+            f"{self.url}/update-code?room={room.room_id}"
+        )
+        # The app sends the ID of the player first
+        text = await self.websocket.recv()
+        self.id = loads(text)["user_id"]
+        self.received(text)  # type: ignore
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        """Receives frames until the websocket closes"""
+        import websockets
+
+        try:
+            async for text in self.websocket:
+                self.received(text)  # type: ignore
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send(self, message: dict[str, Any]) -> None:
+        """Sends a message"""
+        await self.websocket.send(dumps(message))
+
+    async def close(self) -> None:
+        """Closes the websocket"""
+        await self.websocket.close()
+        await self._reader
+
+
+async def replay(
+    player: Player, trace: list[dict[str, Any]], rate: float, rng: random.Random
+) -> None:
+    """
+    Sends the messages of a trace, at random intervals averaging a rate
+
+    :param player: Player sending the messages
+    :param trace: Messages to send
+    :param rate: Messages per second
+    :param rng: Random number generator
+    """
+    for message in trace:
+        await asyncio.sleep(rng.expovariate(rate))
+        player.recorder.stamp(message)
+        await player.send(message)
+
+
+async def play_room(
+    room: GameManager,
+    players: list[Player],
+    traces: list[list[dict[str, Any]]],
+    config: BenchmarkConfig,
+    rng: random.Random,
+) -> float:
+    """
+    Plays a room, the last player joining late and asking for the code
+
+    :param room: Room to play
+    :param players: Players, every one but the last already connected
+    :param traces: Messages of each player
+    :param config: Settings of the run
+    :param rng: Random number generator
+
+    :return: Seconds the late player waited for the code
+    """
+    replays = [
+        asyncio.create_task(replay(player, trace, config.rate, rng))
+        for player, trace in zip(players[:-1], traces)
+    ]
+    # The late player joins halfway through the game
+    await asyncio.sleep(config.messages / config.rate / 2)
+    late = players[-1]
+    await late.connect(room)
+    start = time.perf_counter()
+    await late.send({"action": "request_code", "problem_id": -1, "data": {}})
+    await late.wait_for("send_requested_code")
+    late_join = time.perf_counter() - start
+    await late.wait_for("role")
+    # The game is ended once every trace is replayed, not when its time is up
+    if room.timer is not None:
+        room.timer.cancel()
+    half = traces[-1][: config.messages // 2]
+    replays.append(asyncio.create_task(replay(late, half, config.rate, rng)))
+    await asyncio.gather(*replays)
+    return late_join
+
+
+async def end_room(room: GameManager, players: list[Player]) -> float:
+    """
+    Ends the game of a room, then submits the code and votes like players do
+
+    Players vote once they have seen the results of the code, as the room is
+    torn down when the last one votes.
+
+    :param room: Room to end
+    :param players: Players of the room
+
+    :return: Seconds from the end of the game to the result
+    """
+    start = time.perf_counter()
+    await room.game_end()
+    ids = [player.id for player in players]
+    for player in players:
+        await player.wait_for("game_end")
+        await player.send(
+            {"action": "submitCode", "problem_id": -1, "data": {"code": {}}}
+        )
+    for player in players:
+        await player.wait_for("code_results")
+    for player, voted in zip(players, ids[1:] + ids[:1]):
+        await player.send(
+            {"action": "vote", "problem_id": -1, "data": {"voted": voted}}
+        )
+    for player in players:
+        await player.wait_for("result")
+    return time.perf_counter() - start
+
+
+def create_database(path: str) -> None:
+    """
+    Fills a database with problems
+
+    :param path: Path of the database
+    """
+    manager = ProblemManager(path)
+    manager.import_problems(
+        Problem(
+            id=i,
+            prompt=f"Problem {i}",
+            solution=str(i),
+            difficulty=(i * 5) % 100,
+        )
+        for i in range(1, AMOUNT_OF_PROBLEMS * 2 + 1)
+    )
+    manager.close()
+
+
+async def run(
+    config: BenchmarkConfig,
+    room_manager: RoomManager,
+    make_player: Callable[[Recorder], Player],
+) -> dict[str, Any]:
+    """
+    Plays rooms of simulated players and measures them
+
+    Latency is measured from a player sending a message to each other player
+    receiving its frame, so cursor moves include the time they wait to be
+    coalesced. Memory is measured while the rooms are created and filled, and
+    includes the connections of the players in socket mode. CPU time includes
+    the simulated players.
+
+    :param config: Settings of the run
+    :param room_manager: RoomManager of the app
+    :param make_player: Returns a new player
+
+    :return: Metrics of the run
+    """
+    rng = random.Random(config.seed)
+    recorder = Recorder()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    rooms = [
+        await room_manager.create_room(people_per_game=config.people_per_game)
+        for _ in range(config.rooms)
+    ]
+    players = [
+        [make_player(recorder) for _ in range(config.people_per_game)] for _ in rooms
+    ]
+    for room, room_players in zip(rooms, players):
+        for player in room_players[:-1]:
+            await player.connect(room)
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    traces = [
+        [
+            make_trace(rng, config.messages, [problem.id for problem in room.problems])
+            for _ in room_players
+        ]
+        for room, room_players in zip(rooms, players)
+    ]
+    start, cpu = time.perf_counter(), time.process_time()
+    late_joins = await asyncio.gather(
+        *(
+            play_room(room, room_players, room_traces, config, rng)
+            for room, room_players, room_traces in zip(rooms, players, traces)
+        )
+    )
+    await recorder.settle()
+    seconds = time.perf_counter() - start - SETTLE_TIME
+    cpu = time.process_time() - cpu
+
+    game_ends = await asyncio.gather(
+        *(end_room(room, room_players) for room, room_players in zip(rooms, players))
+    )
+    for room_players in players:
+        for player in room_players:
+            await player.close()
+
+    messages = len(recorder.sent)
+    latencies = [value for values in recorder.latencies.values() for value in values]
+    return {
+        "messages": messages,
+        "frames": recorder.frames,
+        "seconds": round(seconds, 3),
+        "messages_per_second": round(messages / seconds, 1),
+        "frames_per_second": round(recorder.frames / seconds, 1),
+        "latency_ms": percentiles(latencies),
+        "latency_ms_by_action": {
+            action: percentiles(values)
+            for action, values in sorted(recorder.latencies.items())
+        },
+        "late_join_ms": percentiles(late_joins),
+        "game_end_ms": percentiles(game_ends),
+        "memory_per_room_kib": round(memory / config.rooms / 1024, 1),
+        "cpu_per_message_us": round(cpu / messages * 1e6, 1),
+    }
+
+
+async def run_in_process(config: BenchmarkConfig, database: str) -> dict[str, Any]:
+    """
+    Runs the benchmark against rooms in this process, without a network
+
+    :param config: Settings of the run
+    :param database: Path of the problem database
+
+    :return: Metrics of the run
+    """
+    executor = SandboxExecutor()
+    await executor.start()
+    room_manager = RoomManager(database=database, executor=executor)
+    try:
+        return await run(config, room_manager, InProcessPlayer)
+    finally:
+        room_manager.close()
+        executor.close()
+
+
+async def run_on_socket(config: BenchmarkConfig, database: str) -> dict[str, Any]:
+    """
+    Runs the benchmark against the app, served on a local port
+
+    :param config: Settings of the run
+    :param database: Path of the problem database
+
+    :return: Metrics of the run
+    """
+    import uvicorn
+
+    from .app import app
+
+    os.environ["SIRENITY_DATABASE"] = database
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        return await run(
+            config,
+            app.room_manager,  # type: ignore
+            lambda recorder: SocketPlayer(recorder, f"ws://127.0.0.1:{port}"),
+        )
+    finally:
+        server.should_exit = True
+        await serving
+
+
+async def benchmark(config: BenchmarkConfig) -> dict[str, Any]:
+    """
+    Runs the benchmark
+
+    :param config: Settings of the run
+
+    :return: Settings, environment and metrics of the run
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "problems.db")
+        create_database(database)
+        if config.mode == "socket":
+            results = await run_on_socket(config, database)
+        else:
+            results = await run_in_process(config, database)
+    return {
+        "config": asdict(config),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "encoding": BACKEND,
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+
+def flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    """
+    Returns the metrics of a run by dotted name
+
+    :param results: Metrics, possibly nested
+    :param prefix: Name of the dictionary the metrics are in
+
+    :return: Metrics
+    """
+    flat: dict[str, float] = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], tolerance: float
+) -> list[str]:
+    """
+    Compares a run to a baseline
+
+    :param baseline: Results of the baseline run
+    :param current: Results of the run
+    :param tolerance: Fraction a metric may get worse by before it is a regression
+
+    :return: Descriptions of the regressions
+    """
+    regressions = []
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    for name in sorted(old.keys() & new.keys()):
+        if name in ("messages", "frames", "seconds") or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        if name.split(".")[0] in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{name}: {old[name]} -> {new[name]} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    """Measures the throughput and latency of rooms under load"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    defaults = BenchmarkConfig()
+    parser.add_argument("--rooms", type=int, default=defaults.rooms)
+    parser.add_argument(
+        "--players", type=int, default=defaults.people_per_game, help="per room"
+    )
+    parser.add_argument(
+        "--messages", type=int, default=defaults.messages, help="per player"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=defaults.rate,
+        help="messages per second per player",
+    )
+    parser.add_argument(
+        "--mode", choices=("inprocess", "socket"), default=defaults.mode
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of a baseline run")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="fraction a metric may regress by"
+    )
+    arguments = parser.parse_args()
+
+    config = BenchmarkConfig(
+        rooms=arguments.rooms,
+        people_per_game=arguments.players,
+        messages=arguments.messages,
+        rate=arguments.rate,
+        mode=arguments.mode,
+        seed=arguments.seed,
+    )
+    report = asyncio.run(benchmark(config))
+    print(json.dumps(report["results"], indent=2))
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        if baseline["config"] != report["config"]:
+            print("The baseline was run with other settings")
+        regressions = compare(baseline, report, arguments.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from urllib.parse import urlparse
+
+from .base import Broker, Event, Handler
+from .journal import RESTORED, Journal
+from .local import BrokerServer, SocketBroker, run_server
+from .memory import InProcessBroker
+
+__all__ = [
+    "Broker",
+    "BrokerServer",
+    "Event",
+    "Handler",
+    "InProcessBroker",
+    "Journal",
+    "RESTORED",
+    "SocketBroker",
+    "create_broker",
+    "run_server",
+]
+
+
+def create_broker(url: str, journal_directory: str | None = None) -> Broker:
+    """
+    Creates a broker from a URL
+
+    :param url: memory:// for a single process, unix:///path/to/socket or
+        tcp://host:port for a BrokerServer
+    :param journal_directory: Directory to keep the journal of memory:// in, a
+        BrokerServer keeps its own
+
+    :return: Broker
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        if journal_directory:
+            return InProcessBroker(Journal(journal_directory))
+        return InProcessBroker()
+    if parsed.scheme == "unix":
+        return SocketBroker(path=parsed.path)
+    if parsed.scheme == "tcp":
+        return SocketBroker(host=parsed.hostname or "127.0.0.1", port=parsed.port or 0)
+    raise ValueError(f"Unknown broker URL {url}")
@@ -0,0 +1,93 @@
+import abc
+from typing import Any, Callable
+
+__all__ = ["Broker", "Event", "Handler"]
+
+Event = dict[str, Any]
+Handler = Callable[[Event], None]
+
+
+class Broker(abc.ABC):
+    """
+    Publishes room events to every worker process and holds shared counters
+
+    Events published on a channel are delivered, in the same order everywhere,
+    to the handler subscribed to that channel by each connected worker. Retained
+    events are also replayed to handlers subscribing later, so a worker can catch
+    up with a room it has not seen before.
+    """
+
+    async def connect(self) -> None:
+        """Connects to the broker"""
+
+    async def close(self) -> None:
+        """Disconnects from the broker"""
+
+    @abc.abstractmethod
+    async def publish(
+        self, channel: str, event: Event, *, retain: bool = False
+    ) -> None:
+        """
+        Publishes an event
+
+        :param channel: Channel to publish on
+        :param event: Event to publish
+        :param retain: Whether to replay the event to later subscribers
+        """
+
+    @abc.abstractmethod
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Subscribes to a channel, replaying the events retained on it first
+
+        Each worker has at most one handler per channel, subscribing again replaces it.
+
+        :param channel: Channel to subscribe to
+        :param handler: Called with every event published on the channel
+        """
+
+    @abc.abstractmethod
+    async def unsubscribe(self, channel: str) -> None:
+        """
+        Unsubscribes from a channel
+
+        :param channel: Channel to unsubscribe from
+        """
+
+    @abc.abstractmethod
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """
+        Atomically increments a counter, starting from 0
+
+        :param key: Key of the counter
+        :param amount: Amount to add
+
+        :return: Value after incrementing
+        """
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Any:
+        """
+        Gets a value
+
+        :param key: Key of the value
+
+        :return: The value, or None if it is not set
+        """
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        """
+        Sets a value
+
+        :param key: Key of the value
+        :param value: Value to set, which has to be JSON serializable
+        """
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Deletes a value or counter, and the events retained on a channel of the same name
+
+        :param key: Key or channel to delete
+        """
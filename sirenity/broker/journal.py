@@ -0,0 +1,278 @@
+import asyncio
+import io
+import logging
+import os
+import re
+import time
+from typing import Any, Iterator
+
+from ..encoding import dumps, loads
+from .base import Event
+
+__all__ = ["RESTORED", "Journal"]
+
+# Seconds between syncing the log to disk, a crash of the machine loses at most
+# the records written since
+FLUSH_INTERVAL = 0.05
+# Seconds between snapshots, and number of records in the log making one sooner
+SNAPSHOT_INTERVAL = 60
+SNAPSHOT_RECORDS = 10000
+# Type of the event retained after the events of every channel restored from disk
+RESTORED = "restored"
+SNAPSHOT = "snapshot.json"
+LOG = re.compile(r"journal\.(\d+)\.log")
+
+logger = logging.getLogger(__name__)
+
+Values = dict[str, Any]
+Retained = dict[str, list[Event]]
+
+
+def _read_snapshot(directory: str) -> tuple[int, Values, Retained]:
+    """Reads the latest snapshot, returning the sequence number of its last record"""
+    try:
+        with open(os.path.join(directory, SNAPSHOT), "rb") as file:
+            snapshot = loads(file.read())
+    except FileNotFoundError:
+        return 0, {}, {}
+    return snapshot["seq"], snapshot["values"], snapshot["retained"]
+
+
+def _read_log(path: str) -> Iterator[dict[str, Any]]:
+    """Reads the records of a log, up to a record torn by a crash"""
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                yield loads(line)
+            except ValueError:
+                return
+
+
+def _apply(values: Values, retained: Retained, record: dict[str, Any]) -> None:
+    """Applies a record of the log"""
+    if record["op"] == "pub":
+        retained.setdefault(record["channel"], []).append(record["event"])
+    elif record["op"] == "set":
+        values[record["key"]] = record["value"]
+    elif record["op"] == "delete":
+        values.pop(record["key"], None)
+        retained.pop(record["key"], None)
+
+
+def _sync_directory(path: str) -> None:
+    """Syncs the entries of a directory, so created and renamed files survive a crash"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """
+    Append-only log of the values and retained events of a broker, with snapshots
+
+    Every change is written to the log as it is made, and the log is synced to
+    disk in batches, every flush_interval seconds. Every snapshot_interval
+    seconds, or sooner once the log holds snapshot_records records, a new log is
+    started and the older ones are folded into the snapshot in a thread. Channels
+    deleted by then, like those of rooms whose game ended, are left out of it.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval: float = FLUSH_INTERVAL,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+        snapshot_records: int = SNAPSHOT_RECORDS,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param directory: Directory of the snapshot and logs, created if missing
+        :param flush_interval: Seconds between syncing the log to disk
+        :param snapshot_interval: Seconds between snapshots
+        :param snapshot_records: Number of records in the log making a snapshot sooner
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_records = snapshot_records
+        # Sequence number of the last record, and number of records since the snapshot
+        self.seq = 0
+        self.records = 0
+        self.generation = 0
+        self._file: io.FileIO | None = None
+        self._dirty = False
+        # Held while the log is synced or replaced
+        self._lock = asyncio.Lock()
+        self._last_snapshot = 0.0
+        self._task: asyncio.Task | None = None
+        self._snapshot_task: asyncio.Task | None = None
+
+    def load(self) -> tuple[Values, Retained]:
+        """
+        Reads the latest snapshot and the logs written since, and starts a new log
+
+        An event of type RESTORED is retained after the events of every channel,
+        so subscribers know the events before it were written by an earlier process.
+
+        :return: Values by key, and retained events by channel
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        seq, values, retained = _read_snapshot(self.directory)
+        generations = self._generations()
+        for generation in generations:
+            for record in _read_log(self._log_path(generation)):
+                if record["seq"] > seq:
+                    _apply(values, retained, record)
+                    seq = record["seq"]
+                    self.records += 1
+        self.seq = seq
+        self.generation = max(generations, default=0) + 1
+        self._open()
+        for channel, events in retained.items():
+            event = {"type": RESTORED}
+            events.append(event)
+            self.publish(channel, event)
+        return values, retained
+
+    def start(self) -> None:
+        """Starts syncing the log and making snapshots in the background"""
+        self._last_snapshot = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Syncs the log and closes it, waiting for a snapshot being made"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        async with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def publish(self, channel: str, event: Event) -> None:
+        """
+        Records an event retained on a channel
+
+        :param channel: Channel the event is published on
+        :param event: Event
+        """
+        self._append({"op": "pub", "channel": channel, "event": event})
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Records a value being set
+
+        :param key: Key of the value
+        :param value: Value
+        """
+        self._append({"op": "set", "key": key, "value": value})
+
+    def delete(self, key: str) -> None:
+        """
+        Records a value and the events retained on a channel of the same name being deleted
+
+        :param key: Key or channel
+        """
+        self._append({"op": "delete", "key": key})
+
+    def _append(self, record: dict[str, Any]) -> None:
+        """Writes a record to the log, it is synced to disk on the next flush"""
+        if self._file is None:
+            raise RuntimeError("Journal is not loaded")
+        self.seq += 1
+        record["seq"] = self.seq
+        self._file.write(dumps(record).encode() + b"\n")
+        self._dirty = True
+        self.records += 1
+
+    async def flush(self) -> None:
+        """Syncs the records written since the last flush to disk"""
+        async with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            self._dirty = False
+            await asyncio.to_thread(os.fsync, self._file.fileno())
+
+    async def snapshot(self) -> None:
+        """Starts a new log, and folds the older ones into the snapshot in a thread"""
+        async with self._lock:
+            old = self._file
+            if old is None:
+                return
+            await asyncio.to_thread(os.fsync, old.fileno())
+            old.close()
+            self._dirty = False
+            generation = self.generation
+            self.generation += 1
+            self._open()
+            self.records = 0
+            self._last_snapshot = time.monotonic()
+        await asyncio.to_thread(self._compact, generation)
+
+    async def _run(self) -> None:
+        """Syncs the log regularly, making a snapshot when one is due"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            due = self.records >= self.snapshot_records or (
+                self.records
+                and time.monotonic() - self._last_snapshot >= self.snapshot_interval
+            )
+            if due and (self._snapshot_task is None or self._snapshot_task.done()):
+                self._snapshot_task = asyncio.create_task(self._snapshot_safely())
+
+    async def _snapshot_safely(self) -> None:
+        """Makes a snapshot, logging errors since the logs are kept until one works"""
+        try:
+            await self.snapshot()
+        except Exception:
+            logger.exception("Error making a snapshot of %s", self.directory)
+
+    def _compact(self, generation: int) -> None:
+        """Folds the logs up to a generation into the snapshot, and removes them"""
+        seq, values, retained = _read_snapshot(self.directory)
+        generations = [number for number in self._generations() if number <= generation]
+        for number in generations:
+            for record in _read_log(self._log_path(number)):
+                if record["seq"] > seq:
+                    _apply(values, retained, record)
+                    seq = record["seq"]
+        path = os.path.join(self.directory, SNAPSHOT)
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(
+                dumps({"seq": seq, "values": values, "retained": retained}).encode()
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+        _sync_directory(self.directory)
+        for number in generations:
+            os.remove(self._log_path(number))
+
+    def _open(self) -> None:
+        """Creates the log of the current generation"""
+        self._file = open(self._log_path(self.generation), "ab", buffering=0)
+        _sync_directory(self.directory)
+
+    def _generations(self) -> list[int]:
+        """Returns the generations of the logs on disk, in order"""
+        return sorted(
+            int(match.group(1))
+            for match in map(LOG.fullmatch, os.listdir(self.directory))
+            if match is not None
+        )
+
+    def _log_path(self, generation: int) -> str:
+        """Returns the path of the log of a generation"""
+        return os.path.join(self.directory, f"journal.{generation}.log")
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any
+
+from ..encoding import dumps, loads
+from .base import Broker, Event, Handler
+from .journal import Journal
+
+__all__ = ["BrokerServer", "SocketBroker", "run_server"]
+
+# Largest line accepted on a broker connection, a message holds a whole frame
+LINE_LIMIT = 2**24
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerServer:
+    """
+    Hub the SocketBrokers of every worker process connect to
+
+    Messages are newline separated JSON. Every connection is served in order on
+    one event loop, which gives each channel a single order of events. With a
+    journal, values and retained events survive a restart of the server.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        journal: Journal | None = None,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param path: Path of the unix socket to listen on
+        :param host: Host to listen on, when no path is given
+        :param port: Port to listen on, when no path is given
+        :param journal: Journal keeping the values and retained events on disk
+        """
+        self.path = path
+        self.host = host
+        self.port = port
+        self.subscribers: defaultdict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+        self.retained: defaultdict[str, list[bytes]] = defaultdict(list)
+        self.values: dict[str, Any] = {}
+        self.journal = journal
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        """Restores what the journal kept and starts listening"""
+        if self.journal is not None:
+            values, retained = self.journal.load()
+            self.values.update(values)
+            for channel, events in retained.items():
+                self.retained[channel] = [
+                    self._encode({"channel": channel, "event": event})
+                    for event in events
+                ]
+            self.journal.start()
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._serve, self.path, limit=LINE_LIMIT
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._serve, self.host, self.port, limit=LINE_LIMIT
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """Starts listening and serves until cancelled"""
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()  # type: ignore
+
+    async def close(self) -> None:
+        """Stops listening and disconnects every worker"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writers in self.subscribers.values():
+            for writer in writers:
+                writer.close()
+        if self.journal is not None:
+            await self.journal.close()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serves one worker"""
+        try:
+            while line := await reader.readline():
+                self._handle(loads(line), writer)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for writers in self.subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    def _handle(self, message: dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        """Handles a message from a worker"""
+        op = message["op"]
+        if op == "pub":
+            channel = message["channel"]
+            line = self._encode({"channel": channel, "event": message["event"]})
+            if message.get("retain"):
+                self.retained[channel].append(line)
+                if self.journal is not None:
+                    self.journal.publish(channel, message["event"])
+            for subscriber in self.subscribers.get(channel, ()):
+                subscriber.write(line)
+            return
+
+        if op == "sub":
+            for line in self.retained.get(message["channel"], ()):
+                writer.write(line)
+            self.subscribers[message["channel"]].add(writer)
+            value = None
+        elif op == "unsub":
+            self.subscribers[message["channel"]].discard(writer)
+            return
+        elif op == "incr":
+            value = self.values.get(message["key"], 0) + message["amount"]
+            self.values[message["key"]] = value
+            if self.journal is not None:
+                self.journal.set(message["key"], value)
+        elif op == "get":
+            value = self.values.get(message["key"])
+        elif op == "set":
+            self.values[message["key"]] = message["value"]
+            if self.journal is not None:
+                self.journal.set(message["key"], message["value"])
+            value = None
+        elif op == "delete":
+            self.values.pop(message["key"], None)
+            self.retained.pop(message["key"], None)
+            if self.journal is not None:
+                self.journal.delete(message["key"])
+            value = None
+        else:
+            raise ValueError(f"Unknown broker operation {op}")
+        writer.write(self._encode({"id": message["id"], "value": value}))
+
+    @staticmethod
+    def _encode(message: dict[str, Any]) -> bytes:
+        """Encodes a message as a line"""
+        return dumps(message).encode() + b"\n"
+
+
+class SocketBroker(Broker):
+    """Broker shared by worker processes through a BrokerServer on this machine"""
+
+    def __init__(
+        self,
+        path: str | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        connect_timeout: float = 10,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param path: Path of the unix socket of the BrokerServer
+        :param host: Host of the BrokerServer, when no path is given
+        :param port: Port of the BrokerServer, when no path is given
+        :param connect_timeout: Seconds to wait for the BrokerServer to start
+        """
+        self.path = path
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.handlers: dict[str, Handler] = {}
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+
+    async def connect(self) -> None:
+        """Connects to the BrokerServer, waiting for it to start"""
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                if self.path is not None:
+                    self._reader, self._writer = await asyncio.open_unix_connection(
+                        self.path, limit=LINE_LIMIT
+                    )
+                else:
+                    self._reader, self._writer = await asyncio.open_connection(
+                        self.host, self.port, limit=LINE_LIMIT
+                    )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.05)
+        self._read_task = asyncio.create_task(self._read())
+
+    async def close(self) -> None:
+        """Disconnects from the BrokerServer"""
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def publish(
+        self, channel: str, event: Event, *, retain: bool = False
+    ) -> None:
+        """
+        Publishes an event
+
+        :param channel: Channel to publish on
+        :param event: Event to publish
+        :param retain: Whether to replay the event to later subscribers
+        """
+        self._write({"op": "pub", "channel": channel, "event": event, "retain": retain})
+        await self._writer.drain()  # type: ignore
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Subscribes to a channel, returning once retained events have been handled
+
+        :param channel: Channel to subscribe to
+        :param handler: Called with every event published on the channel
+        """
+        self.handlers[channel] = handler
+        await self._request({"op": "sub", "channel": channel})
+
+    async def unsubscribe(self, channel: str) -> None:
+        """
+        Unsubscribes from a channel
+
+        :param channel: Channel to unsubscribe from
+        """
+        self.handlers.pop(channel, None)
+        self._write({"op": "unsub", "channel": channel})
+        await self._writer.drain()  # type: ignore
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """
+        Atomically increments a counter, starting from 0
+
+        :param key: Key of the counter
+        :param amount: Amount to add
+
+        :return: Value after incrementing
+        """
+        return await self._request({"op": "incr", "key": key, "amount": amount})
+
+    async def get(self, key: str) -> Any:
+        """
+        Gets a value
+
+        :param key: Key of the value
+
+        :return: The value, or None if it is not set
+        """
+        return await self._request({"op": "get", "key": key})
+
+    async def set(self, key: str, value: Any) -> None:
+        """
+        Sets a value
+
+        :param key: Key of the value
+        :param value: Value to set, which has to be JSON serializable
+        """
+        await self._request({"op": "set", "key": key, "value": value})
+
+    async def delete(self, key: str) -> None:
+        """
+        Deletes a value or counter, and the events retained on a channel of the same name
+
+        :param key: Key or channel to delete
+        """
+        await self._request({"op": "delete", "key": key})
+
+    def _write(self, message: dict[str, Any]) -> None:
+        """Writes a message to the BrokerServer"""
+        if self._writer is None:
+            raise ConnectionError("Broker is not connected")
+        self._writer.write(dumps(message).encode() + b"\n")
+
+    async def _request(self, message: dict[str, Any]) -> Any:
+        """Sends a message and waits for the reply"""
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self._write({**message, "id": self._next_id})
+        return await future
+
+    async def _read(self) -> None:
+        """Handles events and replies from the BrokerServer, in order"""
+        try:
+            while line := await self._reader.readline():  # type: ignore
+                message = loads(line)
+                if "channel" in message:
+                    handler = self.handlers.get(message["channel"])
+                    if handler is None:
+                        continue
+                    try:
+                        handler(message["event"])
+                    except Exception:
+                        logger.exception("Error handling %s", message["channel"])
+                else:
+                    future = self._pending.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(message["value"])
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Broker disconnected"))
+            self._pending.clear()
+
+
+def run_server(path: str, journal_directory: str | None = None) -> None:
+    """
+    Runs a BrokerServer on a unix socket until the process is stopped
+
+    :param path: Path of the unix socket to listen on
+    :param journal_directory: Directory to keep the journal in, if any
+    """
+    journal = Journal(journal_directory) if journal_directory else None
+    server = BrokerServer(path, journal=journal)
+
+    async def serve() -> None:
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from typing import Any
+
+from .base import Broker, Event, Handler
+from .journal import Journal
+
+__all__ = ["InProcessBroker"]
+
+
+class InProcessBroker(Broker):
+    """
+    Broker for a single worker process, delivering events synchronously
+
+    With a journal, values and retained events are written to disk and restored
+    when the broker connects again, after the process restarts.
+    """
+
+    def __init__(self, journal: Journal | None = None) -> None:
+        """
+        Sets attributes
+
+        :param journal: Journal keeping the values and retained events on disk
+        """
+        self.handlers: dict[str, Handler] = {}
+        self.retained: defaultdict[str, list[Event]] = defaultdict(list)
+        self.values: dict[str, Any] = {}
+        self.journal = journal
+
+    async def connect(self) -> None:
+        """Restores what the journal kept"""
+        if self.journal is not None:
+            values, retained = self.journal.load()
+            self.values.update(values)
+            self.retained.update(retained)
+            self.journal.start()
+
+    async def close(self) -> None:
+        """Syncs the journal to disk"""
+        if self.journal is not None:
+            await self.journal.close()
+
+    async def publish(
+        self, channel: str, event: Event, *, retain: bool = False
+    ) -> None:
+        """
+        Publishes an event
+
+        :param channel: Channel to publish on
+        :param event: Event to publish
+        :param retain: Whether to replay the event to later subscribers
+        """
+        if retain:
+            self.retained[channel].append(event)
+            if self.journal is not None:
+                self.journal.publish(channel, event)
+        handler = self.handlers.get(channel)
+        if handler is not None:
+            handler(event)
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """
+        Subscribes to a channel, replaying the events retained on it first
+
+        :param channel: Channel to subscribe to
+        :param handler: Called with every event published on the channel
+        """
+        for event in self.retained.get(channel, ()):
+            handler(event)
+        self.handlers[channel] = handler
+
+    async def unsubscribe(self, channel: str) -> None:
+        """
+        Unsubscribes from a channel
+
+        :param channel: Channel to unsubscribe from
+        """
+        self.handlers.pop(channel, None)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """
+        Increments a counter, starting from 0
+
+        :param key: Key of the counter
+        :param amount: Amount to add
+
+        :return: Value after incrementing
+        """
+        self.values[key] = self.values.get(key, 0) + amount
+        if self.journal is not None:
+            self.journal.set(key, self.values[key])
+        return self.values[key]
+
+    async def get(self, key: str) -> Any:
+        """
+        Gets a value
+
+        :param key: Key of the value
+
+        :return: The value, or None if it is not set
+        """
+        return self.values.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        """
+        Sets a value
+
+        :param key: Key of the value
+        :param value: Value to set
+        """
+        self.values[key] = value
+        if self.journal is not None:
+            self.journal.set(key, value)
+
+    async def delete(self, key: str) -> None:
+        """
+        Deletes a value or counter, and the events retained on a channel of the same name
+
+        :param key: Key or channel to delete
+        """
+        self.values.pop(key, None)
+        self.retained.pop(key, None)
+        if self.journal is not None:
+            self.journal.delete(key)
@@ -1,12 +1,145 @@
-from dataclasses import dataclass
+import asyncio
+import enum
+import time
+from collections import deque
+from dataclasses import dataclass, field
 
 from fastapi import WebSocket
 
+from . import metrics
+from .message import Frame
 
-@dataclass(slots=True)
+QUEUE_SIZE = 256
+# Seconds between pings, and seconds without hearing from a client, or with a
+# frame stuck sending to it, before it is dropped
+PING_INTERVAL = 15
+PING_TIMEOUT = 45
+# Clients answer it with a pong, any other message shows they are alive as well
+PING = Frame.from_dictionary({"action": "ping"})
+
+
+class OverflowPolicy(enum.Enum):
+    """What to do when a client's outbound queue is full"""
+
+    DROP_CURSOR = "drop_cursor"  # Drop queued cursorMove frames, then disconnect
+    DISCONNECT = "disconnect"  # Disconnect the client straight away
+
+
+@dataclass(slots=True, eq=False)
 class Client:
     """Holds client data"""
 
     id: int
     token: str
     websocket: WebSocket
+    queue_size: int = QUEUE_SIZE
+    overflow_policy: OverflowPolicy = OverflowPolicy.DROP_CURSOR
+    # ID of this connection of the player, which changes when they reconnect
+    session: str = ""
+    # Whether the client asked for MessagePack instead of JSON
+    binary: bool = False
+    closed: bool = False
+    outbox: deque[Frame] = field(default_factory=deque)
+    # Monotonic time of the last message received from the client
+    last_received: float = field(default_factory=time.monotonic)
+    _ready: asyncio.Event = field(default_factory=asyncio.Event)
+    _writer: asyncio.Task | None = None
+    # Monotonic time the frame being written started sending at
+    _sending_since: float | None = None
+
+    def start(self) -> None:
+        """Starts the task writing queued frames to the websocket"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+
+    def send(self, frame: Frame) -> bool:
+        """
+        Queues a frame without waiting for it to be sent
+
+        :param frame: Encoded frame to send
+
+        :returns: Whether the frame was queued
+        """
+        if self.closed:
+            return False
+        if len(self.outbox) >= self.queue_size:
+            if self.overflow_policy is OverflowPolicy.DROP_CURSOR:
+                self._drop_cursor_moves()
+                if frame.action == "cursorMove" and len(self.outbox) >= self.queue_size:
+                    return False
+            if len(self.outbox) >= self.queue_size:
+                if metrics.ENABLED:
+                    metrics.OVERFLOWS.inc()
+                self.close()
+                return False
+        self.outbox.append(frame)
+        self._ready.set()
+        return True
+
+    def close(self, *, drain: bool = False) -> None:
+        """
+        Stops sending to the client and closes its websocket
+
+        :param drain: Whether to send the frames already queued before closing
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if drain and self._writer is not None:
+            self._ready.set()
+            return
+        self.outbox.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+        asyncio.ensure_future(self._close_websocket())
+
+    def is_dead(self, now: float, timeout: float) -> bool:
+        """
+        Whether the client stopped answering, or stopped reading what it is sent
+
+        :param now: Monotonic time
+        :param timeout: Seconds without a message from the client, or with a frame
+            stuck sending to it, before it is dead
+
+        :returns: Whether the client is dead
+        """
+        if self.closed or now - self.last_received > timeout:
+            return True
+        return self._sending_since is not None and now - self._sending_since > timeout
+
+    def _drop_cursor_moves(self) -> None:
+        """Removes queued cursorMove frames, which later frames make stale"""
+        kept = [frame for frame in self.outbox if frame.action != "cursorMove"]
+        if len(kept) != len(self.outbox):
+            self.outbox.clear()
+            self.outbox.extend(kept)
+
+    async def _write(self) -> None:
+        """Sends queued frames in order"""
+        try:
+            while True:
+                while not self.outbox:
+                    if self.closed:
+                        await self._close_websocket()
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                frame = self.outbox.popleft()
+                self._sending_since = time.monotonic()
+                if self.binary:
+                    await self.websocket.send_bytes(frame.binary)
+                else:
+                    await self.websocket.send_text(frame.text)
+                self._sending_since = None
+        # Client left or reloaded, which the websocket implementations report with
+        # errors of their own, like ConnectionClosed
+        except Exception:
+            self.closed = True
+            self.outbox.clear()
+
+    async def _close_websocket(self) -> None:
+        """Closes the websocket, ignoring clients that already left"""
+        try:
+            await self.websocket.close()
+        except Exception:  # Client left or reloaded
+            pass
@@ -1,3 +1,4 @@
+from .executor import SandboxError, SandboxExecutor, SandboxTimeoutError
 from .handler import CodeHandler
 
-__all__ = ["CodeHandler"]
+__all__ = ["CodeHandler", "SandboxError", "SandboxExecutor", "SandboxTimeoutError"]
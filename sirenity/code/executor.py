@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import marshal
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from typing import Any
+
+from .. import metrics
+from .handler import CodeHandler, safe_builtins
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+__all__ = ["SandboxError", "SandboxTimeoutError", "SandboxExecutor"]
+
+# Seconds a submission may run for
+TIMEOUT = 2.0
+# Seconds of CPU time a submission may use
+CPU_LIMIT = 2
+# Bytes of memory a worker process may use
+MEMORY_LIMIT = 256 * 1024 * 1024
+# Times a submission is sent to the pool, when the pool breaks under it
+ATTEMPTS = 2
+
+
+class SandboxError(Exception):
+    """Thrown when a submission cannot be run"""
+
+    pass
+
+
+class SandboxTimeoutError(SandboxError):
+    """Thrown when a submission runs for too long"""
+
+    pass
+
+
+def _raise_timeout(signum: int, frame: Any) -> None:
+    """Signal handler stopping a submission that ran for too long"""
+    raise SandboxTimeoutError("Submission ran for too long")
+
+
+def _initialize_worker(memory_limit: int) -> None:
+    """Limits the memory of a worker process"""
+    if resource is None:
+        return
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.signal(signal.SIGXCPU, _raise_timeout)
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _execute(code: bytes, timeout: float, cpu_limit: int) -> str:
+    """
+    Runs a submission in a worker process
+
+    Workers run one submission at a time, so stdout can be redirected.
+
+    :param code: Compiled submission, serialized with marshal
+
+    :return: What the submission printed
+    """
+    if resource is not None:
+        # RLIMIT_CPU counts the CPU time of the whole process, so move it past
+        # the time used by earlier submissions
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_limit, hard))
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    compiled = marshal.loads(code)
+    output = StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            exec(compiled, {"__builtins__": safe_builtins()})
+    finally:
+        if resource is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return output.getvalue()
+
+
+class SandboxExecutor:
+    """
+    Runs submissions in a pool of warm worker processes
+
+    A worker stuck running a submission cannot be stopped on its own, the whole
+    pool is replaced. Submissions of other rooms running in the pool then are
+    sent to the new pool again, instead of failing with the stuck one.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        timeout: float = TIMEOUT,
+        cpu_limit: int = CPU_LIMIT,
+        memory_limit: int = MEMORY_LIMIT,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param workers: Number of worker processes, defaults to the number of CPUs
+        :param timeout: Seconds a submission may run for
+        :param cpu_limit: Seconds of CPU time a submission may use
+        :param memory_limit: Bytes of memory a worker process may use, 0 for no limit
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self._pool: ProcessPoolExecutor | None = None
+        # Bumped each time the pool is replaced
+        self._generation = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Returns the pool, creating it if needed"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # Forking would copy the server's event loop and threads
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_worker,
+                initargs=(self.memory_limit,),
+            )
+        return self._pool
+
+    async def start(self) -> None:
+        """Starts the worker processes, so the first submissions do not wait for them"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, os.getpid) for _ in range(self.workers))
+        )
+
+    async def run(self, code: str) -> str:
+        """
+        Checks and runs a submission
+
+        :param code: Code of the submission
+
+        :return: What the submission printed
+        """
+        if not metrics.ENABLED:
+            return await self._run(code)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            output = await self._run(code)
+            outcome = "ok"
+            return output
+        except SandboxTimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            metrics.SANDBOX_SECONDS.observe(time.perf_counter() - start, outcome)
+
+    async def _run(self, code: str) -> str:
+        """Checks and runs a submission"""
+        try:
+            # Code objects cannot be pickled, marshal sends them to the worker
+            compiled = marshal.dumps(CodeHandler(code).compile())
+        except SyntaxError as error:
+            raise SandboxError(f"invalid syntax: {error}") from None
+        except ValueError as error:
+            raise SandboxError(str(error)) from None
+
+        loop = asyncio.get_running_loop()
+        attempt = 1
+        while True:
+            generation = self._generation
+            future = loop.run_in_executor(
+                self._get_pool(), _execute, compiled, self.timeout, self.cpu_limit
+            )
+            try:
+                # The worker stops itself after timeout, this only catches a stuck worker
+                return await asyncio.wait_for(future, self.timeout + 1)
+            except asyncio.TimeoutError:
+                self._restart(generation)
+                raise SandboxTimeoutError("Submission ran for too long") from None
+            except BrokenProcessPool:
+                # Replaced for another submission, or a worker was killed, most
+                # likely for going over a limit, by this submission or another one
+                self._restart(generation)
+                if attempt == ATTEMPTS:
+                    raise SandboxError("Submission was stopped") from None
+                attempt += 1
+            except MemoryError:
+                raise SandboxError("Submission used too much memory") from None
+            except SandboxError:
+                raise
+            except Exception as error:
+                raise SandboxError(f"{type(error).__name__}: {error}") from None
+
+    async def run_all(self, codes: dict[int, str]) -> dict[int, str | SandboxError]:
+        """
+        Runs submissions in parallel
+
+        :param codes: Code of the submissions, by problem ID
+
+        :return: What each submission printed, or why it could not be run
+        """
+        results = await asyncio.gather(
+            *(self.run(code) for code in codes.values()), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(
+                result, SandboxError
+            ):
+                raise result
+        return dict(zip(codes.keys(), results))  # type: ignore
+
+    def _restart(self, generation: int) -> None:
+        """
+        Replaces the pool, killing its worker processes
+
+        Submissions still in the pool fail with BrokenProcessPool and are sent again.
+
+        :param generation: Generation of the pool to replace, a newer pool is kept
+        """
+        if self._pool is None or generation != self._generation:
+            return
+        self._generation += 1
+        # ProcessPoolExecutor cannot kill workers stuck running a submission
+        for process in list(self._pool._processes.values()):  # type: ignore
+            process.kill()
+        self._pool.shutdown(wait=False)
+        self._pool = None
+
+    def close(self) -> None:
+        """Stops the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
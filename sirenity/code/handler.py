@@ -1,9 +1,163 @@
 import ast
+import builtins
 import contextlib
+import hashlib
 import os
+from collections import OrderedDict
 from io import StringIO
+from types import CodeType
+from typing import Any
 
-ALLOWED_MODULES = ["math"]
+__all__ = [
+    "ALLOWED_MODULES",
+    "ALLOWED_NODES",
+    "FORBIDDEN_ATTRIBUTES",
+    "FORBIDDEN_NAMES",
+    "CodeHandler",
+    "compile_code",
+    "safe_builtins",
+    "validate_tree",
+]
+
+ALLOWED_MODULES = frozenset(("math",))
+# Builtins reaching code, files, the interpreter or the user, which submissions cannot use
+FORBIDDEN_NAMES = frozenset(
+    (
+        "breakpoint",
+        "compile",
+        "delattr",
+        "dir",
+        "eval",
+        "exec",
+        "exit",
+        "getattr",
+        "globals",
+        "help",
+        "input",
+        "locals",
+        "memoryview",
+        "open",
+        "quit",
+        "setattr",
+        "vars",
+    )
+)
+# Attributes of generators, coroutines, frames and tracebacks leading to the frames
+# of the server, and from them to its globals
+FORBIDDEN_ATTRIBUTES = frozenset(
+    (
+        "ag_await",
+        "ag_code",
+        "ag_frame",
+        "cr_await",
+        "cr_code",
+        "cr_frame",
+        "f_back",
+        "f_builtins",
+        "f_code",
+        "f_globals",
+        "f_locals",
+        "gi_code",
+        "gi_frame",
+        "gi_yieldfrom",
+        "tb_frame",
+        "tb_next",
+    )
+)
+# Number of compiled submissions kept, the same code is often submitted many times
+CACHE_SIZE = 256
+
+
+def _load_allowed_nodes() -> frozenset[str]:
+    """Get all nodes types allowed from allowed_nodes.txt"""
+    filename = "allowed_nodes.txt"
+    file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
+    with open(file_path, "r") as file:
+        return frozenset(file.read().split())
+
+
+ALLOWED_NODES = _load_allowed_nodes()
+
+# Compiled submissions by hash of their source, least recently used first
+_compiled: OrderedDict[bytes, CodeType] = OrderedDict()
+
+
+def _import(
+    name: str,
+    globals: dict | None = None,
+    locals: dict | None = None,
+    fromlist: tuple = (),
+    level: int = 0,
+) -> Any:
+    """Imports a module submissions are allowed to use"""
+    if level != 0 or name not in ALLOWED_MODULES:
+        raise ImportError(f"unsafe module, contains {name}")
+    return __import__(name, globals, locals, fromlist, level)
+
+
+def safe_builtins() -> dict[str, Any]:
+    """
+    Returns the builtins submissions run with
+
+    Forbidden names and private builtins are left out, and only allowed
+    modules can be imported.
+
+    :return: Builtins, by name
+    """
+    safe = {
+        name: value
+        for name, value in vars(builtins).items()
+        if name not in FORBIDDEN_NAMES and not name.startswith("_")
+    }
+    safe["__import__"] = _import
+    return safe
+
+
+def validate_tree(tree: ast.Module) -> None:
+    """
+    Raises ValueError if a syntax tree uses anything that is not allowed
+
+    :param tree: Parsed code
+    """
+    for statement in tree.body:
+        for node in ast.walk(statement):
+            node_name = type(node).__name__
+            if isinstance(node, ast.Import):
+                for module in node.names:
+                    if module.name not in ALLOWED_MODULES:
+                        raise ValueError(f"unsafe module, contains {module.name}")
+            elif node_name not in ALLOWED_NODES:
+                raise ValueError(f"unsafe expression, contains {node_name}")
+            elif isinstance(node, ast.Attribute) and (
+                node.attr.startswith("_") or node.attr in FORBIDDEN_ATTRIBUTES
+            ):
+                raise ValueError(f"unsafe attribute, contains {node.attr}")
+            elif isinstance(node, ast.Name) and (
+                node.id.startswith("__") or node.id in FORBIDDEN_NAMES
+            ):
+                raise ValueError(f"unsafe name, contains {node.id}")
+
+
+def compile_code(code: str) -> CodeType:
+    """
+    Checks and compiles code, reusing the result for code seen before
+
+    :param code: Code to compile
+
+    :return: Compiled code
+    """
+    key = hashlib.sha256(code.encode()).digest()
+    compiled = _compiled.get(key)
+    if compiled is not None:
+        _compiled.move_to_end(key)
+        return compiled
+    tree = ast.parse(code)
+    validate_tree(tree)
+    compiled = compile(tree, "<submission>", "exec")
+    _compiled[key] = compiled
+    if len(_compiled) > CACHE_SIZE:
+        _compiled.popitem(last=False)
+    return compiled
 
 
 class CodeHandler:
@@ -14,27 +168,22 @@ class CodeHandler:
 
     def safe_run(self):
         """Safetly runs python code"""
-        tree = ast.parse(self.code)
-        safe_nodes = self.get_safe_nodes()
-        for node in tree.body:
-            node_name = type(node).__name__
-            if node_name == "Import":
-                for module in node.names:
-                    if module.name not in ALLOWED_MODULES:
-                        raise ValueError(f"unsafe module, contains {module.name}")
-            elif node_name not in safe_nodes:
-                raise ValueError(f"unsafe expression, contains {node_name}")
+        compiled = self.compile()
 
         fout = StringIO()
         with contextlib.redirect_stdout(fout):
-            exec(self.code)
+            exec(compiled, {"__builtins__": safe_builtins()})
 
         return fout.getvalue()
 
-    def get_safe_nodes(self) -> list:
+    def validate(self) -> None:
+        """Raises ValueError if the code uses anything that is not allowed"""
+        self.compile()
+
+    def compile(self) -> CodeType:
+        """Checks and compiles the code, raising ValueError if it is not allowed"""
+        return compile_code(self.code)
+
+    def get_safe_nodes(self) -> frozenset[str]:
         """Get all nodes types allowed from allowed_nodes.txt"""
-        filename = "allowed_nodes.txt"
-        file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
-        with open(file_path, "r") as file:
-            allowed_nodes = file.readlines()
-        return allowed_nodes
+        return ALLOWED_NODES
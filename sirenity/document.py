@@ -0,0 +1,88 @@
+from typing import Any
+
+__all__ = ["Document"]
+
+
+class Document:
+    """
+    Text of a problem, kept as an array of lines and edited with Ace deltas
+
+    Positions are dictionaries with a row and a column, like the ones Ace sends.
+    Positions out of range are clamped to the document, as Ace does.
+    """
+
+    __slots__ = ("lines",)
+
+    def __init__(self, lines: list[str] | None = None) -> None:
+        """
+        Sets attributes
+
+        :param lines: Initial lines of the document
+        """
+        self.lines: list[str] = list(lines) if lines else [""]
+
+    @property
+    def text(self) -> str:
+        """The text of the document"""
+        return "\n".join(self.lines)
+
+    def apply(self, action: str, data: dict[str, Any]) -> None:
+        """
+        Applies an Ace delta
+
+        :param action: insert or remove
+        :param data: Data of the delta, with start, end and text
+        """
+        if action == "insert":
+            self.insert(data["start"], data["text"])
+        elif action == "remove":
+            self.remove(data["start"], data["end"])
+        else:
+            raise ValueError(f"Unknown edit action {action}")
+
+    def insert(self, start: dict[str, int], text: list[str]) -> None:
+        """
+        Inserts lines of text
+
+        :param start: Position to insert at
+        :param text: Lines to insert, the first and last are joined to the existing line
+        """
+        if not isinstance(text, list) or not all(
+            isinstance(line, str) for line in text
+        ):
+            raise TypeError("Inserted text has to be a list of lines")
+        row, column = self._clamp(start)
+        if not text:
+            return
+        line = self.lines[row]
+        before, after = line[:column], line[column:]
+        if len(text) == 1:
+            self.lines[row] = before + text[0] + after
+            return
+        self.lines[row:row] = [before + text[0], *text[1:-1]]
+        self.lines[row + len(text) - 1] = text[-1] + after
+
+    def remove(self, start: dict[str, int], end: dict[str, int]) -> None:
+        """
+        Removes the text between two positions
+
+        :param start: Start of the text to remove
+        :param end: End of the text to remove
+        """
+        start_row, start_column = self._clamp(start)
+        end_row, end_column = self._clamp(end)
+        if (end_row, end_column) < (start_row, start_column):
+            return
+        self.lines[start_row] = (
+            self.lines[start_row][:start_column] + self.lines[end_row][end_column:]
+        )
+        first_removed, last_removed = start_row + 1, end_row + 1
+        del self.lines[first_removed:last_removed]
+
+    def _clamp(self, position: dict[str, int]) -> tuple[int, int]:
+        """Returns the row and column of a position, clamped to the document"""
+        if not isinstance(position, dict):
+            raise TypeError("A position has to have a row and a column")
+        row = min(max(int(position["row"]), 0), len(self.lines) - 1)
+        column = min(max(int(position["column"]), 0), len(self.lines[row]))
+        return row, column
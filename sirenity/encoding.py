@@ -0,0 +1,90 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+__all__ = ["BACKEND", "MSGPACK", "dumps", "loads", "packb", "unpackb"]
+
+# Whether messages can be encoded with MessagePack
+MSGPACK = msgpack is not None
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj: Any) -> str:
+        """
+        Encodes an object as JSON
+
+        :param obj: Object to encode
+
+        :return: JSON text
+        """
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(text: str | bytes) -> Any:
+        """
+        Decodes JSON
+
+        :param text: JSON text
+
+        :return: Decoded object
+        """
+        return orjson.loads(text)
+
+else:  # pragma: no cover
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> str:
+        """
+        Encodes an object as JSON
+
+        :param obj: Object to encode
+
+        :return: JSON text
+        """
+        return json.dumps(obj, separators=(",", ":"))
+
+    def loads(text: str | bytes) -> Any:
+        """
+        Decodes JSON
+
+        :param text: JSON text
+
+        :return: Decoded object
+        """
+        return json.loads(text)
+
+
+def packb(obj: Any) -> bytes:
+    """
+    Encodes an object with MessagePack
+
+    :param obj: Object to encode
+
+    :return: Encoded bytes
+    """
+    if msgpack is None:  # pragma: no cover
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(obj)
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    Decodes MessagePack
+
+    :param data: Encoded bytes
+
+    :return: Decoded object
+    """
+    if msgpack is None:  # pragma: no cover
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.unpackb(data)
@@ -1,4 +1,12 @@
+from .async_problem_manager import AsyncProblemManager
 from .problem import Problem
+from .problem_cache import ProblemCache
 from .problem_manager import ProblemManager, ProblemNotFoundError
 
-__all__ = ["Problem", "ProblemManager", "ProblemNotFoundError"]
+__all__ = [
+    "AsyncProblemManager",
+    "Problem",
+    "ProblemCache",
+    "ProblemManager",
+    "ProblemNotFoundError",
+]
@@ -0,0 +1,167 @@
+import asyncio
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Collection, TextIO, TypeVar
+
+from .. import metrics
+from .problem import Problem
+from .problem_manager import ProblemManager
+
+__all__ = ["AsyncProblemManager"]
+
+# Number of connections queries are run on
+POOL_SIZE = 4
+
+T = TypeVar("T")
+
+
+def load_cache(manager: ProblemManager) -> None:
+    """Loads the problem cache of a manager"""
+    manager.cache
+
+
+class AsyncProblemManager:
+    """
+    Manages changes in database without blocking the event loop
+
+    Queries run on a small pool of connections in worker threads. Reads are
+    answered from the problem cache once it is loaded, only loading it goes to
+    the database. The database has to be a file, every connection to :memory:
+    opens a different database.
+    """
+
+    def __init__(
+        self,
+        database_location: str,
+        sourcefile: TextIO | None = None,
+        pool_size: int = POOL_SIZE,
+    ):
+        """
+        Opens the connections, meant to be called while the app starts
+
+        :param database_location: Database file
+        :param sourcefile: CSV file to load problems from
+        :param pool_size: Number of connections queries are run on
+        """
+        self._pool: queue.SimpleQueue[ProblemManager] = queue.SimpleQueue()
+        self._managers = [
+            ProblemManager(
+                database_location,
+                sourcefile if i == 0 else None,
+                check_same_thread=False,
+            )
+            for i in range(pool_size)
+        ]
+        for manager in self._managers:
+            self._pool.put(manager)
+        # Only used on the event loop, to read the cache once it is loaded
+        self._reader = ProblemManager(database_location, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="problems"
+        )
+        self._closed = False
+
+    async def _run(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Calls a method of ProblemManager on a pooled connection, in a thread"""
+
+        def call() -> tuple[T, float]:
+            manager = self._pool.get()
+            start = time.perf_counter()
+            try:
+                return function(manager, *args, **kwargs), time.perf_counter() - start
+            finally:
+                self._pool.put(manager)
+
+        loop = asyncio.get_running_loop()
+        result, seconds = await loop.run_in_executor(self._executor, call)
+        # Recorded on the event loop, so the metrics are only touched by one thread
+        if metrics.ENABLED:
+            metrics.DATABASE_SECONDS.observe(seconds, function.__name__)
+        return result
+
+    async def _loaded(self) -> ProblemManager:
+        """Loads the cache if needed, returning a manager that reads from it"""
+        if not self._reader.is_cached:
+            await self._run(load_cache)
+        return self._reader
+
+    async def add_problem(self, problem: Problem) -> None:
+        """
+        Adds a problem to database
+
+        :param problem: Problem to add
+        """
+        await self._run(ProblemManager.add_problem, problem)
+
+    async def get_at_id(self, id: int) -> Problem:
+        """
+        Gets a problem by id
+
+        :param id: id of problem
+
+        :return: Problem
+        """
+        return (await self._loaded()).get_at_id(id)
+
+    async def get_json(self, id: int) -> str:
+        """
+        Gets the JSON representation of a problem by id, without the solution
+
+        :param id: id of problem
+
+        :return: JSON of the problem
+        """
+        return (await self._loaded()).get_json(id)
+
+    async def check_solution(self, value: str, id: int) -> bool:
+        """
+        Checks if solution is correct
+
+        :param value: value returned by the program written by the user
+        :param id: id of the problem
+        :return: True if solution is correct
+        """
+        return (await self._loaded()).check_solution(value, id)
+
+    async def get_number_of_problems(self) -> int:
+        """
+        Returns number of problems
+
+        :return: number of problems
+        """
+        return (await self._loaded()).get_number_of_problems()
+
+    async def get_random_problems(
+        self,
+        amount: int,
+        *,
+        min_difficulty: int = 0,
+        max_difficulty: int = 100,
+        exclude: Collection[int] = (),
+    ) -> list[Problem]:
+        """
+        Returns distinct random problems
+
+        :param amount: Number of problems
+        :param min_difficulty: Minimum difficulty of the problems
+        :param max_difficulty: Maximum difficulty of the problems
+        :param exclude: IDs of problems not to pick
+        :return: random problems
+        """
+        return (await self._loaded()).get_random_problems(
+            amount,
+            min_difficulty=min_difficulty,
+            max_difficulty=max_difficulty,
+            exclude=exclude,
+        )
+
+    def close(self) -> None:
+        """Waits for running queries and closes the connections"""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        for manager in self._managers:
+            manager.close()
+        self._reader.close()
@@ -0,0 +1,79 @@
+import bisect
+import random
+from typing import Collection, Iterable
+
+from .problem import Problem
+
+__all__ = ["ProblemCache"]
+
+
+class ProblemCache:
+    """
+    Problems of a database, kept in memory
+
+    Problems are indexed by id and sorted by difficulty, so a difficulty range is
+    found with two binary searches. Problems without a difficulty are never
+    picked at random, like in the database.
+    """
+
+    __slots__ = ("problems", "payloads", "difficulties", "ids")
+
+    def __init__(self, problems: Iterable[Problem]) -> None:
+        """
+        Indexes problems
+
+        :param problems: Every problem of the database
+        """
+        self.problems: dict[int, Problem] = {
+            problem.id: problem for problem in problems
+        }
+        # JSON sent to the players, without the solution
+        self.payloads: dict[int, str] = {
+            id_: problem.json() for id_, problem in self.problems.items()
+        }
+        ranked = sorted(
+            (problem.difficulty, id_)
+            for id_, problem in self.problems.items()
+            if problem.difficulty is not None
+        )
+        self.difficulties: list[int] = [difficulty for difficulty, _ in ranked]
+        self.ids: list[int] = [id_ for _, id_ in ranked]
+
+    def __len__(self) -> int:
+        """Returns the number of problems"""
+        return len(self.problems)
+
+    def in_range(self, min_difficulty: int, max_difficulty: int) -> list[int]:
+        """
+        Returns the ids of the problems in a difficulty range
+
+        :param min_difficulty: Minimum difficulty of the problems
+        :param max_difficulty: Maximum difficulty of the problems
+        :return: IDs of the problems
+        """
+        start = bisect.bisect_left(self.difficulties, min_difficulty)
+        end = bisect.bisect_right(self.difficulties, max_difficulty)
+        return self.ids[start:end]
+
+    def sample(
+        self,
+        amount: int,
+        min_difficulty: int,
+        max_difficulty: int,
+        exclude: Collection[int] = (),
+    ) -> list[Problem] | None:
+        """
+        Returns distinct random problems in a difficulty range
+
+        :param amount: Number of problems
+        :param min_difficulty: Minimum difficulty of the problems
+        :param max_difficulty: Maximum difficulty of the problems
+        :param exclude: IDs of problems not to pick
+        :return: random problems, or None if there are not enough
+        """
+        ids = self.in_range(min_difficulty, max_difficulty)
+        if exclude:
+            ids = [id_ for id_ in ids if id_ not in exclude]
+        if len(ids) < amount:
+            return None
+        return [self.problems[id_] for id_ in random.sample(ids, amount)]
@@ -1,8 +1,12 @@
 import csv
+import itertools
+import os
 import sqlite3
-from typing import TextIO
+import time
+from typing import Callable, Collection, Iterable, TextIO
 
 from .problem import Problem
+from .problem_cache import ProblemCache
 
 __all__ = ["ProblemNotFoundError", "ProblemManager"]
 
@@ -13,17 +17,45 @@ class ProblemNotFoundError(Exception):
     pass
 
 
-class ProblemManager:
-    """Manages changes in database"""
+# Number of rows inserted by each statement of an import
+IMPORT_BATCH_SIZE = 500
+
+# Problems of each database file, shared by the managers of this process
+_caches: dict[str, ProblemCache] = {}
+
 
-    def __init__(self, database_location: str, sourcefile: TextIO | None = None):
+class ProblemManager:
+    """
+    Manages changes in database
+
+    Problems are read from an in-memory cache shared by the managers of the same
+    database, which is loaded on first use and dropped whenever problems are added.
+    """
+
+    def __init__(
+        self,
+        database_location: str,
+        sourcefile: TextIO | None = None,
+        *,
+        check_same_thread: bool = True,
+    ):
         """
         Sets attributes for handling problems
 
         :param file: Database file
+        :param check_same_thread: Whether only the creating thread may use the connection
         """
-        self._connection = sqlite3.connect(database_location)
+        self._connection = sqlite3.connect(
+            database_location, check_same_thread=check_same_thread
+        )
+        # Lets readers on other connections carry on while problems are written
+        self._connection.execute("PRAGMA journal_mode=WAL;")
         self._cursor = self._connection.cursor()
+        if database_location == ":memory:":
+            # Every connection to :memory: has its own database
+            self._cache_key = f":memory:{id(self)}"
+        else:
+            self._cache_key = os.path.realpath(database_location)
 
         self.create_table()
 
@@ -46,6 +78,13 @@ class ProblemManager:
             );
             """
         )
+        # Lets a difficulty range be queried without scanning the table
+        self._cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS problems_difficulty
+            ON problems (difficulty);
+            """
+        )
 
         self._connection.commit()
 
@@ -67,6 +106,30 @@ class ProblemManager:
         )
 
         self._connection.commit()
+        self.invalidate()
+
+    @property
+    def cache(self) -> ProblemCache:
+        """Problems of the database, loading them if they are not cached"""
+        cache = _caches.get(self._cache_key)
+        if cache is None:
+            self._cursor.execute(
+                """
+                SELECT id, prompt, solution, difficulty FROM problems;
+                """
+            )
+            cache = ProblemCache(Problem(*row) for row in self._cursor.fetchall())
+            _caches[self._cache_key] = cache
+        return cache
+
+    @property
+    def is_cached(self) -> bool:
+        """Whether the problems are cached"""
+        return self._cache_key in _caches
+
+    def invalidate(self) -> None:
+        """Drops the cached problems, so they are read again on next use"""
+        _caches.pop(self._cache_key, None)
 
     def get_at_id(self, id: int) -> Problem:
         """
@@ -76,20 +139,24 @@ class ProblemManager:
 
         :return: Problem
         """
-        self._cursor.execute(
-            """
-            SELECT id, prompt, solution, difficulty FROM problems
-            WHERE id = ?;
-            """,
-            (id,),
-        )
-
-        row = self._cursor.fetchone()
-        if row is None:
+        problem = self.cache.problems.get(id)
+        if problem is None:
             raise ProblemNotFoundError(f"Problem of id {id} does not exist")
-        problem = Problem(row[0], row[1], row[2], row[3])
         return problem
 
+    def get_json(self, id: int) -> str:
+        """
+        Gets the JSON representation of a problem by id, without the solution
+
+        :param id: id of problem
+
+        :return: JSON of the problem
+        """
+        payload = self.cache.payloads.get(id)
+        if payload is None:
+            raise ProblemNotFoundError(f"Problem of id {id} does not exist")
+        return payload
+
     def check_solution(self, value: str, id: int) -> bool:
         """
         Checks if solution is correct
@@ -106,13 +173,7 @@ class ProblemManager:
 
         :return: number of rows in table
         """
-        self._cursor.execute(
-            """
-            SELECT COUNT(*) FROM problems;
-            """,
-        )
-
-        return self._cursor.fetchone()[0]
+        return len(self.cache)
 
     def get_random_problem(
         self, *, min_difficulty: int = 0, max_difficulty: int = 100
@@ -124,27 +185,105 @@ class ProblemManager:
         :param max_difficulty:Maximum difficulty of the problem
         :return: random problem
         """
-        self._cursor.execute(
-            """
-            SELECT id, prompt, solution, difficulty FROM problems
-            WHERE difficulty BETWEEN ? AND ?
-            ORDER BY RANDOM() LIMIT 1;
-            """,
-            (min_difficulty, max_difficulty),
-        )
-
-        row = self._cursor.fetchone()
-        if row is None:
-            raise ProblemNotFoundError("No problems can be found")
+        return self.get_random_problems(
+            1, min_difficulty=min_difficulty, max_difficulty=max_difficulty
+        )[0]
+
+    def get_random_problems(
+        self,
+        amount: int,
+        *,
+        min_difficulty: int = 0,
+        max_difficulty: int = 100,
+        exclude: Collection[int] = (),
+    ) -> list[Problem]:
+        """
+        Returns distinct random problems
 
-        return Problem(*row)
+        :param amount: Number of problems
+        :param min_difficulty: Minimum difficulty of the problems
+        :param max_difficulty: Maximum difficulty of the problems
+        :param exclude: IDs of problems not to pick
+        :return: random problems
+        """
+        problems = self.cache.sample(amount, min_difficulty, max_difficulty, exclude)
+        if problems is None:
+            raise ProblemNotFoundError(
+                f"Not enough problems can be found, {amount} are needed"
+            )
+        return problems
+
+    def load_problems(
+        self,
+        source_file: TextIO,
+        *,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        progress: Callable[[int, float], None] | None = None,
+    ) -> int:
+        """
+        Adds problems from a CSV file to the database, see import_problems
 
-    def load_problems(self, source_file: TextIO):
-        """Adds problems to the database"""
+        :param source_file: CSV file with an id, prompt, solution and difficulty column
+        :param batch_size: Number of rows inserted at a time
+        :param progress: Called after each batch with the rows imported so far
+            and the rows imported per second
+        :return: Number of rows imported
+        """
         reader = csv.DictReader(source_file)
+        return self.import_problems(
+            (Problem.from_dictionary(row) for row in reader),
+            batch_size=batch_size,
+            progress=progress,
+        )
+
+    def import_problems(
+        self,
+        problems: Iterable[Problem],
+        *,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        progress: Callable[[int, float], None] | None = None,
+    ) -> int:
+        """
+        Adds problems to the database, replacing the ones with the same id
 
-        for row in reader:
-            self.add_problem(Problem.from_dictionary(row))
+        Problems are read as they are inserted, in batches, and committed
+        together, so importing the same problems again leaves the database
+        unchanged.
 
-    def __del__(self):
+        :param problems: Problems to add
+        :param batch_size: Number of rows inserted at a time
+        :param progress: Called after each batch with the rows imported so far
+            and the rows imported per second
+        :return: Number of rows imported
+        """
+        problems = iter(problems)
+        start = time.perf_counter()
+        imported = 0
+        with self._connection:
+            while batch := list(itertools.islice(problems, batch_size)):
+                self._cursor.executemany(
+                    """
+                    INSERT INTO problems (id, prompt, solution, difficulty)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        prompt = excluded.prompt,
+                        solution = excluded.solution,
+                        difficulty = excluded.difficulty;
+                    """,
+                    batch,
+                )
+                imported += len(batch)
+                if progress is not None:
+                    elapsed = time.perf_counter() - start
+                    progress(imported, imported / elapsed if elapsed else 0.0)
+        self.invalidate()
+        return imported
+
+    def close(self) -> None:
+        """Closes the connection to the database"""
+        if self._cache_key.startswith(":memory:"):
+            self.invalidate()
         self._connection.close()
+
+    def __del__(self):
+        self.close()
@@ -1,24 +1,68 @@
 import asyncio
-import json
+import hashlib
 import os
 import random
 import secrets
-import threading
+import time
+from typing import Any, Awaitable, Callable
 
 from fastapi import WebSocket
 
-from .client import Client
-from .euler import Problem, ProblemManager
-from .message import Message, RequestCode
+from . import metrics
+from .broker import RESTORED, Broker, Event, InProcessBroker
+from .client import PING, QUEUE_SIZE, Client, OverflowPolicy
+from .code import SandboxError, SandboxExecutor
+from .document import Document
+from .euler import AsyncProblemManager, Problem
+from .message import BATCH_ACTION, EDIT_ACTIONS, Action, Frame, Message
+from .scheduler import Deadline, Scheduler
 
 AMOUNT_OF_PROBLEMS = 10
 PARENT_DIR = os.path.dirname(__file__)
 PEOPLE_PER_GAME = 5
 TIME_FOR_A_GAME = 10
+# Most cursor moves per second sent for each player and problem
+CURSOR_RATE = 20
+# Seconds to wait for every player to submit their code once the game ends
+SUBMIT_TIMEOUT = 5
+# Seconds a room every player left waits for one of them to reconnect before it is torn down
+RECONNECT_GRACE = 30
+
+# Handles a message, called with the ID of the client sending it
+MessageHandler = Callable[[int, Message], Awaitable[None]]
+
+
+def room_channel(room_id: str) -> str:
+    """
+    Returns the broker channel of a room
+
+    :param room_id: ID of the room
+
+    :return: Name of the channel
+    """
+    return f"room:{room_id}"
+
+
+def _problem_id(key: Any) -> int | None:
+    """Parses the ID of a problem sent as a key, or returns None if it is not one"""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return None
 
 
 class GameManager:
-    """Manages the game"""
+    """
+    Manages the game
+
+    Players of a room may be connected to different worker processes. Every
+    worker keeps a replica of the room, updated from the events published on the
+    room's broker channel, and sends frames to the clients connected to it.
+
+    Once the broker restores a room from its journal after a restart, players
+    resume their sessions with their tokens, and the worker of the first one to
+    reconnect keeps time for the game from then on.
+    """
 
     def __init__(
         self,
@@ -26,43 +70,180 @@ class GameManager:
         csv_file: str = "",
         min_difficulty: int = 0,
         max_difficulty: int = 100,
+        queue_size: int = QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_CURSOR,
+        *,
+        room_id: str = "",
+        name: str = "",
+        people_per_game: int = PEOPLE_PER_GAME,
+        problem_manager: AsyncProblemManager | None = None,
+        problems: list[Problem] | None = None,
+        broker: Broker | None = None,
+        executor: SandboxExecutor | None = None,
+        on_close: Callable[["GameManager"], None] | None = None,
+        scheduler: Scheduler | None = None,
+        cursor_interval: float = 1 / CURSOR_RATE,
+        submit_timeout: float = SUBMIT_TIMEOUT,
+        reconnect_grace: float = RECONNECT_GRACE,
     ):
         """
         Sets some attributes
 
         :param min_difficulty: the minimum difficulty of the problem
         :param max_difficulty: the maximum difficulty of the problem
+        :param queue_size: the number of frames queued for a client before overflowing
+        :param overflow_policy: what to do with a client whose queue overflows
+        :param room_id: ID of the room the game is played in
+        :param name: name of the room
+        :param people_per_game: the number of players needed to start the game
+        :param problem_manager: shared AsyncProblemManager, instead of opening the database
+        :param problems: problems of the game, instead of picking random ones
+        :param broker: broker shared with the other workers
+        :param executor: sandbox shared by the rooms to run submitted code
+        :param on_close: called with the game once it is torn down
+        :param scheduler: scheduler shared by the rooms to end games on time
+        :param cursor_interval: seconds between sending the cursor moves of a player
+        :param submit_timeout: seconds to wait for every player to submit their code
+        :param reconnect_grace: seconds a room every player left waits for one of them
+            to reconnect before it is torn down
         """
+        self.room_id = room_id
+        self.name = name
+        self.people_per_game = people_per_game
+        self.broker: Broker = broker if broker is not None else InProcessBroker()
+        self.channel = room_channel(room_id)
+        self.executor = executor if executor is not None else SandboxExecutor()
+        self.on_close = on_close
+        self.closed = False
+        # Set while the server shuts down, players are then kept in the room
+        self.shutting_down = False
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.timer: Deadline | None = None
+        self.reconnect_grace = reconnect_grace
+        # Tears the room down once every player left, unless one reconnects
+        self.empty_deadline: Deadline | None = None
+        self.cursor_interval = cursor_interval
+        # Latest cursor move of each player and problem, waiting to be sent
+        self.pending_cursor_moves: dict[tuple[int, int], Message] = {}
+        self.cursor_flush: asyncio.TimerHandle | None = None
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        # Clients connected to this worker
         self.clients: dict[int, Client] = {}
-        self.current_id: int = 0
+        # Every player of the room, in the order they joined
+        self.members: list[int] = []
+        # Latest connection of every player, so leaving an older one is ignored
+        self.sessions: dict[int, str] = {}
+        # Broker keys of the sessions started on this worker
+        self.session_keys: set[str] = set()
         self.questions: list[Problem] = []
         self.database = database
-        self.submitted_code: dict[int, dict[str, list[str]]] = {}
+        self.submit_timeout = submit_timeout
+        # Players who submitted their code
+        self.submitted: set[int] = set()
+        # How many players submitted each version of the code of a problem, and
+        # the lines of each version, by hash of the code
+        self.code_counts: dict[int, dict[bytes, int]] = {}
+        self.code_versions: dict[int, dict[bytes, list[str]]] = {}
+        self.code_decided = False
+        self.submit_deadline: Deadline | None = None
+        # Whether this worker keeps time for the game and scores it
+        self.is_leader = False
+        # Whether the room was restored since the roles were assigned, so no worker leads it
+        self.needs_leader = False
+        # Identifies this replica when claiming to lead a restored room
+        self.replica = secrets.token_hex(8)
+        # Wall clock time the game ends at, which outlives the process
+        self.ends_at: float | None = None
         self.started = False
-        self.waiting_for_code_request = False
         self.game_ended = False
         self.votes: dict[int, int] = {}
         self.voted: list[int] = []
-        self.clients_waiting_for_code: set[WebSocket] = set()
-        self.bugposter: Client | None = None
-        if csv_file:
-
-            self.problem_manager: ProblemManager = ProblemManager(
+        self.bugposter: int | None = None
+        self.event_handlers: dict[str, Callable[[Event], None]] = {
+            "frame": self._on_frame,
+            "join": self._on_join,
+            "leave": self._on_leave,
+            "roles": self._on_roles,
+            "game_end": self._on_game_end,
+            "submit": self._on_submit,
+            "vote": self._on_vote,
+            RESTORED: self._on_restored,
+            "lead": self._on_lead,
+        }
+        # Handlers of the messages clients send, others are broadcast
+        self.message_handlers: dict[Action, MessageHandler] = {
+            Action.SUBMIT_CODE: self.submit_code,
+            Action.VOTE: self.vote,
+            Action.REQUEST_CODE: self.request_code,
+            Action.REQUEST_CODE_CAMEL: self.request_code,
+            Action.PONG: self.pong,
+        }
+        if problem_manager is not None:
+            self.problem_manager: AsyncProblemManager = problem_manager
+        elif csv_file:
+            self.problem_manager = AsyncProblemManager(
                 os.path.join(PARENT_DIR, database),
                 open(os.path.join(PARENT_DIR, csv_file)),
             )
             self.csv_file = csv_file
         else:
-            self.problem_manager = ProblemManager(
+            self.problem_manager = AsyncProblemManager(
                 os.path.join(PARENT_DIR, database),
             )
+        self.min_difficulty = min_difficulty
+        self.max_difficulty = max_difficulty
         self.problems: list[Problem] = []
-        while len(self.problems) < AMOUNT_OF_PROBLEMS:
-            problem = self.problem_manager.get_random_problem(
-                min_difficulty=min_difficulty, max_difficulty=max_difficulty
+        if problems is not None:
+            self.problems.extend(problems)
+        # Code of every problem, kept up to date from the edits players make
+        self.documents: dict[int, Document] = {}
+
+    async def open(self) -> None:
+        """
+        Picks the problems of the game and subscribes to the events of the room
+
+        Events published before the room was opened on this worker are replayed.
+        """
+        if len(self.problems) < AMOUNT_OF_PROBLEMS:
+            self.problems.extend(
+                await self.problem_manager.get_random_problems(
+                    AMOUNT_OF_PROBLEMS - len(self.problems),
+                    min_difficulty=self.min_difficulty,
+                    max_difficulty=self.max_difficulty,
+                    exclude={problem.id for problem in self.problems},
+                )
             )
-            if problem not in self.problems:
-                self.problems.append(problem)
+        self.documents = {problem.id: Document() for problem in self.problems}
+        await self.broker.subscribe(self.channel, self.handle_event)
+
+    def handle_event(self, event: Event) -> None:
+        """
+        Applies an event published on the room's channel
+
+        :param event: Event to apply
+        """
+        if not self.closed:
+            self.event_handlers[event["type"]](event)
+
+    def _publish(self, event: Event, *, retain: bool = False) -> None:
+        """Publishes an event from an event handler, without waiting for it"""
+        asyncio.ensure_future(self.broker.publish(self.channel, event, retain=retain))
+
+    async def handle_message(self, client_id: int, message: Message) -> None:
+        """
+        Handles a message sent by a client
+
+        :param client_id: ID of the client sending the message
+        :param message: Message to handle
+        """
+        # The connection is bound to the client, whatever the message claims
+        message.user_id = client_id
+        handler = self.message_handlers.get(message.action)  # type: ignore
+        if handler is None:
+            await self.broadcast(client_id, message)
+        else:
+            await handler(client_id, message)
 
     async def broadcast(
         self, client_id: int, message: Message, *, server: bool = False
@@ -74,214 +255,653 @@ class GameManager:
         :param message: Message to broadcast
         :param server: If it's the server broadcasting
         """
-        if not server:
-            if not secrets.compare_digest(self.clients[client_id].token, message.token):
-                return
-            del message.token
-        for id_, client in self.clients.items():
-            if client_id == id_ and message.action != "chat_message" and not server:
-                continue
-            try:
-                await client.websocket.send_text(str(message))
-            except RuntimeError:  # Client left or reloaded
-                pass
+        if message.action == Action.CURSOR_MOVE and not server:
+            self.queue_cursor_move(client_id, message)
+        elif message.action in EDIT_ACTIONS or message.action == BATCH_ACTION:
+            await self.publish_edit(client_id, message)
+        elif server or message.action == Action.CHAT_MESSAGE:
+            await self.publish_frame(message.frame())
+        else:
+            await self.publish_frame(message.frame(), exclude=client_id)
+
+    def queue_cursor_move(self, client_id: int, message: Message) -> None:
+        """
+        Keeps the latest cursor move of a player, to be sent on the next tick
+
+        :param client_id: ID of the client moving their cursor
+        :param message: Message with the cursor move
+        """
+        self.pending_cursor_moves[(client_id, message.problem_id)] = message
+        if self.cursor_flush is None:
+            self.cursor_flush = asyncio.get_running_loop().call_later(
+                self.cursor_interval, self._flush_cursor_moves
+            )
+
+    def _flush_cursor_moves(self) -> None:
+        """Sends the cursor moves kept since the last tick"""
+        self.cursor_flush = None
+        pending, self.pending_cursor_moves = self.pending_cursor_moves, {}
+        if pending and not self.closed:
+            asyncio.ensure_future(self._publish_cursor_moves(pending))
 
-    async def add_client(self, websocket: WebSocket) -> tuple[int, str]:
+    async def _publish_cursor_moves(
+        self, pending: dict[tuple[int, int], Message]
+    ) -> None:
+        """Publishes cursor moves"""
+        for (client_id, _), message in pending.items():
+            await self.publish_frame(message.frame(), exclude=client_id)
+
+    async def publish_edit(self, client_id: int, message: Message) -> None:
+        """
+        Sends edits to the clients of every worker and applies them to the documents
+
+        A batch of edits is sent as one frame. Edits are retained, so a worker
+        loading the room later rebuilds the documents.
+
+        :param client_id: ID of the client making the edits
+        :param message: Message with the edits
+        """
+        edits = message.edits()
+        if not edits:
+            return
+        for edit in edits:
+            # The edit moves the cursor past any position still waiting to be sent
+            self.pending_cursor_moves.pop((client_id, edit.problem_id), None)
+        frame = message.frame()
+        await self.broker.publish(
+            self.channel,
+            {
+                "type": "frame",
+                "action": frame.action,
+                "text": frame.text,
+                "exclude": client_id,
+                "targets": None,
+                "edits": [list(edit) for edit in edits],
+            },
+            retain=True,
+        )
+
+    async def publish_frame(
+        self,
+        frame: Frame,
+        *,
+        exclude: int | None = None,
+        targets: list[int] | None = None,
+    ) -> None:
+        """
+        Sends an encoded frame to the clients of every worker
+
+        :param frame: Frame to send
+        :param exclude: ID of a client not to send the frame to
+        :param targets: IDs of the only clients to send the frame to
+        """
+        await self.broker.publish(
+            self.channel,
+            {
+                "type": "frame",
+                "action": frame.action,
+                "text": frame.text,
+                "exclude": exclude,
+                "targets": targets,
+            },
+        )
+
+    def send_frame(self, frame: Frame, *, exclude: int | None = None) -> None:
+        """
+        Queues an encoded frame for every client connected to this worker
+
+        :param frame: Frame to send
+        :param exclude: ID of a client not to send the frame to
+        """
+        for id_, client in self.clients.items():
+            if id_ != exclude:
+                client.send(frame)
+
+    def _on_frame(self, event: Event) -> None:
+        """Sends a published frame to the clients connected to this worker"""
+        start = time.perf_counter() if metrics.ENABLED else 0.0
+        frame = Frame(action=event["action"], text=event["text"])
+        for edit in event.get("edits", ()):
+            self._apply_edit(*edit)
+        if event["targets"] is None:
+            self.send_frame(frame, exclude=event["exclude"])
+        else:
+            for client_id in event["targets"]:
+                if client_id in self.clients:
+                    self.clients[client_id].send(frame)
+        if metrics.ENABLED:
+            metrics.FANOUT_SECONDS.observe(time.perf_counter() - start)
+
+    def _apply_edit(self, action: str, problem_id: int, data: dict[str, Any]) -> None:
+        """Applies an edit to the document of its problem"""
+        try:
+            self.documents[int(problem_id)].apply(action, data)
+        except (KeyError, TypeError, ValueError):  # Malformed edit or unknown problem
+            pass
+
+    async def add_client(
+        self, websocket: WebSocket, *, binary: bool = False
+    ) -> tuple[int, str]:
         """
         Adds client
 
+        The client is authenticated by its connection from then on. The token
+        lets the player resume their session if they reconnect.
+
         :param websocket: Client websocket
+        :param binary: Whether the client is sent MessagePack instead of JSON
 
         :returns: ID of the client and token
         """
         token = secrets.token_hex(32)
-        self.current_id += 1
-        self.clients[self.current_id] = Client(
-            id=self.current_id, websocket=websocket, token=token
+        client_id = await self.broker.incr(f"{self.channel}:ids")
+        session_key = self._session_key(token)
+        self.session_keys.add(session_key)
+        await self.broker.set(session_key, client_id)
+        await self._connect(client_id, token, websocket, binary)
+        return client_id, token
+
+    async def resume_client(
+        self, websocket: WebSocket, token: str, *, binary: bool = False
+    ) -> tuple[int, str] | None:
+        """
+        Reconnects a player to their session
+
+        :param websocket: Client websocket
+        :param token: Token the player was given when they joined
+        :param binary: Whether the client is sent MessagePack instead of JSON
+
+        :returns: ID of the client and token, or None if the token is not known
+        """
+        client_id = await self.broker.get(self._session_key(token))
+        if client_id is None or self.closed:
+            return None
+        old = self.clients.pop(client_id, None)
+        if old is not None:
+            old.close()
+        await self._connect(client_id, token, websocket, binary)
+        return client_id, token
+
+    async def pong(self, client_id: int, data: Message) -> None:
+        """
+        Answers nothing, the connection already noted the client is alive
+
+        :param client_id: ID of the client answering a ping
+        :param data: Message
+        """
+
+    async def heartbeat(self, timeout: float) -> None:
+        """
+        Pings the clients connected to this worker, removing the dead ones
+
+        Clients whose connection was closed, like those that fell behind, are
+        removed as well, so they stop costing any work.
+
+        :param timeout: Seconds without a message from a client, or with a frame
+            stuck sending to it, before it is removed
+        """
+        now = time.monotonic()
+        for client_id, client in list(self.clients.items()):
+            if client.is_dead(now, timeout):
+                await self.remove_client(client_id, client)
+            else:
+                client.send(PING)
+
+    def _session_key(self, token: str) -> str:
+        """Returns the broker key of a session, which does not reveal the token"""
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        return f"{self.channel}:session:{digest}"
+
+    async def _connect(
+        self, client_id: int, token: str, websocket: WebSocket, binary: bool = False
+    ) -> None:
+        """Starts sending to a client and tells the other workers it joined"""
+        client = Client(
+            id=client_id,
+            websocket=websocket,
+            token=token,
+            queue_size=self.queue_size,
+            overflow_policy=self.overflow_policy,
+            session=secrets.token_hex(8),
+            binary=binary,
         )
-        self.votes[self.current_id] = 0
-        if len(self.clients) == PEOPLE_PER_GAME:
-            self.bugposter = random.choice(list(self.clients.values()))
-            await self.bugposter.websocket.send_text(
-                str(
-                    Message(
-                        json.dumps({"action": "role", "data": {"role": "Bugposter"}})
-                    )
-                )
+        client.start()
+        self.clients[client_id] = client
+        await self.broker.publish(
+            self.channel,
+            {"type": "join", "client": client_id, "session": client.session},
+            retain=True,
+        )
+        if self.needs_leader:
+            await self.broker.publish(
+                self.channel, {"type": "lead", "replica": self.replica}, retain=True
+            )
+
+    def _on_join(self, event: Event) -> None:
+        """Adds a player, assigning roles once the room is full"""
+        client_id = event["client"]
+        self.sessions[client_id] = event["session"]
+        if self.empty_deadline is not None:
+            self.empty_deadline.cancel()
+            self.empty_deadline = None
+        if client_id in self.members:  # Reconnected
+            return
+        self.members.append(client_id)
+        self.votes.setdefault(client_id, 0)
+        # Every worker sees the same joins in the same order, so only the worker
+        # of the player filling the room assigns roles
+        if (
+            len(self.members) == self.people_per_game
+            and not self.started
+            and client_id in self.clients
+        ):
+            self._publish(
+                {
+                    "type": "roles",
+                    "bugposter": random.choice(self.members),
+                    "leader": client_id,
+                    "ends_at": time.time() + TIME_FOR_A_GAME,
+                },
+                retain=True,
             )
-            for client in self.clients.values():
-                if self.bugposter == client:
-                    continue
-                await client.websocket.send_text(
-                    str(
-                        Message(
-                            json.dumps(
-                                {"action": "role", "data": {"role": "Code Mate"}}
-                            )
-                        )
-                    )
-                )
 
+    def _on_roles(self, event: Event) -> None:
+        """Tells clients their roles and starts the game"""
+        self.bugposter = event["bugposter"]
+        if self.bugposter in self.clients:
+            self.clients[self.bugposter].send(self.role_frame(self.bugposter))
+        self.send_frame(self.role_frame(None), exclude=self.bugposter)
+        self.ends_at = event.get("ends_at")
+        self.needs_leader = False
+        # The worker that assigned the roles keeps time for the game
+        if event["leader"] in self.clients:
+            self.is_leader = True
             self.start()
-        return self.current_id, token
+        self.started = True
+
+    def role_frame(self, client_id: int | None) -> Frame:
+        """
+        Returns the frame telling a player their role
+
+        :param client_id: ID of the player
+
+        :returns: Frame
+        """
+        role = "Bugposter" if client_id == self.bugposter else "Code Mate"
+        return Frame.from_dictionary({"action": "role", "data": {"role": role}})
+
+    def game_end_frame(self) -> Frame:
+        """
+        Returns the frame telling players to submit their code and vote
+
+        :returns: Frame
+        """
+        return Frame.from_dictionary(
+            {"action": "game_end", "data": {"users": list(self.members)}}
+        )
+
+    def send_state(self, client_id: int) -> None:
+        """
+        Tells a player who connects after the game started their role, and whether it ended
 
-    def remove_client(self, user_id: int) -> None:
+        :param client_id: ID of the player
+        """
+        client = self.clients.get(client_id)
+        if client is None:
+            return
+        if self.started and self.bugposter is not None:
+            client.send(self.role_frame(client_id))
+        if self.game_ended:
+            client.send(self.game_end_frame())
+
+    def _on_restored(self, event: Event) -> None:
+        """Forgets which worker led the game, its process may be gone"""
+        self.is_leader = False
+        self.needs_leader = self.started
+
+    def _on_lead(self, event: Event) -> None:
+        """Makes the replica of the first claim to lead a restored room the leader"""
+        if not self.needs_leader:
+            return
+        self.needs_leader = False
+        if event["replica"] != self.replica:
+            return
+        self.is_leader = True
+        if not self.game_ended:
+            remaining = TIME_FOR_A_GAME
+            if self.ends_at is not None:
+                remaining = max(self.ends_at - time.time(), 0)
+            self.timer = self.scheduler.call_later(remaining, self.game_end)
+        elif not self.code_decided:
+            if self.submitted.issuperset(self.members):
+                self._decide_code()
+            else:
+                self.submit_deadline = self.scheduler.call_later(
+                    self.submit_timeout, self._decide_code
+                )
+
+    async def remove_client(self, user_id: int, client: Client | None = None) -> None:
         """
         Removes client
 
         :param user_id: Client ID
+        :param client: Connection to remove, only if the player did not reconnect since
         """
-        del self.clients[user_id]
+        if client is not None and self.clients.get(user_id) is not client:
+            client.close()
+            return
+        client = self.clients.pop(user_id, None)
+        if client is None:
+            return
+        client.close()
+        if not self.closed and not self.shutting_down:
+            await self.broker.publish(
+                self.channel,
+                {"type": "leave", "client": user_id, "session": client.session},
+                retain=True,
+            )
 
-    def get_problems(self) -> list[str]:
+    def _on_leave(self, event: Event) -> None:
+        """Removes a player, tearing the game down once everyone left and none came back"""
+        if self.sessions.get(event["client"]) != event["session"]:
+            # The player reconnected since, possibly to another worker
+            return
+        client_id = event["client"]
+        del self.sessions[client_id]
+        if client_id in self.members:
+            self.members.remove(client_id)
+        for key in [key for key in self.pending_cursor_moves if key[0] == client_id]:
+            del self.pending_cursor_moves[key]
+        if self.votes.get(client_id) == 0:
+            del self.votes[client_id]
+        if not self.members:
+            # A player reloading the page comes back to the room
+            if not self.shutting_down and self.empty_deadline is None:
+                self.empty_deadline = self.scheduler.call_later(
+                    self.reconnect_grace, self.close
+                )
+            return
+        # The player who left may be the last one the game was waiting for
+        if (
+            self.game_ended
+            and self.is_leader
+            and self.submitted.issuperset(self.members)
+        ):
+            self._decide_code()
+        if self._everyone_voted():
+            self._send_result()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether new players can be matched into the game"""
+        return (
+            not self.closed
+            and not self.started
+            and len(self.members) < self.people_per_game
+        )
+
+    def close(self, *, release: bool = True) -> None:
+        """
+        Tears the game down, letting clients receive frames already sent
+
+        :param release: Whether to delete what the broker keeps of the room, which
+            is kept for other workers, or this one after a restart, otherwise
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.cursor_flush is not None:
+            self.cursor_flush.cancel()
+        if self.submit_deadline is not None:
+            self.submit_deadline.cancel()
+        if self.empty_deadline is not None:
+            self.empty_deadline.cancel()
+        self.pending_cursor_moves.clear()
+        for client in self.clients.values():
+            client.close(drain=True)
+        self.clients.clear()
+        self.members.clear()
+        self.sessions.clear()
+        self.votes.clear()
+        self.voted.clear()
+        self.submitted.clear()
+        self.code_counts.clear()
+        self.code_versions.clear()
+        self.problems.clear()
+        self.documents.clear()
+        self.bugposter = None
+        if release:
+            asyncio.ensure_future(self._release_channel())
+        if self.on_close is not None:
+            self.on_close(self)
+
+    async def _release_channel(self) -> None:
+        """Unsubscribes from the room's channel and deletes what it retained"""
+        await self.broker.unsubscribe(self.channel)
+        await self.broker.delete(self.channel)
+        await self.broker.delete(f"{self.channel}:ids")
+        for session_key in self.session_keys:
+            await self.broker.delete(session_key)
+
+    async def get_problems(self) -> list[str]:
         """
         Returns a list of problems
 
         :returns: List of problems
         """
-        return [problem.json() for problem in self.problems]
+        return [
+            await self.problem_manager.get_json(problem.id) for problem in self.problems
+        ]
 
     def start(self) -> None:
         """Starts the game"""
         if not self.started:
-            timer = threading.Timer(
-                TIME_FOR_A_GAME, function=asyncio.run, args=(self.game_end(),)
-            )
-            timer.start()
+            self.timer = self.scheduler.call_later(TIME_FOR_A_GAME, self.game_end)
             self.started = True
 
-    def get_code(self, data: Message) -> dict[int, str] | None:
+    async def submit_code(self, client_id: int, data: Message) -> None:
         """
-        Gets code from clients
+        Submits the code of a player for scoring
 
-        :param data: Message from the clients
+        :param client_id: ID of the client submitting
+        :param data: Message with the code of every problem
+        """
+        if client_id in self.submitted:
+            return
+        code = data.data.get("code") if isinstance(data.data, dict) else None
+        if not isinstance(code, dict):
+            return
+        # The event is retained and replayed, so only well formed code is published
+        lines_by_problem: dict[int, list[str]] = {}
+        for key, lines in code.items():
+            problem_id = _problem_id(key)
+            if problem_id not in self.documents:
+                continue
+            if isinstance(lines, str):
+                lines = lines.split("\n")
+            if isinstance(lines, list) and all(isinstance(line, str) for line in lines):
+                lines_by_problem[problem_id] = lines
+        await self.broker.publish(
+            self.channel,
+            {"type": "submit", "client": client_id, "code": lines_by_problem},
+            retain=True,
+        )
+
+    def _on_submit(self, event: Event) -> None:
+        """Counts the code a player submitted, scoring it once everyone submitted"""
+        if event["client"] in self.submitted or self.code_decided:
+            return
+        self.submitted.add(event["client"])
+        # Counting each submission as it arrives keeps the last one cheap.
+        # Counting every version prevents getting the wrong code from one person
+        # because they have a high ping or something.
+        for key, lines in event["code"].items():
+            problem_id = _problem_id(key)
+            if problem_id not in self.documents or not isinstance(lines, list):
+                continue
+            digest = hashlib.blake2b(digest_size=16)
+            for line in lines:
+                digest.update(str(line).encode())
+                digest.update(b"\n")
+            key = digest.digest()
+            counts = self.code_counts.setdefault(problem_id, {})
+            counts[key] = counts.get(key, 0) + 1
+            self.code_versions.setdefault(problem_id, {}).setdefault(key, lines)
+        if self.is_leader and self.submitted.issuperset(self.members):
+            self._decide_code()
+
+    def _decide_code(self) -> None:
+        """Runs the most submitted code, even if some players did not submit"""
+        if self.code_decided or self.closed:
+            return
+        code = self.get_code()
+        # Only decided once the code could be put together, so a failure can be retried
+        self.code_decided = True
+        if self.submit_deadline is not None:
+            self.submit_deadline.cancel()
+            self.submit_deadline = None
+        asyncio.ensure_future(self.run_code(code))
+
+    def get_code(self) -> dict[int, str]:
+        """
+        Gets the code submitted by the most players for every problem
+
+        Problems no one submitted code for use the code the server has.
 
         :returns: Code to be run
         """
-        if data.user_id in self.submitted_code.keys():
-            return None
-        if not secrets.compare_digest(self.clients[data.user_id].token, data.token):
-            return None
-        self.submitted_code[data.user_id] = data.data["code"]  # type: ignore
+        code_to_return: dict[int, str] = {}
+        for problem_id, document in self.documents.items():
+            counts = self.code_counts.get(problem_id)
+            if not counts:
+                code_to_return[problem_id] = document.text
+                continue
+            key = max(counts, key=counts.__getitem__)
+            code_to_return[problem_id] = "\n".join(
+                str(line) for line in self.code_versions[problem_id][key]
+            )
+        return code_to_return
+
+    async def run_code(self, code: dict[int, str]) -> dict[int, bool]:
+        """
+        Runs the code of every problem in parallel and sends which are solved
+
+        :param code: Code to run, by problem ID
 
-        code_variations: dict[int, dict[str, int]] = {
-            problem.id: {} for problem in self.problems
+        :returns: Whether each problem is solved
+        """
+        outputs = await self.executor.run_all(code)
+        results = {
+            problem_id: not isinstance(output, SandboxError)
+            and await self.problem_manager.check_solution(output.strip(), problem_id)
+            for problem_id, output in outputs.items()
         }
-        if len(self.submitted_code) == len(self.clients):
-            # Loop below to check which version of the code is the most common.
-            # This prevents getting the wrong code from one person because they
-            # have a high ping or something.
-            for solutions in self.submitted_code.values():
-                for problem_id, solution in solutions.items():
-                    solution_str = "\n".join(solution)
-                    if code_variations[int(problem_id)].get(solution_str):
-                        code_variations[int(problem_id)][solution_str] += 1
-                    else:
-                        code_variations[int(problem_id)][solution_str] = 1
-
-            code_to_return: dict[int, str] = {}
-            for problem_id, variations in code_variations.items():  # type: ignore
-                code_to_return[int(problem_id)] = sorted(
-                    variations.items(), key=lambda variation: variation[1], reverse=True
-                )[0][0]
-
-            return code_to_return
-        return None
+        await self.publish_frame(
+            Frame.from_dictionary(
+                {"action": "code_results", "data": {"results": results}}
+            )
+        )
+        return results
 
     async def game_end(self) -> None:
         """Signals to clients to submit code"""
-        for client in self.clients.values():
-            await client.websocket.send_text(
-                str(
-                    Message(
-                        json.dumps(
-                            {
-                                "action": "game_end",
-                                "data": {"users": list(self.clients.keys())},
-                            }
-                        )
-                    )
-                )
-            )
+        await self.broker.publish(self.channel, {"type": "game_end"}, retain=True)
+
+    def _on_game_end(self, event: Event) -> None:
+        """Tells clients to submit their code"""
+        self.send_frame(self.game_end_frame())
         self.game_ended = True
+        # One slow player should not keep the game from being scored
+        if self.is_leader and self.submit_deadline is None:
+            self.submit_deadline = self.scheduler.call_later(
+                self.submit_timeout, self._decide_code
+            )
 
-    async def request_code(self, websocket: WebSocket) -> None:
+    async def request_code(self, client_id: int, data: Message | None = None) -> None:
         """
-        Request code so a late joining or reloading client can have the code
+        Sends the code of every problem to a late joining or reloading client
 
-        :param websocket: Client requesting the code
+        :param client_id: ID of the client requesting the code
+        :param data: Message requesting the code
         """
-        if not self.waiting_for_code_request:
-            self.first_client = list(self.clients.values())[0].websocket
-            await self.first_client.send_text(str(RequestCode()))
-            self.waiting_for_code_request = True
-        self.clients_waiting_for_code.add(websocket)
+        if client_id in self.clients:
+            self.clients[client_id].send(self.code_snapshot())
 
-    async def send_requested_code(self, data: Message) -> None:
+    def code_snapshot(self) -> Frame:
         """
-        Sends requested code to clients
+        Returns the code of every problem, as the server has it
 
-        :param data: Message
+        :returns: Frame sending the code
         """
-        for websocket in self.clients_waiting_for_code.copy():
-            try:
-                await websocket.send_text(str(data))
-            except RuntimeError:  # Client left or reloaded
-                pass
-            self.clients_waiting_for_code.remove(websocket)
+        return Frame.from_dictionary(
+            {
+                "action": "send_requested_code",
+                "data": {
+                    "code": {
+                        problem_id: document.lines
+                        for problem_id, document in self.documents.items()
+                    }
+                },
+            }
+        )
 
-    async def vote(self, data: Message) -> None:
+    async def vote(self, client_id: int, data: Message) -> None:
         """
         Handles voting
 
+        :param client_id: ID of the client voting
         :param data: Message
         """
-        if not secrets.compare_digest(self.clients[data.user_id].token, data.token):
+        if client_id in self.voted or client_id not in self.members:
+            return
+        try:
+            voted = int(data.data["voted"])  # type: ignore
+        except (KeyError, TypeError, ValueError):
             return
+        await self.broker.publish(
+            self.channel,
+            {"type": "vote", "voter": client_id, "voted": voted},
+            retain=True,
+        )
 
-        if data.user_id in self.voted:
+    def _on_vote(self, event: Event) -> None:
+        """Counts a vote, sending the result once everyone voted"""
+        if event["voter"] in self.voted:
             return
-        self.votes[int(data.data["voted"])] += 1  # type: ignore
-        self.voted.append(data.user_id)
-        if len(self.voted) == PEOPLE_PER_GAME:
-            highest_voted = sorted(
-                self.votes.items(), key=lambda vote: vote[1], reverse=True
-            )
+        self.votes[event["voted"]] = self.votes.get(event["voted"], 0) + 1
+        self.voted.append(event["voter"])
+        if self._everyone_voted():
+            self._send_result()
+
+    def _everyone_voted(self) -> bool:
+        """Whether every player voted, not waiting for the ones who left the game"""
+        return bool(self.members) and all(
+            member in self.voted for member in self.members
+        )
+
+    def _send_result(self) -> None:
+        """Sends the result of the vote and tears the game down"""
+        highest_voted = sorted(
+            self.votes.items(), key=lambda vote: vote[1], reverse=True
+        )
 
-            # If there is a tie or they voted wrong
-            if len(highest_voted) > 1:
-                if (
-                    highest_voted[0][1] == highest_voted[1][1]
-                    or self.clients[highest_voted[0][0]] != self.bugposter
-                ):
-                    await self.broadcast(
-                        -1,
-                        Message(
-                            json.dumps(
-                                {
-                                    "action": "result",
-                                    "data": {
-                                        "result": "lost",
-                                        "bugposter": self.bugposter.id,  # type: ignore
-                                    },
-                                }
-                            )
-                        ),
-                        server=True,
-                    )
-                    return
-                await self.broadcast(
-                    -1,
-                    Message(
-                        json.dumps(
-                            {
-                                "action": "result",
-                                "data": {
-                                    "result": "won",
-                                    "bugposter": self.bugposter.id,
-                                },
-                            }
-                        )
-                    ),
-                    server=True,
+        # If there is a tie or they voted wrong
+        if len(highest_voted) > 1:
+            if (
+                highest_voted[0][1] == highest_voted[1][1]
+                or highest_voted[0][0] != self.bugposter
+            ):
+                result = "lost"
+            else:
+                result = "won"
+            self.send_frame(
+                Frame.from_dictionary(
+                    {
+                        "action": "result",
+                        "data": {"result": result, "bugposter": self.bugposter},
+                    }
                 )
+            )
+        self.close()
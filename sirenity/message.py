@@ -1,24 +1,269 @@
-import json
-from typing import Any
+import enum
+import re
+from typing import Any, NamedTuple
+
+from .encoding import dumps, loads, packb, unpackb
+
+
+class Action(str, enum.Enum):
+    """Actions of the messages clients send"""
+
+    INSERT = "insert"
+    REMOVE = "remove"
+    BATCH = "batch"
+    CURSOR_MOVE = "cursorMove"
+    CHAT_MESSAGE = "chat_message"
+    SUBMIT_CODE = "submitCode"
+    VOTE = "vote"
+    REQUEST_CODE = "request_code"
+    REQUEST_CODE_CAMEL = "requestCode"
+    PONG = "pong"
+
+    def __hash__(self) -> int:
+        """Hashes like the string, so actions and strings find each other in sets"""
+        return str.__hash__(self)
+
+
+# Members by name, so parsing an action is one dictionary lookup
+ACTIONS: dict[str, Action] = {action.value: action for action in Action}
+# Actions of messages editing the code of a problem
+EDIT_ACTIONS = frozenset((Action.INSERT, Action.REMOVE))
+# Action of messages packing several edits
+BATCH_ACTION = Action.BATCH
+# The token field of a message, as clients send it
+TOKEN_FIELD = re.compile(r'\s*"token"\s*:\s*"[0-9a-fA-F]*"\s*')
+# The separator after a field
+SEPARATOR = re.compile(r",\s*")
+
+# Websocket subprotocols clients can ask for
+JSON_SUBPROTOCOL = "sirenity.json"
+MSGPACK_SUBPROTOCOL = "sirenity.msgpack"
+# Prefix of the subprotocol carrying the token of a session to resume, which keeps
+# the token out of the URL, and so out of access logs
+RESUME_SUBPROTOCOL_PREFIX = "sirenity.resume."
+# Short names of fields in MessagePack messages, by where the field is found
+MESSAGE_FIELDS = {
+    "action": "a",
+    "user_id": "u",
+    "token": "t",
+    "problem_id": "p",
+    "data": "d",
+}
+DATA_FIELDS = {"start": "s", "end": "e", "text": "x", "pos": "q", "ops": "o"}
+POSITION_FIELDS = {"row": "r", "column": "c"}
+POSITION_KEYS = ("s", "e", "q")
+# Actions of MessagePack messages, sent as their index; send-code.js has the same list
+WIRE_ACTIONS = (
+    "insert",
+    "remove",
+    "batch",
+    "cursorMove",
+    "chat_message",
+    "submitCode",
+    "vote",
+    "request_code",
+    "requestCode",
+    "assign_id",
+    "role",
+    "game_end",
+    "send_requested_code",
+    "code_results",
+    "result",
+    "ping",
+    "pong",
+)
+ACTION_CODES = {action: code for code, action in enumerate(WIRE_ACTIONS)}
+
+
+def _rename(dictionary: dict[str, Any], names: dict[str, str]) -> dict[str, Any]:
+    """Renames the keys of a dictionary, keeping the ones without a new name"""
+    return {names.get(key, key): value for key, value in dictionary.items()}
+
+
+def _invert(names: dict[str, str]) -> dict[str, str]:
+    """Returns the long names of fields by short name"""
+    return {short: name for name, short in names.items()}
+
+
+def compact(message: dict[str, Any]) -> dict[str, Any]:
+    """
+    Shortens the field names and action of a message, for MessagePack
+
+    :param message: Message, as clients send it in JSON
+
+    :return: Compact message
+    """
+    packed = _rename(message, MESSAGE_FIELDS)
+    if isinstance(packed.get("a"), str):
+        packed["a"] = ACTION_CODES.get(packed["a"], packed["a"])
+    data = packed.get("d")
+    if isinstance(data, dict):
+        data = _rename(data, DATA_FIELDS)
+        for key in POSITION_KEYS:
+            if isinstance(data.get(key), dict):
+                data[key] = _rename(data[key], POSITION_FIELDS)
+        if isinstance(data.get("o"), list):
+            data["o"] = [
+                compact(op) if isinstance(op, dict) else op for op in data["o"]
+            ]
+        packed["d"] = data
+    return packed
+
+
+_MESSAGE_NAMES = _invert(MESSAGE_FIELDS)
+_DATA_NAMES = _invert(DATA_FIELDS)
+_POSITION_NAMES = _invert(POSITION_FIELDS)
+
+
+def expand(packed: Any) -> dict[str, Any]:
+    """
+    Restores the field names and action of a compact message
+
+    :param packed: Compact message, as decoded from MessagePack
+
+    :return: Message, as clients send it in JSON
+    """
+    if not isinstance(packed, dict):
+        return {}
+    message = _rename(packed, _MESSAGE_NAMES)
+    action = message.get("action")
+    if isinstance(action, int) and 0 <= action < len(WIRE_ACTIONS):
+        message["action"] = WIRE_ACTIONS[action]
+    data = message.get("data")
+    if isinstance(data, dict):
+        for key in POSITION_KEYS:
+            if isinstance(data.get(key), dict):
+                data[key] = _rename(data[key], _POSITION_NAMES)
+        data = _rename(data, _DATA_NAMES)
+        if isinstance(data.get("ops"), list):
+            data["ops"] = [expand(op) for op in data["ops"]]
+        message["data"] = data
+    return message
+
+
+class Frame:
+    """
+    An encoded message, encoded once and shared by every recipient
+
+    The MessagePack encoding is made from the text the first time a client
+    using it needs the frame, then kept for every other one.
+    """
+
+    __slots__ = ("action", "text", "_binary")
+
+    def __init__(self, action: str, text: str) -> None:
+        """
+        Sets attributes
+
+        :param action: Action of the message
+        :param text: Message encoded in JSON
+        """
+        self.action = action
+        self.text = text
+        self._binary: bytes | None = None
+
+    def __repr__(self) -> str:
+        """Returns the action and text of the frame"""
+        return f"Frame(action={self.action!r}, text={self.text!r})"
+
+    @property
+    def binary(self) -> bytes:
+        """The message encoded in compact MessagePack"""
+        if self._binary is None:
+            self._binary = packb(compact(loads(self.text)))
+        return self._binary
+
+    @staticmethod
+    def from_dictionary(dictionary: dict[str, Any]) -> "Frame":
+        """
+        Encodes a dictionary into a Frame
+
+        :param dictionary: Message to encode, with an action
+
+        :return: Frame
+        """
+        return Frame(action=dictionary["action"], text=dumps(dictionary))
+
+
+class Edit(NamedTuple):
+    """An insert or remove of a problem's code"""
+
+    action: str
+    problem_id: int
+    data: dict[str, Any]
+
+
+def strip_token(text: str) -> str | None:
+    """
+    Removes the token field from an encoded message, without decoding it
+
+    :param text: Encoded message
+    :return: Encoded message without its token, or None if the token cannot be
+        found on its own
+    """
+    matches = list(TOKEN_FIELD.finditer(text))
+    if len(matches) != 1:
+        return None
+    start, end = matches[0].span()
+    before = text[:start].rstrip()
+    separator = SEPARATOR.match(text, end)
+    if separator is not None:
+        end = separator.end()
+    elif before.endswith(","):
+        start = len(before) - 1
+    return text[:start] + text[end:]
+
+
+def add_user_id(text: str, user_id: int) -> str | None:
+    """
+    Adds a user ID field at the end of an encoded message, without decoding it
+
+    :param text: Encoded message
+    :param user_id: ID of the user who sent the message
+    :return: Encoded message with the user ID, or None if it is not an object
+    """
+    body = text.rstrip()
+    if not body.endswith("}"):
+        return None
+    body = body[:-1].rstrip()
+    separator = "" if body.endswith("{") else ","
+    return f'{body}{separator}"user_id":{user_id}}}'
 
 
 class Message:
     """Parses message"""
 
-    action: str
+    __slots__ = ("text", "action", "user_id", "token", "data", "problem_id", "_frame")
+
+    action: Action | str
     user_id: int
     token: str
     data: dict[str, list[str] | dict[str, int | str]]
     problem_id: int  # -1 for problem_id means that the message is not to do with a problem
 
-    def __init__(self, message: str) -> None:
-        """Assigns values"""
-        message_dict = json.loads(message)
-        self.action = message_dict.get("action")
+    def __init__(self, message: str | bytes) -> None:
+        """
+        Assigns values
+
+        :param message: Message encoded in JSON, or in compact MessagePack
+        """
+        if isinstance(message, bytes):
+            # Binary messages are relayed as JSON, so only their sender pays for them
+            message_dict = expand(unpackb(message))
+            message_dict.pop("token", None)
+            message = dumps(message_dict)
+        else:
+            message_dict = loads(message)
+        if not isinstance(message_dict, dict):
+            message_dict = {}
+        self.text = message
+        action = message_dict.get("action")
+        self.action = ACTIONS.get(action, action)  # type: ignore
         self.user_id = message_dict.get("user_id")
         self.token = message_dict.get("token")
         self.data = message_dict.get("data")
         self.problem_id = message_dict.get("problem_id")
+        self._frame: Frame | None = None
 
     def __str__(self) -> str:
         """
@@ -26,14 +271,69 @@ class Message:
 
         :return: string representation
         """
-        return json.dumps(
-            {
-                "action": self.action,
-                "user_id": self.user_id,
-                "data": self.data,
-                "problem_id": self.problem_id,
-            }
-        )
+        return self.frame().text
+
+    def edits(self) -> list[Edit]:
+        """
+        Returns the edits of the message, in order
+
+        A batch message packs consecutive edits, possibly to different problems,
+        as a list of {action, problem_id, data} dictionaries in data.ops.
+
+        Malformed edits, and edits with an unknown action, are skipped.
+
+        :return: Edits, empty if the message is not an edit
+        """
+        if self.action in EDIT_ACTIONS:
+            ops = [
+                {
+                    "action": self.action,
+                    "problem_id": self.problem_id,
+                    "data": self.data,
+                }
+            ]
+        elif self.action == BATCH_ACTION and isinstance(self.data, dict):
+            ops = self.data.get("ops")  # type: ignore
+            if not isinstance(ops, list):
+                return []
+        else:
+            return []
+        return [
+            Edit(op["action"], op["problem_id"], op["data"])
+            for op in ops
+            if isinstance(op, dict)
+            and op.get("action") in EDIT_ACTIONS
+            and isinstance(op.get("problem_id"), int)
+            and isinstance(op.get("data"), dict)
+        ]
+
+    def frame(self) -> Frame:
+        """
+        Encodes the message for sending, without the token
+
+        The message is relayed as it was received, only cutting the token out
+        of it, unless the token cannot be found without decoding the message.
+        The user ID is added last, so it wins over one the client made up.
+
+        :return: Frame
+        """
+        if self._frame is not None:
+            return self._frame
+        text = self.text if self.token is None else strip_token(self.text)
+        if text is not None and isinstance(self.user_id, int):
+            text = add_user_id(text, self.user_id)
+        if text is None:
+            self._frame = Frame.from_dictionary(
+                {
+                    "action": self.action,
+                    "user_id": self.user_id,
+                    "data": self.data,
+                    "problem_id": self.problem_id,
+                }
+            )
+        else:
+            self._frame = Frame(action=self.action, text=text)
+        return self._frame
 
 
 class JoinMessage:
@@ -59,7 +359,15 @@ class JoinMessage:
 
         :return: string representation
         """
-        return json.dumps(
+        return self.frame().text
+
+    def frame(self) -> Frame:
+        """
+        Encodes the message for sending
+
+        :return: Frame
+        """
+        return Frame.from_dictionary(
             {
                 "action": self.action,
                 "user_id": self.user_id,
@@ -67,11 +375,3 @@ class JoinMessage:
                 "data": self.data,
             }
         )
-
-
-class RequestCode:
-    """Used to request code"""
-
-    def __str__(self) -> str:
-        """Returns string representation of data"""
-        return json.dumps({"action": "request_code"})
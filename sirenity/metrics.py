@@ -0,0 +1,292 @@
+import bisect
+import os
+from typing import Any, Callable, Iterator, Mapping
+
+from .message import Action
+
+__all__ = [
+    "CONTENT_TYPE",
+    "ENABLED",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "observe_message",
+    "render",
+    "watch_rooms",
+]
+
+# Whether metrics are collected, hot paths check it before timing anything
+ENABLED = os.environ.get("SIRENITY_METRICS", "1") != "0"
+# Content type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds of the buckets of histograms, in seconds
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_metrics: list["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    """Formats a sample value"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric, rendered in the Prometheus text format"""
+
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        """
+        Sets attributes and registers the metric
+
+        :param name: Name of the metric
+        :param documentation: What the metric measures
+        :param labelnames: Names of the labels of the metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _metrics.append(self)
+
+    def _labels(self, values: tuple[str, ...], extra: str = "") -> str:
+        """Formats the labels of a sample"""
+        labels = [
+            f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)
+        ]
+        if extra:
+            labels.append(extra)
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def samples(self) -> Iterator[str]:
+        """Returns the lines of the samples of the metric"""
+        return iter(())
+
+    def render(self) -> Iterator[str]:
+        """Returns the lines of the metric"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    """A value that only goes up, by labels"""
+
+    type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        """Sets attributes"""
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Adds to the value
+
+        :param labels: Values of the labels
+        :param amount: Amount to add
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def remove(self, *labels: str) -> None:
+        """
+        Forgets the value of some labels, like those of a closed room
+
+        :param labels: Values of the labels
+        """
+        self.values.pop(labels, None)
+
+    def samples(self) -> Iterator[str]:
+        """Returns the lines of the samples of the metric"""
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{self._labels(labels)} {_format(value)}"
+
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        """Sets attributes"""
+        super().__init__(name, documentation)
+        self.function: Callable[[], float] | None = None
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Sets the function returning the value
+
+        :param function: Function returning the value
+        """
+        self.function = function
+
+    def samples(self) -> Iterator[str]:
+        """Returns the lines of the samples of the metric"""
+        if self.function is not None:
+            yield f"{self.name} {_format(self.function())}"
+
+
+class _HistogramValue:
+    """Counts of the observations of a histogram, for some labels"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        """Sets attributes"""
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """Counts of observations in buckets, by labels"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = BUCKETS,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param buckets: Upper bounds of the buckets
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        self.values: dict[tuple[str, ...], _HistogramValue] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        Records an observation
+
+        :param value: Observed value
+        :param labels: Values of the labels
+        """
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = _HistogramValue(len(self.buckets))
+        counts.counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts.sum += value
+        counts.count += 1
+
+    def samples(self) -> Iterator[str]:
+        """Returns the lines of the samples of the metric"""
+        for labels, counts in list(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts.counts):
+                total += count
+                le = self._labels(labels, f'le="{_format(bound)}"')
+                yield f"{self.name}_bucket{le} {total}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format(counts.sum)}"
+            yield f"{self.name}_count{self._labels(labels)} {counts.count}"
+
+
+MESSAGES = Counter(
+    "sirenity_messages_total", "Messages received from clients", ("action",)
+)
+MESSAGE_SECONDS = Histogram(
+    "sirenity_message_seconds", "Time spent handling a message", ("action",)
+)
+ROOM_MESSAGE_SECONDS = Counter(
+    "sirenity_room_message_seconds_total",
+    "Time spent handling the messages of each room",
+    ("room",),
+)
+FANOUT_SECONDS = Histogram(
+    "sirenity_fanout_seconds", "Time spent queueing a frame for the clients of a room"
+)
+OVERFLOWS = Counter(
+    "sirenity_client_overflows_total", "Clients disconnected for falling behind"
+)
+SANDBOX_SECONDS = Histogram(
+    "sirenity_sandbox_seconds",
+    "Time spent checking and running submitted code",
+    ("outcome",),
+)
+DATABASE_SECONDS = Histogram(
+    "sirenity_database_seconds",
+    "Time spent on problem database queries",
+    ("operation",),
+)
+ROOMS = Gauge("sirenity_rooms", "Rooms on this worker")
+CLIENTS = Gauge("sirenity_clients", "Clients connected to this worker")
+QUEUED_FRAMES = Gauge(
+    "sirenity_queued_frames", "Frames waiting to be sent to the clients of this worker"
+)
+MAX_QUEUED_FRAMES = Gauge(
+    "sirenity_max_queued_frames", "Most frames waiting to be sent to one client"
+)
+
+
+def observe_message(room: str, action: Any, seconds: float) -> None:
+    """
+    Records a message handled
+
+    :param room: ID of the room of the message
+    :param action: Action of the message
+    :param seconds: Time spent handling the message
+    """
+    # Actions clients make up are counted together, so they cannot add labels
+    label = action.value if isinstance(action, Action) else "other"
+    MESSAGES.inc(label)
+    MESSAGE_SECONDS.observe(seconds, label)
+    ROOM_MESSAGE_SECONDS.inc(room, amount=seconds)
+
+
+def watch_rooms(rooms: Mapping[str, Any]) -> None:
+    """
+    Reports the rooms of a worker, their clients and queues when scraped
+
+    :param rooms: Rooms of the worker, by ID
+    """
+
+    def clients() -> Iterator[Any]:
+        for room in list(rooms.values()):
+            yield from list(room.clients.values())
+
+    ROOMS.set_function(lambda: len(rooms))
+    CLIENTS.set_function(lambda: sum(1 for _ in clients()))
+    QUEUED_FRAMES.set_function(lambda: sum(len(c.outbox) for c in clients()))
+    MAX_QUEUED_FRAMES.set_function(
+        lambda: max((len(c.outbox) for c in clients()), default=0)
+    )
+
+
+def render() -> str:
+    """
+    Returns every metric in the Prometheus text format
+
+    :return: Metrics
+    """
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
@@ -0,0 +1,182 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import os
+import sys
+import threading
+from typing import Any
+
+__all__ = ["Profile", "ProfileRunningError", "current"]
+
+# Seconds between samples of the event loop thread's stack
+INTERVAL = 0.005
+# Number of the longest handler calls reported
+LONGEST_HANDLERS = 20
+
+# The profile being taken, handlers are only timed for it while it runs
+current: "Profile | None" = None
+
+
+class ProfileRunningError(Exception):
+    """Thrown when a profile is started while another one runs"""
+
+    pass
+
+
+def _frame_name(code: Any) -> str:
+    """Returns the name of a function in a collapsed stack"""
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Profile:
+    """
+    A time-bounded sampling profile of the event loop thread
+
+    A thread samples the stack of the event loop thread at a fixed interval,
+    counting identical stacks, and a task measures how late the loop wakes it
+    up. Nothing runs, and no handler is timed, outside of the window.
+    """
+
+    def __init__(self, interval: float = INTERVAL) -> None:
+        """
+        Sets attributes
+
+        :param interval: Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self.samples = 0
+        self.lags: list[float] = []
+        # Number, total and longest time of the handlers, by action
+        self.handlers: dict[str, list[float]] = {}
+        # The longest handler calls, as (seconds, counter, action, room, client)
+        self.longest: list[tuple[float, int, str, str, int]] = []
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+
+    async def run(self, seconds: float) -> dict[str, Any]:
+        """
+        Profiles the event loop for some time
+
+        :param seconds: How long to profile for
+
+        :return: Report of the profile
+        """
+        global current
+        if current is not None:
+            raise ProfileRunningError("A profile is already running")
+        current = self
+        thread = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(),),
+            name="profiler",
+            daemon=True,
+        )
+        thread.start()
+        watcher = asyncio.create_task(self._watch_loop())
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            current = None
+            self._stop.set()
+            watcher.cancel()
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        return self.report(seconds)
+
+    def _sample(self, thread_id: int) -> None:
+        """Samples the stack of a thread until the profile stops"""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    async def _watch_loop(self) -> None:
+        """Measures how late the event loop runs a callback"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(loop.time() - start - self.interval, 0.0))
+
+    def record_handler(
+        self, action: str, room: str, client: int, seconds: float
+    ) -> None:
+        """
+        Records a message handler that ran during the profile
+
+        :param action: Action of the message
+        :param room: ID of the room of the message
+        :param client: ID of the client sending the message
+        :param seconds: Time spent handling the message
+        """
+        totals = self.handlers.setdefault(action, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+        entry = (seconds, next(self._counter), action, room, client)
+        if len(self.longest) < LONGEST_HANDLERS:
+            heapq.heappush(self.longest, entry)
+        elif entry > self.longest[0]:
+            heapq.heapreplace(self.longest, entry)
+
+    def collapsed(self) -> str:
+        """
+        Returns the stacks sampled, in the collapsed format flame graph tools read
+
+        :return: One line per stack, with the number of times it was sampled
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def report(self, seconds: float) -> dict[str, Any]:
+        """
+        Returns the results of the profile
+
+        :param seconds: How long the profile ran for
+
+        :return: Report
+        """
+        lags = sorted(self.lags)
+
+        def lag(fraction: float) -> float | None:
+            if not lags:
+                return None
+            return round(lags[round(fraction * (len(lags) - 1))] * 1000, 3)
+
+        return {
+            "seconds": seconds,
+            "interval": self.interval,
+            "samples": self.samples,
+            "loop_lag_ms": {"p50": lag(0.5), "p99": lag(0.99), "max": lag(1)},
+            "handlers": {
+                action: {
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "max_ms": round(longest * 1000, 3),
+                }
+                for action, (count, total, longest) in sorted(
+                    self.handlers.items(), key=lambda item: -item[1][1]
+                )
+            },
+            "longest_handlers": [
+                {
+                    "action": action,
+                    "room": room,
+                    "client": client,
+                    "ms": round(duration * 1000, 3),
+                }
+                for duration, _, action, room, client in sorted(
+                    self.longest, reverse=True
+                )
+            ],
+            "stacks": self.collapsed(),
+        }
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import secrets
+
+from . import metrics
+from .broker import Broker, InProcessBroker
+from .client import PING_INTERVAL, PING_TIMEOUT, QUEUE_SIZE, OverflowPolicy
+from .code import SandboxExecutor
+from .euler import AsyncProblemManager
+from .game_manager import (
+    PARENT_DIR, PEOPLE_PER_GAME, GameManager, room_channel
+)
+from .scheduler import Deadline, Scheduler
+
+__all__ = ["RoomNotFoundError", "RoomManager"]
+
+
+class RoomNotFoundError(Exception):
+    """Thrown when a room is not found"""
+
+    pass
+
+
+class RoomManager:
+    """
+    Keeps track of the rooms games are played in
+
+    Rooms are shared with the other workers through the broker, so a player can
+    join a room created by another worker by its id. Matchmaking only fills
+    rooms created by this worker.
+    """
+
+    def __init__(
+        self,
+        database: str = "problems.db",
+        csv_file: str = "",
+        min_difficulty: int = 0,
+        max_difficulty: int = 100,
+        broker: Broker | None = None,
+        executor: SandboxExecutor | None = None,
+        ping_interval: float = PING_INTERVAL,
+        ping_timeout: float = PING_TIMEOUT,
+        queue_size: int = QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_CURSOR,
+    ):
+        """
+        Sets attributes and opens the problem database shared by every room
+
+        :param database: Database file, relative to the package
+        :param csv_file: CSV file to load problems from, relative to the package
+        :param min_difficulty: the minimum difficulty of the problems
+        :param max_difficulty: the maximum difficulty of the problems
+        :param broker: Broker shared with the other workers
+        :param executor: Sandbox shared by the rooms to run submitted code
+        :param ping_interval: Seconds between pings of the clients
+        :param ping_timeout: Seconds without a message from a client, or with a
+            frame stuck sending to it, before it is removed
+        :param queue_size: the number of frames queued for a client before overflowing
+        :param overflow_policy: what to do with a client whose queue overflows
+        """
+        self.broker: Broker = broker if broker is not None else InProcessBroker()
+        self.executor = executor if executor is not None else SandboxExecutor()
+        # One heap of deadlines for every room, instead of a timer each
+        self.scheduler = Scheduler()
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.shutting_down = False
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self._heartbeat: Deadline | None = None
+        self.rooms: dict[str, GameManager] = {}
+        # Rooms of other workers being loaded, so concurrent joins share one replica
+        self._loading: dict[str, asyncio.Task] = {}
+        # Rooms waiting for players, in the order they were created
+        self.open_rooms: dict[str, GameManager] = {}
+        self.min_difficulty = min_difficulty
+        self.max_difficulty = max_difficulty
+        if csv_file:
+            with open(os.path.join(PARENT_DIR, csv_file)) as file:
+                self.problem_manager = AsyncProblemManager(
+                    os.path.join(PARENT_DIR, database), file
+                )
+        else:
+            self.problem_manager = AsyncProblemManager(
+                os.path.join(PARENT_DIR, database)
+            )
+
+    async def create_room(
+        self, name: str = "", people_per_game: int = PEOPLE_PER_GAME
+    ) -> GameManager:
+        """
+        Creates a room
+
+        :param name: Name of the room
+        :param people_per_game: Number of players needed to start the game
+
+        :return: GameManager of the room
+        """
+        room = GameManager(
+            room_id=secrets.token_urlsafe(8),
+            name=name,
+            people_per_game=people_per_game,
+            problem_manager=self.problem_manager,
+            min_difficulty=self.min_difficulty,
+            max_difficulty=self.max_difficulty,
+            broker=self.broker,
+            executor=self.executor,
+            on_close=self.remove_room,
+            scheduler=self.scheduler,
+            queue_size=self.queue_size,
+            overflow_policy=self.overflow_policy,
+        )
+        await room.open()
+        await self.broker.set(
+            room.channel,
+            {
+                "name": name,
+                "people_per_game": people_per_game,
+                "problems": [problem.id for problem in room.problems],
+            },
+        )
+        room.shutting_down = self.shutting_down
+        self.rooms[room.room_id] = room
+        self.open_rooms[room.room_id] = room
+        return room
+
+    async def get_room(self, room_id: str) -> GameManager:
+        """
+        Gets a room by id, loading rooms created by other workers
+
+        :param room_id: ID of the room
+
+        :return: GameManager of the room
+        """
+        if room_id in self.rooms:
+            return self.rooms[room_id]
+        if room_id not in self._loading:
+            self._loading[room_id] = asyncio.create_task(self._load_room(room_id))
+        try:
+            return await asyncio.shield(self._loading[room_id])
+        finally:
+            self._loading.pop(room_id, None)
+
+    async def _load_room(self, room_id: str) -> GameManager:
+        """Creates the replica of a room created by another worker"""
+        metadata = await self.broker.get(room_channel(room_id))
+        if metadata is None:
+            raise RoomNotFoundError(f"Room {room_id} does not exist")
+        room = GameManager(
+            room_id=room_id,
+            name=metadata["name"],
+            people_per_game=metadata["people_per_game"],
+            problem_manager=self.problem_manager,
+            problems=[
+                await self.problem_manager.get_at_id(id_)
+                for id_ in metadata["problems"]
+            ],
+            broker=self.broker,
+            executor=self.executor,
+            on_close=self.remove_room,
+            scheduler=self.scheduler,
+            queue_size=self.queue_size,
+            overflow_policy=self.overflow_policy,
+        )
+        await room.open()
+        room.shutting_down = self.shutting_down
+        self.rooms[room_id] = room
+        return room
+
+    async def find_room(self) -> GameManager:
+        """
+        Finds a room waiting for players, creating one if there is none
+
+        :return: GameManager of the room
+        """
+        for room_id, room in list(self.open_rooms.items()):
+            if room.is_open:
+                return room
+            # The room started or filled up since it was created
+            del self.open_rooms[room_id]
+        return await self.create_room()
+
+    def start_heartbeat(self) -> None:
+        """Starts pinging the clients of every room, removing the dead ones"""
+        if self._heartbeat is None:
+            self._heartbeat = self.scheduler.call_later(
+                self.ping_interval, self.heartbeat
+            )
+
+    async def heartbeat(self) -> None:
+        """Pings the clients of every room once, and schedules the next round"""
+        self._heartbeat = self.scheduler.call_later(self.ping_interval, self.heartbeat)
+        for room in list(self.rooms.values()):
+            await room.heartbeat(self.ping_timeout)
+
+    def shut_down(self) -> None:
+        """
+        Keeps every room as it is while the server shuts down
+
+        The server closes the connections of the players before the rooms are
+        closed, the last player leaving a room would otherwise delete it from the
+        broker, and a restarted worker could not restore it.
+        """
+        self.shutting_down = True
+        for room in self.rooms.values():
+            room.shutting_down = True
+
+    def remove_room(self, room: GameManager) -> None:
+        """
+        Forgets a room once its game is torn down
+
+        :param room: GameManager of the room
+        """
+        self.rooms.pop(room.room_id, None)
+        self.open_rooms.pop(room.room_id, None)
+        metrics.ROOM_MESSAGE_SECONDS.remove(room.room_id)
+
+    def close(self) -> None:
+        """
+        Tears down every room on this worker and closes the problem database
+
+        The broker keeps the rooms, for the other workers or a restarted one.
+        """
+        for room in list(self.rooms.values()):
+            room.close(release=False)
+        self.scheduler.close()
+        self.problem_manager.close()
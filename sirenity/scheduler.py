@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+from typing import Any, Callable
+
+__all__ = ["Deadline", "Scheduler"]
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """A callback scheduled to run at a time, which can be cancelled, paused or extended"""
+
+    __slots__ = (
+        "when",
+        "callback",
+        "args",
+        "cancelled",
+        "done",
+        "_scheduler",
+        "_paused_remaining",
+        "_version",
+    )
+
+    def __init__(
+        self,
+        scheduler: "Scheduler",
+        when: float,
+        callback: Callable[..., Any],
+        args: tuple[Any, ...],
+    ) -> None:
+        """
+        Sets attributes
+
+        :param scheduler: Scheduler running the callback
+        :param when: Loop time to run the callback at
+        :param callback: Function or coroutine function to run
+        :param args: Arguments of the callback
+        """
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.done = False
+        self._scheduler = scheduler
+        # Seconds left while paused, None while running
+        self._paused_remaining: float | None = None
+        # Bumped each time the deadline moves, so older heap entries are skipped
+        self._version = 0
+
+    @property
+    def paused(self) -> bool:
+        """Whether the deadline is paused"""
+        return self._paused_remaining is not None
+
+    @property
+    def active(self) -> bool:
+        """Whether the callback is still going to run"""
+        return not (self.cancelled or self.done or self.paused)
+
+    def remaining(self) -> float:
+        """Returns the seconds left before the callback runs"""
+        if self._paused_remaining is not None:
+            return self._paused_remaining
+        return max(self.when - self._scheduler.time(), 0.0)
+
+    def cancel(self) -> None:
+        """Stops the callback from running"""
+        self.cancelled = True
+        self._version += 1
+
+    def pause(self) -> None:
+        """Stops the clock until the deadline is resumed"""
+        if not self.active:
+            return
+        self._paused_remaining = self.remaining()
+        self._version += 1
+
+    def resume(self) -> None:
+        """Starts the clock again with the time that was left when paused"""
+        if self._paused_remaining is None or self.cancelled or self.done:
+            return
+        self.when = self._scheduler.time() + self._paused_remaining
+        self._paused_remaining = None
+        self._scheduler._push(self)
+
+    def extend(self, seconds: float) -> None:
+        """
+        Moves the deadline later, or earlier with a negative number of seconds
+
+        :param seconds: Seconds to move the deadline by
+        """
+        if self.cancelled or self.done:
+            return
+        if self._paused_remaining is not None:
+            self._paused_remaining = max(self._paused_remaining + seconds, 0.0)
+            return
+        self.when += seconds
+        self._scheduler._push(self)
+
+
+class Scheduler:
+    """
+    Runs deadlines on the event loop from a heap
+
+    Only the earliest deadline is scheduled with the loop, so thousands of games
+    cost one timer instead of one thread each. Cancelled and moved deadlines are
+    left in the heap and skipped when they come up.
+    """
+
+    def __init__(self) -> None:
+        """Sets attributes"""
+        self._heap: list[tuple[float, int, int, Deadline]] = []
+        self._counter = itertools.count()
+        self._handle: asyncio.TimerHandle | None = None
+        self._handle_when: float | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def __len__(self) -> int:
+        """Returns the number of deadlines in the heap, including skipped ones"""
+        return len(self._heap)
+
+    def time(self) -> float:
+        """Returns the time of the event loop"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return self._loop.time()
+
+    def call_later(
+        self, delay: float, callback: Callable[..., Any], *args: Any
+    ) -> Deadline:
+        """
+        Runs a callback after some time, on the event loop
+
+        :param delay: Seconds to wait
+        :param callback: Function or coroutine function to run
+        :param args: Arguments of the callback
+
+        :return: Deadline of the callback
+        """
+        deadline = Deadline(self, self.time() + delay, callback, args)
+        self._push(deadline)
+        return deadline
+
+    def close(self) -> None:
+        """Cancels every deadline"""
+        for _, _, _, deadline in self._heap:
+            deadline.cancel()
+        self._heap.clear()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = self._handle_when = None
+
+    def _push(self, deadline: Deadline) -> None:
+        """Adds a deadline to the heap at its current time"""
+        deadline._version += 1
+        heapq.heappush(
+            self._heap,
+            (deadline.when, next(self._counter), deadline._version, deadline),
+        )
+        self._arm()
+
+    def _is_stale(self, entry: tuple[float, int, int, Deadline]) -> bool:
+        """Whether a heap entry was cancelled or moved"""
+        _, _, version, deadline = entry
+        return version != deadline._version or not deadline.active
+
+    def _arm(self) -> None:
+        """Schedules the loop to wake up for the earliest deadline"""
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._handle is not None:
+            if self._handle_when is not None and self._handle_when <= when:
+                return
+            self._handle.cancel()
+        assert self._loop is not None
+        self._handle = self._loop.call_at(when, self._run)
+        self._handle_when = when
+
+    def _run(self) -> None:
+        """Runs the deadlines that are due"""
+        self._handle = self._handle_when = None
+        now = self.time()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_stale(entry):
+                continue
+            deadline = entry[3]
+            deadline.done = True
+            try:
+                result = deadline.callback(*deadline.args)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception:
+                logger.exception("Deadline callback %r failed", deadline.callback)
+        self._arm()
@@ -0,0 +1,45 @@
+import pathlib
+import sys
+import time
+
+from sirenity.euler import ProblemManager
+
+ROOT = pathlib.Path(__file__).parent
+PACKAGE = ROOT.parent
+
+
+def report(imported: int, rate: float) -> None:
+    """Prints the progress of the import"""
+    print(f"Imported {imported} problems ({rate:.0f} rows/s)")
+
+
+def import_problems(source: pathlib.Path, database: pathlib.Path) -> int:
+    """
+    Imports problems from a CSV file into the database
+
+    :param source: CSV file, like the one setup_project_euler creates
+    :param database: Database file
+    :return: Number of problems imported
+    """
+    manager = ProblemManager(str(database))
+    try:
+        with open(source, newline="") as file:
+            return manager.load_problems(file, progress=report)
+    finally:
+        manager.close()
+
+
+def main():
+    """Imports euler.csv, or the CSV file given, into problems.db"""
+    source = pathlib.Path(sys.argv[1]) if len(sys.argv) > 1 else ROOT / "euler.csv"
+    database = (
+        pathlib.Path(sys.argv[2]) if len(sys.argv) > 2 else PACKAGE / "problems.db"
+    )
+    start = time.perf_counter()
+    imported = import_problems(source, database)
+    elapsed = time.perf_counter() - start
+    print(f"Done! Imported {imported} problems in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
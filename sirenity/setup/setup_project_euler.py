@@ -1,12 +1,39 @@
+import argparse
+import asyncio
 import csv
+import hashlib
+import logging
+import os
 import pathlib
 import re
+import time
 from typing import TextIO
+from urllib.parse import urlsplit
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from sirenity.euler import Problem, ProblemManager
 
 ROOT = pathlib.Path(__file__).parent
+PACKAGE = ROOT.parent
+BASE_URL = "https://projecteuler.net"
+SOLUTIONS_URL = "https://raw.githubusercontent.com/luckytoilet/projecteuler-solutions/master/Solutions.md"
+# Responses already downloaded, so an interrupted download resumes where it stopped
+CACHE_DIR = ROOT / ".cache"
+# Most requests in flight at once
+CONCURRENCY = 8
+# Most requests per second sent to each host
+REQUESTS_PER_SECOND = 5
+# Times a request is retried, waiting twice as long each time
+RETRIES = 5
+BACKOFF = 0.5
+# Seconds to wait for a response
+REQUEST_TIMEOUT = 30
+# Number of problems imported at a time
+IMPORT_BATCH_SIZE = 50
+
 SOLUTION_REGEX = re.compile(
     r"""
     (?P<id>\d+)\. # Matches the problem id
@@ -16,6 +43,8 @@ SOLUTION_REGEX = re.compile(
     re.VERBOSE,
 )
 
+logger = logging.getLogger(__name__)
+
 DIFFICULTY_RATING_REGEX = re.compile(
     r"""
     Difficulty\ rating:\  # All difficulty ratings begin with 'Difficulty rating: '
@@ -26,55 +55,165 @@ DIFFICULTY_RATING_REGEX = re.compile(
 )
 
 
-def download_prompts(outfile, solutions):
-    """Creates file containing Project Euler prompts"""
-    writer = csv.DictWriter(outfile, ["id", "prompt", "solution", "difficulty"])
-    writer.writeheader()
-    for problem_id, solution in solutions.items():
-        print(f"Downloading prompt for Project Euler problem {problem_id}")
-        prompt = (
-            requests.get(f"https://projecteuler.net/minimal={problem_id}")
-            .text.replace(
-                "project/resources",
-                "https://projecteuler.net/project/resources",
-            )
-            .replace("project/images", "https://projecteuler.net/project/images")
-        ).strip()
+class DownloadError(Exception):
+    """Thrown when a page cannot be downloaded"""
 
-        soup = BeautifulSoup(
-            requests.get(f"https://projecteuler.net/problem={problem_id}").text,
-            features="lxml",
-        )
+    pass
 
-        tooltip_text = soup.find("span", class_="tooltiptext_right").text
 
-        if tooltip_text is None:
-            raise ValueError(f"Error while downloading prompt for problem {problem_id}")
+class ResponseCache:
+    """Stores the text of downloaded pages in a directory, by hash of their URL"""
 
-        # The difficulty string is the last string in a list of semi-colon separated strings
-        difficulty_text = tooltip_text.split(";")[-1]
-        result = re.fullmatch(DIFFICULTY_RATING_REGEX, difficulty_text)
-        if result is None:
-            raise ValueError(
-                f"Unable to parse difficulty rating for problem {problem_id} (got '{difficulty_text}')"
+    def __init__(self, directory: pathlib.Path) -> None:
+        """
+        Sets attributes
+
+        :param directory: Directory the pages are stored in
+        """
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url: str) -> pathlib.Path:
+        """Returns the file a page is stored in"""
+        return self.directory / hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, url: str) -> str | None:
+        """
+        Returns a stored page
+
+        :param url: URL of the page
+        :return: Text of the page, or None if it was not downloaded yet
+        """
+        try:
+            return self._path(url).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def set(self, url: str, text: str) -> None:
+        """
+        Stores a page
+
+        :param url: URL of the page
+        :param text: Text of the page
+        """
+        path = self._path(url)
+        # Written then renamed, so a crash never leaves half a page behind
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(text, encoding="utf-8")
+        os.replace(temporary, path)
+
+    def delete(self, url: str) -> None:
+        """
+        Forgets a page, so it is downloaded again
+
+        :param url: URL of the page
+        """
+        self._path(url).unlink(missing_ok=True)
+
+
+class RateLimiter:
+    """Spaces out the requests sent to a host"""
+
+    def __init__(self, requests_per_second: float) -> None:
+        """
+        Sets attributes
+
+        :param requests_per_second: Most requests per second
+        """
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Waits until the next request may be sent"""
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class Downloader:
+    """Downloads pages concurrently, with retries, a rate limit and a cache"""
+
+    def __init__(
+        self,
+        cache: ResponseCache,
+        concurrency: int = CONCURRENCY,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+    ) -> None:
+        """
+        Sets attributes
+
+        :param cache: Cache of the pages already downloaded
+        :param concurrency: Most requests in flight at once
+        :param requests_per_second: Most requests per second sent to each host
+        :param retries: Times a request is retried
+        :param backoff: Seconds to wait before the first retry
+        """
+        self.cache = cache
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._limiters: dict[str, RateLimiter] = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    async def fetch(self, url: str) -> str:
+        """
+        Returns the text of a page, downloading it if it is not cached
+
+        :param url: URL of the page
+        :return: Text of the page
+        """
+        text = self.cache.get(url)
+        if text is not None:
+            return text
+        host = urlsplit(url).netloc
+        limiter = self._limiters.setdefault(host, RateLimiter(self.requests_per_second))
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                await limiter.wait()
+                try:
+                    response = await asyncio.to_thread(
+                        self.session.get, url, timeout=REQUEST_TIMEOUT
+                    )
+                except requests.RequestException as error:
+                    reason = str(error)
+                else:
+                    # Only errors of the server or the rate limit are worth retrying
+                    if response.status_code < 500 and response.status_code != 429:
+                        break
+                    reason = f"HTTP {response.status_code}"
+                if attempt == self.retries:
+                    raise DownloadError(f"Unable to download {url} ({reason})")
+                await asyncio.sleep(self.backoff * 2**attempt)
+        if not response.ok:
+            raise DownloadError(
+                f"Unable to download {url} (HTTP {response.status_code})"
             )
+        self.cache.set(url, response.text)
+        return response.text
 
-        writer.writerow(
-            {
-                "id": problem_id,
-                "prompt": prompt,
-                "solution": solution,
-                "difficulty": result.group("rating"),
-            }
-        )
+    def close(self) -> None:
+        """Closes the connections"""
+        self.session.close()
 
 
-def download_solutions(maximum=None):
-    """Creates solutions file"""
-    text = requests.get(
-        "https://raw.githubusercontent.com/luckytoilet/projecteuler-solutions/master/Solutions.md"
-    ).text
+def parse_solutions(text: str, maximum: int | None = None) -> dict[str, str]:
+    """
+    Parses the list of Project Euler solutions
 
+    :param text: Text of the list
+    :param maximum: Most solutions to return
+    :return: Solutions by problem id
+    """
     solutions = {}
 
     number = 0
@@ -100,21 +239,190 @@ def download_solutions(maximum=None):
     return solutions
 
 
-def setup_project_euler(outfile: TextIO):
-    """Downloads the necessary content for Project Euler problems"""
-    solutions = download_solutions(maximum=10)
-    print("Downloaded Project Euler solutions")
+def parse_problem(
+    problem_id: str, solution: str, minimal: str, page: str, base_url: str = BASE_URL
+) -> Problem:
+    """
+    Parses the pages of a Project Euler problem
 
-    download_prompts(outfile, solutions)
-    print("Downloaded Project Euler prompts")
+    :param problem_id: ID of the problem
+    :param solution: Solution of the problem
+    :param minimal: Text of the page with only the prompt
+    :param page: Text of the page of the problem, with its difficulty
+    :param base_url: URL the resources of the prompt are linked from
+    :return: Problem
+    """
+    prompt = (
+        minimal.replace("project/resources", f"{base_url}/project/resources").replace(
+            "project/images", f"{base_url}/project/images"
+        )
+    ).strip()
+
+    soup = BeautifulSoup(page, features="lxml")
+
+    tooltip = soup.find("span", class_="tooltiptext_right")
+
+    if tooltip is None:
+        raise ValueError(f"Error while downloading prompt for problem {problem_id}")
+
+    # The difficulty string is the last string in a list of semi-colon separated strings
+    difficulty_text = tooltip.text.split(";")[-1]
+    result = re.fullmatch(DIFFICULTY_RATING_REGEX, difficulty_text)
+    if result is None:
+        raise ValueError(
+            f"Unable to parse difficulty rating for problem {problem_id} (got '{difficulty_text}')"
+        )
+
+    return Problem(
+        id=int(problem_id),
+        prompt=prompt,
+        solution=solution,
+        difficulty=int(result.group("rating")),
+    )
+
+
+async def download_problem(
+    downloader: Downloader, problem_id: str, solution: str, base_url: str = BASE_URL
+) -> Problem:
+    """
+    Downloads both pages of a Project Euler problem at once
+
+    :param downloader: Downloader to use
+    :param problem_id: ID of the problem
+    :param solution: Solution of the problem
+    :param base_url: URL of Project Euler
+    :return: Problem
+    """
+    urls = (f"{base_url}/minimal={problem_id}", f"{base_url}/problem={problem_id}")
+    minimal, page = await asyncio.gather(*map(downloader.fetch, urls))
+    try:
+        return parse_problem(problem_id, solution, minimal, page, base_url)
+    except ValueError:
+        # The pages may be an error page, which a later run downloads again
+        for url in urls:
+            downloader.cache.delete(url)
+        raise
+
+
+async def download_problems(
+    manager: ProblemManager,
+    downloader: Downloader,
+    outfile: TextIO | None = None,
+    maximum: int | None = None,
+    base_url: str = BASE_URL,
+    solutions_url: str = SOLUTIONS_URL,
+) -> int:
+    """
+    Downloads Project Euler problems, importing them as they are downloaded
+
+    Problems whose pages cannot be downloaded, once retries ran out, or parsed
+    are skipped, and downloaded again by the next run.
+
+    :param manager: ProblemManager the problems are imported into
+    :param downloader: Downloader to use
+    :param outfile: CSV file the problems are also written to
+    :param maximum: Most problems to download, all of them by default
+    :param base_url: URL of Project Euler
+    :param solutions_url: URL of the list of solutions
+    :return: Number of problems downloaded
+    """
+    solutions = parse_solutions(await downloader.fetch(solutions_url), maximum)
+    print(f"Downloaded {len(solutions)} Project Euler solutions")
+
+    writer = None
+    if outfile is not None:
+        writer = csv.DictWriter(outfile, ["id", "prompt", "solution", "difficulty"])
+        writer.writeheader()
+
+    tasks = [
+        asyncio.create_task(
+            download_problem(downloader, problem_id, solution, base_url)
+        )
+        for problem_id, solution in solutions.items()
+    ]
+    downloaded: list[Problem] = []
+    batch: list[Problem] = []
+    try:
+        for task in asyncio.as_completed(tasks):
+            try:
+                problem = await task
+            except (DownloadError, ValueError) as error:
+                # One problem failing does not lose the others
+                logger.warning("Skipping a problem: %s", error)
+                continue
+            downloaded.append(problem)
+            batch.append(problem)
+            if len(batch) == IMPORT_BATCH_SIZE:
+                manager.import_problems(batch)
+                batch.clear()
+                print(f"Downloaded {len(downloaded)}/{len(tasks)} prompts")
+        manager.import_problems(batch)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if writer is not None:
+        writer.writerows(
+            problem._asdict() for problem in sorted(downloaded, key=lambda p: p.id)
+        )
+    return len(downloaded)
+
+
+async def setup_project_euler(
+    outfile: TextIO,
+    database: pathlib.Path,
+    maximum: int | None = None,
+    base_url: str = BASE_URL,
+    solutions_url: str = SOLUTIONS_URL,
+    cache_dir: pathlib.Path = CACHE_DIR,
+    requests_per_second: float = REQUESTS_PER_SECOND,
+) -> int:
+    """
+    Downloads the necessary content for Project Euler problems
+
+    :return: Number of problems downloaded
+    """
+    downloader = Downloader(
+        ResponseCache(cache_dir), requests_per_second=requests_per_second
+    )
+    manager = ProblemManager(str(database))
+    try:
+        return await download_problems(
+            manager, downloader, outfile, maximum, base_url, solutions_url
+        )
+    finally:
+        downloader.close()
+        manager.close()
 
 
 def main():
-    """Stores Project Euler content in the euler.csv file"""
-    with open(ROOT / "euler.csv", "w") as file:
-        setup_project_euler(file)
+    """Stores Project Euler content in the euler.csv file and the problem database"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--maximum", type=int, help="most problems to download")
+    parser.add_argument(
+        "--database", type=pathlib.Path, default=PACKAGE / "problems.db"
+    )
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--solutions-url", default=SOLUTIONS_URL)
+    parser.add_argument("--cache-dir", type=pathlib.Path, default=CACHE_DIR)
+    arguments = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(ROOT / "euler.csv", "w", newline="") as file:
+        downloaded = asyncio.run(
+            setup_project_euler(
+                file,
+                arguments.database,
+                arguments.maximum,
+                arguments.base_url,
+                arguments.solutions_url,
+                arguments.cache_dir,
+            )
+        )
 
-    print("Done!")
+    print(
+        f"Done! Downloaded {downloaded} problems in {time.perf_counter() - start:.0f}s"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+// MessagePack encoding of the messages exchanged with the server, served from here
+// instead of loading a library from a CDN. Covers the types of JSON, and binary data.
+window.MessagePack = (() => {
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    function encode(value) {
+        const bytes = [];
+        const view = new DataView(new ArrayBuffer(8));
+
+        function pushView(length) {
+            for (let i = 0; i < length; i++) {
+                bytes.push(view.getUint8(i));
+            }
+        }
+
+        function pushHeader(length, fix, fixLimit, [type8, type16, type32]) {
+            // fix is the prefix of the short form, if there is one, like type8 of the 8 bit form
+            if (fix !== null && length < fixLimit) {
+                bytes.push(fix | length);
+            } else if (type8 !== null && length < 0x100) {
+                bytes.push(type8, length);
+            } else if (length < 0x10000) {
+                view.setUint16(0, length);
+                bytes.push(type16);
+                pushView(2);
+            } else {
+                view.setUint32(0, length);
+                bytes.push(type32);
+                pushView(4);
+            }
+        }
+
+        function pushBytes(array) {
+            for (const byte of array) {
+                bytes.push(byte);
+            }
+        }
+
+        function pushInteger(number) {
+            if (number >= 0) {
+                if (number < 0x80) {
+                    bytes.push(number);
+                } else if (number < 0x100) {
+                    bytes.push(0xcc, number);
+                } else if (number < 0x10000) {
+                    view.setUint16(0, number);
+                    bytes.push(0xcd);
+                    pushView(2);
+                } else if (number < 0x100000000) {
+                    view.setUint32(0, number);
+                    bytes.push(0xce);
+                    pushView(4);
+                } else {
+                    view.setBigUint64(0, BigInt(number));
+                    bytes.push(0xcf);
+                    pushView(8);
+                }
+            } else if (number >= -0x20) {
+                bytes.push(number & 0xff);
+            } else if (number >= -0x80) {
+                view.setInt8(0, number);
+                bytes.push(0xd0);
+                pushView(1);
+            } else if (number >= -0x8000) {
+                view.setInt16(0, number);
+                bytes.push(0xd1);
+                pushView(2);
+            } else if (number >= -0x80000000) {
+                view.setInt32(0, number);
+                bytes.push(0xd2);
+                pushView(4);
+            } else {
+                view.setBigInt64(0, BigInt(number));
+                bytes.push(0xd3);
+                pushView(8);
+            }
+        }
+
+        function pushValue(value) {
+            if (value === null || value === undefined) {
+                bytes.push(0xc0);
+            } else if (value === false) {
+                bytes.push(0xc2);
+            } else if (value === true) {
+                bytes.push(0xc3);
+            } else if (typeof value == 'number') {
+                if (Number.isSafeInteger(value)) {
+                    pushInteger(value);
+                } else {
+                    view.setFloat64(0, value);
+                    bytes.push(0xcb);
+                    pushView(8);
+                }
+            } else if (typeof value == 'string') {
+                const encoded = textEncoder.encode(value);
+                pushHeader(encoded.length, 0xa0, 0x20, [0xd9, 0xda, 0xdb]);
+                pushBytes(encoded);
+            } else if (value instanceof Uint8Array) {
+                pushHeader(value.length, null, 0, [0xc4, 0xc5, 0xc6]);
+                pushBytes(value);
+            } else if (Array.isArray(value)) {
+                pushHeader(value.length, 0x90, 0x10, [null, 0xdc, 0xdd]);
+                value.forEach(pushValue);
+            } else {
+                const entries = Object.entries(value);
+                pushHeader(entries.length, 0x80, 0x10, [null, 0xde, 0xdf]);
+                for (const [key, item] of entries) {
+                    pushValue(key);
+                    pushValue(item);
+                }
+            }
+        }
+
+        pushValue(value);
+        return new Uint8Array(bytes);
+    }
+
+    function decode(data) {
+        const buffer = data instanceof ArrayBuffer ? new Uint8Array(data) : data;
+        const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+        let offset = 0;
+
+        function read(size, getter) {
+            const value = getter.call(view, offset);
+            offset += size;
+            return value;
+        }
+
+        function readString(length) {
+            const value = textDecoder.decode(buffer.subarray(offset, offset + length));
+            offset += length;
+            return value;
+        }
+
+        function readBinary(length) {
+            const value = buffer.slice(offset, offset + length);
+            offset += length;
+            return value;
+        }
+
+        function readArray(length) {
+            const array = [];
+            for (let i = 0; i < length; i++) {
+                array.push(readValue());
+            }
+            return array;
+        }
+
+        function readMap(length) {
+            const map = {};
+            for (let i = 0; i < length; i++) {
+                const key = readValue();
+                map[key] = readValue();
+            }
+            return map;
+        }
+
+        function readValue() {
+            const type = read(1, view.getUint8);
+            if (type < 0x80) {
+                return type;
+            } else if (type < 0x90) {
+                return readMap(type & 0x0f);
+            } else if (type < 0xa0) {
+                return readArray(type & 0x0f);
+            } else if (type < 0xc0) {
+                return readString(type & 0x1f);
+            } else if (type >= 0xe0) {
+                return type - 0x100;
+            }
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return readBinary(read(1, view.getUint8));
+                case 0xc5: return readBinary(read(2, view.getUint16));
+                case 0xc6: return readBinary(read(4, view.getUint32));
+                case 0xca: return read(4, view.getFloat32);
+                case 0xcb: return read(8, view.getFloat64);
+                case 0xcc: return read(1, view.getUint8);
+                case 0xcd: return read(2, view.getUint16);
+                case 0xce: return read(4, view.getUint32);
+                case 0xcf: return Number(read(8, view.getBigUint64));
+                case 0xd0: return read(1, view.getInt8);
+                case 0xd1: return read(2, view.getInt16);
+                case 0xd2: return read(4, view.getInt32);
+                case 0xd3: return Number(read(8, view.getBigInt64));
+                case 0xd9: return readString(read(1, view.getUint8));
+                case 0xda: return readString(read(2, view.getUint16));
+                case 0xdb: return readString(read(4, view.getUint32));
+                case 0xdc: return readArray(read(2, view.getUint16));
+                case 0xdd: return readArray(read(4, view.getUint32));
+                case 0xde: return readMap(read(2, view.getUint16));
+                case 0xdf: return readMap(read(4, view.getUint32));
+            }
+            throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+        }
+
+        return readValue();
+    }
+
+    return {encode, decode};
+})();
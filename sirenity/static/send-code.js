@@ -46,7 +46,92 @@ window.addEventListener('DOMContentLoaded', () => {
         "xcode",
     ];
 
-    const websocket = new WebSocket(`ws://${window.location.host}/update-code`);
+    // The token of the last session lets a reload resume it instead of joining again
+    const SESSION_KEY = 'sirenity-session';
+    const params = new URLSearchParams(window.location.search);
+    const savedSession = JSON.parse(sessionStorage.getItem(SESSION_KEY) || 'null');
+    // Messages are sent as compact MessagePack when the library loaded and the server speaks it
+    const MSGPACK_SUBPROTOCOL = 'sirenity.msgpack';
+    const subprotocols = window.MessagePack ? [MSGPACK_SUBPROTOCOL, 'sirenity.json'] : [];
+    if (savedSession && params.get('room') == savedSession.room) {
+        // Offered as a subprotocol, so the token is not logged with the URL
+        subprotocols.push(`sirenity.resume.${savedSession.token}`);
+    }
+    const websocket = new WebSocket(`ws://${window.location.host}/update-code?${params}`, subprotocols);
+    websocket.binaryType = 'arraybuffer';
+    websocket.addEventListener('close', ({code}) => {
+        if (code == 1008 && params.has('room')) {
+            // The room is gone or its game started without this player, look for another one
+            sessionStorage.removeItem(SESSION_KEY);
+            window.location.replace('/web-ide');
+        }
+    });
+    // Short names of fields in MessagePack messages, the same as in message.py
+    const MESSAGE_FIELDS = {action: 'a', user_id: 'u', token: 't', problem_id: 'p', data: 'd'};
+    const DATA_FIELDS = {start: 's', end: 'e', text: 'x', pos: 'q', ops: 'o'};
+    const POSITION_FIELDS = {row: 'r', column: 'c'};
+    const POSITION_KEYS = ['s', 'e', 'q'];
+    const WIRE_ACTIONS = [
+        'insert', 'remove', 'batch', 'cursorMove', 'chat_message', 'submitCode', 'vote', 'request_code',
+        'requestCode', 'assign_id', 'role', 'game_end', 'send_requested_code', 'code_results', 'result',
+        'ping', 'pong',
+    ];
+    const invert = (names) => Object.fromEntries(Object.entries(names).map(([name, short]) => [short, name]));
+    const rename = (object, names) => Object.fromEntries(
+        Object.entries(object).map(([key, value]) => [names[key] ?? key, value])
+    );
+    const isObject = (value) => value !== null && typeof value == 'object' && !Array.isArray(value);
+    const MESSAGE_NAMES = invert(MESSAGE_FIELDS);
+    const DATA_NAMES = invert(DATA_FIELDS);
+    const POSITION_NAMES = invert(POSITION_FIELDS);
+
+    function compact(message) {
+        const packed = rename(message, MESSAGE_FIELDS);
+        if (WIRE_ACTIONS.includes(packed.a)) {
+            packed.a = WIRE_ACTIONS.indexOf(packed.a);
+        }
+        if (isObject(packed.d)) {
+            const data = rename(packed.d, DATA_FIELDS);
+            for (const key of POSITION_KEYS) {
+                if (isObject(data[key])) {
+                    data[key] = rename(data[key], POSITION_FIELDS);
+                }
+            }
+            if (Array.isArray(data.o)) {
+                data.o = data.o.map((op) => isObject(op) ? compact(op) : op);
+            }
+            packed.d = data;
+        }
+        return packed;
+    }
+
+    function expand(packed) {
+        const message = rename(packed, MESSAGE_NAMES);
+        if (typeof message.action == 'number') {
+            message.action = WIRE_ACTIONS[message.action];
+        }
+        if (isObject(message.data)) {
+            const data = rename(message.data, DATA_NAMES);
+            for (const key of ['start', 'end', 'pos']) {
+                if (isObject(data[key])) {
+                    data[key] = rename(data[key], POSITION_NAMES);
+                }
+            }
+            if (Array.isArray(data.ops)) {
+                data.ops = data.ops.map(expand);
+            }
+            message.data = data;
+        }
+        return message;
+    }
+
+    function sendMessage(message) {
+        if (websocket.protocol == MSGPACK_SUBPROTOCOL) {
+            websocket.send(MessagePack.encode(compact(message)));
+        } else {
+            websocket.send(JSON.stringify(message));
+        }
+    }
     const Range = ace.require('ace/range').Range
 
     ace.config.set("basePath", "https://cdnjs.cloudflare.com/ajax/libs/ace/1.8.1");
@@ -198,46 +283,100 @@ window.addEventListener('DOMContentLoaded', () => {
         }
 
     }
+    function applyOp(op, user) {
+        let editorDocument;
+        if(op.problem_id == currentProblemID){
+            editorDocument = editor.getSession().getDocument();
+        } else {
+            editorDocument = problems[op.problem_id].session.getDocument();
+        }
+
+        if(op.action == 'insert'){
+            editorDocument.insertMergedLines(op.data.start, op.data.text);
+
+            addOtherCursor(op.data.end, user, op.problem_id);
+        } else if (op.action == 'remove') {
+
+            editorDocument.remove(new Range(
+                op.data.start.row,
+                op.data.start.column,
+                op.data.end.row,
+                op.data.end.column
+                )
+            );
+
+
+            addOtherCursor(op.data.start, user, op.problem_id);
+
+        } else if (op.action == 'cursorMove'){
+
+            addOtherCursor(op.data.pos, user, op.problem_id);
+        }
+    }
     let userId, token;
+    // Edits made within BATCH_DELAY milliseconds of each other are sent as one frame
+    const BATCH_DELAY = 16;
+    let pendingOps = [];
+    // A cursor move made while edits are waiting is sent after them, which moved it
+    let pendingCursorMove = null;
+    function flushOps() {
+        if (pendingOps.length == 1) {
+            sendMessage(pendingOps[0]);
+        } else if (pendingOps.length > 1) {
+            sendMessage({
+                data: {
+                    ops: pendingOps,
+                },
+                action: 'batch',
+                problem_id: -1
+            });
+        }
+        pendingOps = [];
+        if (pendingCursorMove !== null) {
+            sendMessage(pendingCursorMove);
+            pendingCursorMove = null;
+        }
+    }
+
+    function sendCursorMove() {
+        const message = {
+            data: {
+                pos: selectionObject.getCursor(),
+            },
+            action: 'cursorMove',
+            problem_id: currentProblemID
+        };
+        if (pendingOps.length > 0) {
+            pendingCursorMove = message;
+        } else {
+            sendMessage(message);
+        }
+    }
+
     editor.addEventListener('change', (e) => {
         if (!(editor.curOp && editor.curOp.command.name)) return
-        websocket.send(JSON.stringify({
+        if (pendingOps.length == 0) {
+            setTimeout(flushOps, BATCH_DELAY);
+        }
+        pendingOps.push({
             data: {
                 text: e.lines,
                 start: e.start,
                 end: e.end,
             },
             action: e.action,
-            user_id: userId,
-            token: token,
             problem_id: currentProblemID
-        }));
+        });
     });
 
     editor.addEventListener('focus', (e) => {
-        websocket.send(JSON.stringify({
-            data: {
-                pos: selectionObject.getCursor(),
-            },
-            action: 'cursorMove',
-            user_id: userId,
-            token: token,
-            problem_id: currentProblemID
-        }));
+        sendCursorMove();
     });
 
 
     selectionObject.addEventListener('changeCursor', (e) => {
         if (!(editor.curOp && editor.curOp.command.name)) return
-        websocket.send(JSON.stringify({
-            data: {
-                pos: selectionObject.getCursor(),
-            },
-            action: 'cursorMove',
-            user_id: userId,
-            token: token,
-            problem_id: currentProblemID
-        }));
+        sendCursorMove();
 
         for(const cursorData of Object.values(otherCursors)){
             const {pageX, pageY} = editor.renderer.textToScreenCoordinates(cursorData.pos.row, cursorData.pos.column)
@@ -284,10 +423,15 @@ window.addEventListener('DOMContentLoaded', () => {
     let role;
     let currentButton;
     websocket.addEventListener('message', ({data}) => {
-        data = JSON.parse(data);
+        data = typeof data == 'string' ? JSON.parse(data) : expand(MessagePack.decode(data));
         if(data.action == 'assign_id') {
             userId = data.user_id;
             token = data.token;
+            sessionStorage.setItem(SESSION_KEY, JSON.stringify({room: data.data.room, token: token}));
+            if (params.get('room') != data.data.room) {
+                // Reloading goes back to the same room
+                history.replaceState(null, '', `?room=${data.data.room}`);
+            }
             const nameSpan = document.createElement('span')
             nameSpan.innerText = `You are ${userId}`
             document.querySelector('footer').appendChild(nameSpan)
@@ -361,15 +505,14 @@ window.addEventListener('DOMContentLoaded', () => {
                     }
                     selectionObject = editor.getSession().getSelection();
 
-                    websocket.send(JSON.stringify({
+                    flushOps();
+                    sendMessage({
                         data: {
                             pos: selectionObject.getCursor(),
                         },
                         action: 'cursorMove',
-                        user_id: userId,
-                        token: token,
                         problem_id: currentProblemID
-                    }));
+                    });
                 })
                 tabs.appendChild(button);
                 if(index == 0 ){
@@ -382,44 +525,20 @@ window.addEventListener('DOMContentLoaded', () => {
                 }
             }
 
-            websocket.send(JSON.stringify({
+            sendMessage({
                 data: {
 
                 },
                 action: 'request_code',
-                user_id: userId,
-                token: token,
                 problem_id: -1
-            }));
+            });
         } else if (['insert', 'remove', 'cursorMove'].includes(data.action)) {
             if(data.user_id == userId) return;
-            let editorDocument;
-            if(data.problem_id == currentProblemID){
-                editorDocument = editor.getSession().getDocument();
-            } else {
-                editorDocument = problems[data.problem_id].session.getDocument();
-            }
-
-            if(data.action == 'insert'){
-                editorDocument.insertMergedLines(data.data.start, data.data.text);
-
-                addOtherCursor(data.data.end, data.user_id, data.problem_id);
-            } else if (data.action == 'remove') {
-
-                editorDocument.remove(new Range(
-                    data.data.start.row,
-                    data.data.start.column,
-                    data.data.end.row,
-                    data.data.end.column
-                    )
-                );
-
-
-                addOtherCursor(data.data.start, data.user_id, data.problem_id);
-
-            } else if (data.action == 'cursorMove'){
-
-                addOtherCursor(data.data.pos, data.user_id, data.problem_id);
+            applyOp(data, data.user_id);
+        } else if (data.action == 'batch') {
+            if(data.user_id == userId) return;
+            for(const op of data.data.ops) {
+                applyOp(op, data.user_id);
             }
         } else if (data.action =='game_end') {
             editor.setReadOnly(true);
@@ -428,15 +547,13 @@ window.addEventListener('DOMContentLoaded', () => {
                 code[problem.problemID] = problem.session.getDocument().getAllLines();
             }
 
-            websocket.send(JSON.stringify({
+            sendMessage({
                 data: {
                     code: code,
                 },
                 action: 'submitCode',
-                user_id: userId,
-                token: token,
                 problem_id : -1
-            }));
+            });
             for(const cursorData of Object.values(otherCursors)){
                 cursorData.cursor.style.display = 'none';
             }
@@ -475,15 +592,13 @@ window.addEventListener('DOMContentLoaded', () => {
                 userElement.appendChild(userName)
                 userElement.appendChild(voteButton)
                 voteButton.addEventListener('click', (e) => {
-                    websocket.send(JSON.stringify({
+                    sendMessage({
                         data: {
                             voted: user,
                         },
                         action: 'vote',
-                        user_id: userId,
-                        token: token,
                         problem_id : -1
-                    }));
+                    });
                 })
                 voteButton.innerText = 'Vote'
                 usersList.appendChild(userElement)
@@ -502,32 +617,16 @@ window.addEventListener('DOMContentLoaded', () => {
             chatForm.addEventListener('submit', (e) => {
                 e.preventDefault();
                 if(!chatInput.value) return
-                websocket.send(JSON.stringify({
+                sendMessage({
                     data: {
                         message: chatInput.value,
                     },
                     action: 'chat_message',
-                    user_id: userId,
-                    token: token,
                     problem_id : -1
-                }));
+                });
                 chatInput.value = '';
             })
 
-        }else if (data.action == 'request_code') {
-            let code = {};
-            for (const problem of Object.values(problems)) {
-                code[problem.problemID] = problem.session.getDocument().getAllLines();
-            }
-            websocket.send(JSON.stringify({
-                data: {
-                    code: code,
-                },
-                action: 'send_requested_code',
-                user_id: userId,
-                token: token,
-                problem_id : -1
-            }));
         } else if(data.action == 'send_requested_code') {
             for (const [problemID, code] of Object.entries(data.data.code)) {
 
@@ -535,6 +634,17 @@ window.addEventListener('DOMContentLoaded', () => {
                 document.replace(new Range(0,0,document.getLength(), document.getAllLines().slice(-1).length), code.join('\n'))
             }
 
+        } else if (data.action == 'code_results') {
+            const results = Object.values(data.data.results);
+            for (const [problemID, solved] of Object.entries(data.data.results)) {
+                const button = tabs.querySelector(`[problem-id="${problemID}"]`);
+                if (button) {
+                    button.style.color = solved ? 'green' : 'red';
+                }
+            }
+            const resultsSpan = document.createElement('span')
+            resultsSpan.innerText = `Solved ${results.filter(Boolean).length}/${results.length} problems`
+            document.querySelector('footer').appendChild(resultsSpan)
         } else if (data.action == 'chat_message'){
             const message = document.createElement('p');
             message.innerText = `${data.user_id}: ${data.data.message}`;
@@ -545,6 +655,8 @@ window.addEventListener('DOMContentLoaded', () => {
             const roleSpan = document.createElement('span')
             roleSpan.innerText = 'You are the '+ role
             document.querySelector('footer').appendChild(roleSpan)
+        } else if (data.action == 'ping') {
+            sendMessage({action: 'pong', data: {}});
         } else if (data.action == 'result') {
             let result;
             if(role == 'Bugposter') {
@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import NamedTuple
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__all__ = ["Asset", "PrecompressedStaticFiles", "negotiate"]
+
+# Files worth compressing, images and audio are compressed already
+COMPRESSIBLE_SUFFIXES = frozenset((".css", ".html", ".js", ".json", ".svg", ".txt"))
+# Encodings by order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# Cache headers of URLs with the hash of the file, and of the others
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Query parameter of the hash of the file
+VERSION_PARAMETER = "v"
+
+
+class Asset(NamedTuple):
+    """A static file, with its hash and compressed variants"""
+
+    digest: str
+    mtime: float
+    media_type: str
+    variants: dict[str, bytes]
+
+    def etag(self, encoding: str | None) -> str:
+        """
+        Returns the ETag of a variant
+
+        :param encoding: Content encoding, or None for the file itself
+
+        :return: ETag
+        """
+        if encoding is None:
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+
+def negotiate(accept_encoding: str, available: dict[str, bytes]) -> str | None:
+    """
+    Picks the encoding to send from an Accept-Encoding header
+
+    :param accept_encoding: Accept-Encoding header of the request
+    :param available: Compressed variants, by encoding
+
+    :return: Encoding, or None to send the file itself
+    """
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, parameters = part.partition(";")
+        quality = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Serves static files compressed ahead of time, with hashed URLs
+
+    Files are hashed and compressed once, when the application starts. URLs
+    carrying the hash of the file, as made by version(), are cached forever by
+    browsers, others are revalidated with their ETag. Files changed since the
+    start are served like StaticFiles does.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        """
+        Loads the files
+
+        :param kwargs: Arguments of StaticFiles
+        """
+        super().__init__(**kwargs)
+        # Assets by full path, and their hash by path relative to the directory
+        self.assets: dict[str, Asset] = {}
+        self.digests: dict[str, str] = {}
+        self.load()
+
+    def load(self) -> None:
+        """Hashes and compresses every file"""
+        for directory in self.all_directories:
+            root = os.path.realpath(directory)
+            for path, _, names in os.walk(root):
+                for name in names:
+                    full_path = os.path.join(path, name)
+                    asset = self._load_asset(full_path)
+                    self.assets[full_path] = asset
+                    relative = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    self.digests.setdefault(relative, asset.digest)
+
+    @staticmethod
+    def _load_asset(full_path: str) -> Asset:
+        """Reads a file, keeping the variants smaller than the file itself"""
+        with open(full_path, "rb") as file:
+            content = file.read()
+        variants = {}
+        if os.path.splitext(full_path)[1] in COMPRESSIBLE_SUFFIXES:
+            compressed = {"gzip": gzip.compress(content, 9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(content)
+            variants = {
+                encoding: data
+                for encoding, data in compressed.items()
+                if len(data) < len(content)
+            }
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        return Asset(
+            digest=hashlib.sha256(content).hexdigest()[:16],
+            mtime=os.stat(full_path).st_mtime,
+            media_type=media_type,
+            variants=variants,
+        )
+
+    def version(self, path: str) -> str | None:
+        """
+        Returns the hash of a file, to add to its URL
+
+        :param path: Path of the file, relative to the directory
+
+        :return: Hash, or None if the file is not known
+        """
+        return self.digests.get(path.lstrip("/"))
+
+    def file_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Sends a file, compressed if the client accepts it"""
+        asset = self.assets.get(str(full_path))
+        if asset is None or status_code != 200 or asset.mtime != stat_result.st_mtime:
+            return super().file_response(full_path, stat_result, scope, status_code)
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""), asset.variants)
+        version = QueryParams(scope["query_string"]).get(VERSION_PARAMETER)
+        headers = {
+            "etag": asset.etag(encoding),
+            "vary": "Accept-Encoding",
+            "cache-control": IMMUTABLE if version == asset.digest else REVALIDATE,
+        }
+        if request_headers.get("if-none-match") == headers["etag"]:
+            return NotModifiedResponse(Headers(headers))
+        if encoding is None:
+            return FileResponse(
+                full_path,
+                headers=headers,
+                media_type=asset.media_type,
+                stat_result=stat_result,
+                method=scope["method"],
+            )
+        headers["content-encoding"] = encoding
+        return Response(
+            asset.variants[encoding], headers=headers, media_type=asset.media_type
+        )
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import tempfile
+from typing import Any
+
+from sirenity.euler import Problem, ProblemManager
+from sirenity.game_manager import AMOUNT_OF_PROBLEMS
+
+
+def problem_database() -> str:
+    """
+    Creates a database with enough problems for a game
+
+    :return: Path of the database
+    """
+    file = tempfile.NamedTemporaryFile(suffix="db")
+    file.close()
+    problem_manager = ProblemManager(file.name)
+    for i in range(AMOUNT_OF_PROBLEMS):
+        problem_manager.add_problem(
+            Problem(id=i, prompt="Problem prompt", solution="solution", difficulty=i)
+        )
+    return file.name
+
+
+class FakeWebSocket:
+    """Records the frames sent to a client, optionally blocking until released"""
+
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+        self.closed = False
+        self.close_code: int | None = None
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def send_text(self, text: str) -> None:
+        """Records a frame once sending is released"""
+        await self.release.wait()
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000) -> None:
+        """Records that the websocket was closed"""
+        self.closed = True
+        self.close_code = code
+
+    def frames(self) -> list[dict[str, Any]]:
+        """Returns the frames sent, decoded"""
+        return [json.loads(text) for text in self.sent]
+
+    def actions(self) -> list[str]:
+        """Returns the actions of the frames sent"""
+        return [frame["action"] for frame in self.frames()]
@@ -0,0 +1,138 @@
+import asyncio
+import signal
+import unittest
+
+import uvicorn
+from starlette.requests import Request
+
+from sirenity import app
+from sirenity.room_manager import RoomManager
+
+from .helpers import FakeWebSocket, problem_database
+
+
+class ReceivingWebSocket(FakeWebSocket):
+    """Accepts the connection and receives the given messages"""
+
+    def __init__(self, *messages: str) -> None:
+        super().__init__()
+        self.scope: dict = {"subprotocols": []}
+        self.messages = list(messages)
+
+    async def accept(self, subprotocol: str | None = None) -> None:
+        """Does nothing"""
+
+    async def receive_text(self) -> str:
+        """Returns the next message, waiting forever once there is none"""
+        if not self.messages:
+            await asyncio.Event().wait()
+        return self.messages.pop(0)
+
+
+class AppTestCase(unittest.IsolatedAsyncioTestCase):
+    """Gives the app a room manager with enough problems for a game"""
+
+    def setUp(self) -> None:
+        """Prepares a database with enough problems for a game"""
+        app.app.room_manager = RoomManager(problem_database())  # type: ignore
+
+    async def asyncTearDown(self) -> None:
+        """Tears down the rooms and closes the problem database"""
+        app.app.room_manager.close()  # type: ignore
+        del app.app.room_manager  # type: ignore
+
+
+class TestUpdateCode(AppTestCase):
+    """Tests the websocket endpoint of the app"""
+
+    async def test_error_removes_client(self) -> None:
+        """Tests that a client sending a message that cannot be parsed leaves its room"""
+        room = await app.app.room_manager.create_room()  # type: ignore
+        websocket = ReceivingWebSocket("not json")
+        with self.assertRaises(ValueError):
+            await app.update_Code(websocket, room=room.room_id)  # type: ignore
+        self.assertEqual(room.clients, {})
+        self.assertEqual(room.members, [])
+        await asyncio.sleep(0)
+        self.assertTrue(websocket.closed)
+
+    async def test_join_started_room(self) -> None:
+        """Tests that a player cannot join a room whose game started"""
+        room = await app.app.room_manager.create_room()  # type: ignore
+        room.started = True
+        websocket = ReceivingWebSocket()
+        await app.update_Code(websocket, room=room.room_id)  # type: ignore
+        self.assertEqual(websocket.close_code, 1008)
+        self.assertEqual(room.members, [])
+
+    async def test_resume(self) -> None:
+        """Tests that a player offering the token of its session resumes it"""
+        room = await app.app.room_manager.create_room()  # type: ignore
+        client_id, token = await room.add_client(FakeWebSocket())  # type: ignore
+        websocket = ReceivingWebSocket()
+        websocket.scope["subprotocols"] = ["sirenity.json", f"sirenity.resume.{token}"]
+        task = asyncio.create_task(app.update_Code(websocket, room=room.room_id))  # type: ignore
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        assign_id = websocket.frames()[0]
+        self.assertEqual(assign_id["action"], "assign_id")
+        self.assertEqual(assign_id["user_id"], client_id)
+        self.assertEqual(assign_id["token"], token)
+
+    async def test_join_missing_room(self) -> None:
+        """Tests that a player joining a room that does not exist is told why it is closed"""
+        websocket = ReceivingWebSocket()
+        await app.update_Code(websocket, room="missing")  # type: ignore
+        self.assertEqual(websocket.close_code, 1008)
+
+
+class TestCreateGame(AppTestCase):
+    """Tests creating rooms from the game creation form"""
+
+    @staticmethod
+    def form_request(body: bytes) -> Request:
+        """Returns a request posting a form"""
+
+        async def receive() -> dict:
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+    async def test_create_game(self) -> None:
+        """Tests that posting the form creates a room and redirects to it"""
+        response = await app.create_game(self.form_request(b"name=Lobby+1&amount=20"))
+        (room,) = app.app.room_manager.rooms.values()  # type: ignore
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response.headers["location"], f"/web-ide?room={room.room_id}")
+        self.assertEqual(room.name, "Lobby 1")
+        self.assertEqual(room.people_per_game, 8)
+
+    async def test_create_game_defaults(self) -> None:
+        """Tests that a room is created with the default size for a missing amount"""
+        await app.create_game(self.form_request(b""))
+        (room,) = app.app.room_manager.rooms.values()  # type: ignore
+        self.assertEqual(room.name, "")
+        self.assertEqual(room.people_per_game, app.PEOPLE_PER_GAME)
+
+    def test_creation_needs_post(self) -> None:
+        """Tests that following a link to the form action creates no room"""
+        routes = [route for route in app.app.routes if route.path == "/game"]
+        self.assertEqual([route.methods for route in routes], [{"POST"}])
+
+
+class TestServer(AppTestCase):
+    """Tests the server running the app"""
+
+    async def test_handle_exit(self) -> None:
+        """Tests that the rooms are told the server shuts down when it is asked to exit"""
+        room = await app.app.room_manager.create_room()  # type: ignore
+        server = app.Server(uvicorn.Config(app.app))
+        server.handle_exit(signal.SIGTERM, None)
+        self.assertTrue(server.should_exit)
+        self.assertTrue(room.shutting_down)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import random
+import unittest
+
+from sirenity.benchmark import (
+    BenchmarkConfig, Player, Recorder, benchmark, compare, make_trace
+)
+
+
+class TestBenchmark(unittest.TestCase):
+    """Tests the benchmark harness"""
+
+    def test_trace(self) -> None:
+        """Tests that traces are made of messages players send"""
+        trace = make_trace(random.Random(0), 50, [1, 2])
+        self.assertEqual(len(trace), 50)
+        actions = {message["action"] for message in trace}
+        self.assertTrue(
+            actions <= {"insert", "remove", "batch", "cursorMove", "chat_message"}
+        )
+        self.assertIn("insert", actions)
+
+    def test_run(self) -> None:
+        """Tests that a small run plays whole games and reports latencies"""
+        config = BenchmarkConfig(rooms=2, people_per_game=2, messages=10, rate=200)
+        report = asyncio.run(benchmark(config))
+        results = report["results"]
+        self.assertEqual(results["messages"], 2 * (10 + 5))
+        self.assertGreater(results["frames"], 0)
+        self.assertIsNotNone(results["latency_ms"])
+        self.assertIsNotNone(results["late_join_ms"])
+        self.assertIsNotNone(results["game_end_ms"])
+        self.assertEqual(report["config"]["rooms"], 2)
+
+    def test_player_transport(self) -> None:
+        """Tests that a player needs a way to connect and send"""
+        with self.assertRaises(TypeError):
+            Player(Recorder())  # type: ignore
+
+    def test_compare(self) -> None:
+        """Tests that only metrics getting worse are regressions"""
+        baseline = {"results": {"messages_per_second": 100, "latency_ms": {"p99": 10}}}
+        current = {"results": {"messages_per_second": 80, "latency_ms": {"p99": 5}}}
+        self.assertEqual(
+            compare(baseline, current, 0.1),
+            ["messages_per_second: 100 -> 80 (+20%)"],
+        )
+        self.assertEqual(compare(baseline, current, 0.5), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
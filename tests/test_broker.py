@@ -0,0 +1,185 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from sirenity.broker import (
+    RESTORED, Broker, BrokerServer, InProcessBroker, Journal, SocketBroker
+)
+
+
+class TestBroker(unittest.TestCase):
+    """Tests the interface of the brokers"""
+
+    def test_incomplete_backend(self) -> None:
+        """Tests that a backend missing an operation cannot be created"""
+
+        class PublishOnly(Broker):
+            async def publish(self, channel, event, *, retain=False):
+                """Does nothing"""
+
+        with self.assertRaises(TypeError):
+            PublishOnly()  # type: ignore
+
+
+class TestInProcessBroker(unittest.IsolatedAsyncioTestCase):
+    """Tests InProcessBroker"""
+
+    async def test_publish_and_replay(self) -> None:
+        """Tests that events are delivered, and retained events are replayed"""
+        broker = InProcessBroker()
+        await broker.publish("room", {"n": 1}, retain=True)
+        await broker.publish("room", {"n": 2})
+        events: list[dict] = []
+        await broker.subscribe("room", events.append)
+        await broker.publish("room", {"n": 3})
+        self.assertEqual(events, [{"n": 1}, {"n": 3}])
+
+        await broker.delete("room")
+        later: list[dict] = []
+        await broker.subscribe("room", later.append)
+        self.assertEqual(later, [])
+
+    async def test_incr(self) -> None:
+        """Tests that counters start from 0"""
+        broker = InProcessBroker()
+        self.assertEqual(await broker.incr("ids"), 1)
+        self.assertEqual(await broker.incr("ids", 2), 3)
+
+
+class TestSocketBroker(unittest.IsolatedAsyncioTestCase):
+    """Tests SocketBroker with a BrokerServer on a unix socket"""
+
+    async def asyncSetUp(self) -> None:
+        """Starts a server and connects two workers to it"""
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "broker.sock")
+        self.server = BrokerServer(path)
+        await self.server.start()
+        self.first = SocketBroker(path)
+        self.second = SocketBroker(path)
+        await self.first.connect()
+        await self.second.connect()
+
+    async def asyncTearDown(self) -> None:
+        """Disconnects the workers and stops the server"""
+        await self.first.close()
+        await self.second.close()
+        await self.server.close()
+        self.directory.cleanup()
+
+    async def test_events_reach_every_worker(self) -> None:
+        """Tests that events are delivered to every worker in the same order"""
+        first: list[dict] = []
+        second: list[dict] = []
+        await self.first.subscribe("room", first.append)
+        await self.second.subscribe("room", second.append)
+        await self.first.publish("room", {"n": 1})
+        await self.second.publish("room", {"n": 2})
+        await self.first.get("sync")
+        await self.second.get("sync")
+        self.assertEqual(first, [{"n": 1}, {"n": 2}])
+        self.assertEqual(second, first)
+
+    async def test_retained_events_replayed(self) -> None:
+        """Tests that a worker subscribing late catches up with retained events"""
+        await self.first.publish("room", {"n": 1}, retain=True)
+        await self.first.publish("room", {"n": 2})
+        events: list[dict] = []
+        await self.second.subscribe("room", events.append)
+        self.assertEqual(events, [{"n": 1}])
+
+    async def test_shared_values(self) -> None:
+        """Tests that counters and values are shared between workers"""
+        ids = await asyncio.gather(
+            *(broker.incr("ids") for broker in (self.first, self.second) * 5)
+        )
+        self.assertEqual(sorted(ids), list(range(1, 11)))
+        await self.first.set("room", {"name": "Room"})
+        self.assertEqual(await self.second.get("room"), {"name": "Room"})
+        await self.second.delete("room")
+        self.assertIsNone(await self.first.get("room"))
+
+
+class TestJournal(unittest.IsolatedAsyncioTestCase):
+    """Tests keeping what brokers retain in a journal"""
+
+    def setUp(self) -> None:
+        """Creates the directory of the journal"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    async def restart(self, broker: InProcessBroker | None = None) -> InProcessBroker:
+        """Closes a broker and connects a new one to the same journal"""
+        if broker is not None:
+            await broker.close()
+        broker = InProcessBroker(Journal(self.directory.name))
+        await broker.connect()
+        return broker
+
+    async def test_restore(self) -> None:
+        """Tests that values and retained events are restored after a restart"""
+        broker = await self.restart()
+        await broker.publish("room", {"n": 1}, retain=True)
+        await broker.publish("room", {"n": 2})
+        await broker.incr("ids")
+        await broker.set("room", {"name": "Room"})
+        await broker.set("gone", 1)
+        await broker.delete("gone")
+        broker = await self.restart(broker)
+        self.assertEqual(broker.values, {"ids": 1, "room": {"name": "Room"}})
+        events: list[dict] = []
+        await broker.subscribe("room", events.append)
+        self.assertEqual(events, [{"n": 1}, {"type": RESTORED}])
+        await broker.close()
+
+    async def test_snapshot(self) -> None:
+        """Tests that logs are folded into a snapshot leaving deleted channels out"""
+        broker = await self.restart()
+        for channel in ("ended", "playing"):
+            await broker.publish(channel, {"channel": channel}, retain=True)
+            await broker.set(f"{channel}:ids", 1)
+        await broker.delete("ended")
+        await broker.journal.snapshot()  # type: ignore
+        await broker.publish("playing", {"n": 2}, retain=True)
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)), ["journal.2.log", "snapshot.json"]
+        )
+        broker = await self.restart(broker)
+        self.assertNotIn("ended", broker.retained)
+        self.assertEqual(
+            broker.retained["playing"],
+            [{"channel": "playing"}, {"n": 2}, {"type": RESTORED}],
+        )
+        self.assertEqual(broker.values, {"ended:ids": 1, "playing:ids": 1})
+        await broker.close()
+
+    async def test_torn_record(self) -> None:
+        """Tests that a record torn by a crash is ignored"""
+        broker = await self.restart()
+        await broker.set("key", 1)
+        broker.journal._file.write(b'{"op": "set", "key": "key", "va')  # type: ignore
+        broker = await self.restart(broker)
+        self.assertEqual(broker.values, {"key": 1})
+        await broker.close()
+
+    async def test_broker_server(self) -> None:
+        """Tests that a BrokerServer restores what it retained after a restart"""
+        path = os.path.join(self.directory.name, "broker.sock")
+        journal_directory = os.path.join(self.directory.name, "journal")
+        for n in range(2):
+            server = BrokerServer(path, journal=Journal(journal_directory))
+            await server.start()
+            worker = SocketBroker(path)
+            await worker.connect()
+            events: list[dict] = []
+            await worker.subscribe("room", events.append)
+            await worker.publish("room", {"n": n}, retain=True)
+            self.assertEqual(await worker.incr("ids"), n + 1)
+            await worker.close()
+            await server.close()
+        self.assertEqual(events, [{"n": 0}, {"type": RESTORED}, {"n": 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from websockets.exceptions import ConnectionClosed
+
+from sirenity.client import Client, OverflowPolicy
+from sirenity.message import Frame
+
+from .helpers import FakeWebSocket
+
+
+class TestClient(unittest.IsolatedAsyncioTestCase):
+    """Tests the outbound queue of Client"""
+
+    async def test_frames_sent_in_order(self) -> None:
+        """Tests that queued frames are written in the order they were sent"""
+        websocket = FakeWebSocket()
+        client = Client(id=1, token="", websocket=websocket)  # type: ignore
+        client.start()
+        for i in range(5):
+            self.assertTrue(client.send(Frame("insert", str(i))))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(websocket.sent, ["0", "1", "2", "3", "4"])
+        client.close()
+
+    async def test_connection_closed(self) -> None:
+        """Tests that a client whose connection broke while sending is closed"""
+
+        class BrokenWebSocket(FakeWebSocket):
+            async def send_text(self, text: str) -> None:
+                """Fails like a websocket whose connection was lost"""
+                raise ConnectionClosed(None, None)
+
+        client = Client(id=1, token="", websocket=BrokenWebSocket())  # type: ignore
+        client.start()
+        client.send(Frame("insert", "a"))
+        await asyncio.sleep(0)
+        self.assertTrue(client.closed)
+        self.assertTrue(client._writer.done())  # type: ignore
+        self.assertIsNone(client._writer.exception())  # type: ignore
+
+    async def test_drop_cursor_moves(self) -> None:
+        """Tests that queued cursor moves are dropped before edits when the queue is full"""
+        websocket = FakeWebSocket()
+        websocket.release.clear()
+        client = Client(id=1, token="", websocket=websocket, queue_size=3)  # type: ignore
+        client.send(Frame("cursorMove", "a"))
+        client.send(Frame("insert", "b"))
+        client.send(Frame("cursorMove", "c"))
+        self.assertTrue(client.send(Frame("remove", "d")))
+        self.assertFalse(client.closed)
+        self.assertEqual([frame.text for frame in client.outbox], ["b", "d"])
+        client.close()
+
+    async def test_disconnect_on_overflow(self) -> None:
+        """Tests that a client is closed when its queue overflows"""
+        websocket = FakeWebSocket()
+        websocket.release.clear()
+        client = Client(
+            id=1,
+            token="",
+            websocket=websocket,  # type: ignore
+            queue_size=2,
+            overflow_policy=OverflowPolicy.DISCONNECT,
+        )
+        client.send(Frame("cursorMove", "a"))
+        client.send(Frame("cursorMove", "b"))
+        self.assertFalse(client.send(Frame("insert", "c")))
+        self.assertTrue(client.closed)
+        await asyncio.sleep(0)
+        self.assertTrue(websocket.closed)
+
+    async def test_is_dead(self) -> None:
+        """Tests that silent clients, and clients not reading, are dead"""
+        websocket = FakeWebSocket()
+        websocket.release.clear()
+        client = Client(id=1, token="", websocket=websocket)  # type: ignore
+        now = client.last_received
+        self.assertFalse(client.is_dead(now + 1, 5))
+        self.assertTrue(client.is_dead(now + 6, 5))
+        client.start()
+        client.send(Frame("insert", "a"))
+        await asyncio.sleep(0)
+        client.last_received = now + 6
+        self.assertTrue(client.is_dead(now + 6, 5))
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
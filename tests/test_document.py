@@ -0,0 +1,67 @@
+import unittest
+
+from sirenity.document import Document
+
+
+class TestDocument(unittest.TestCase):
+    """Tests Document"""
+
+    def test_insert(self) -> None:
+        """Tests inserting text within a line and across lines"""
+        document = Document(["print()"])
+        document.insert({"row": 0, "column": 6}, ["1"])
+        self.assertEqual(document.lines, ["print(1)"])
+        document.insert({"row": 0, "column": 0}, ["for i in x:", "    "])
+        self.assertEqual(document.lines, ["for i in x:", "    print(1)"])
+
+    def test_remove(self) -> None:
+        """Tests removing text within a line and across lines"""
+        document = Document(["a = 1", "b = 2", "c = 3"])
+        document.remove({"row": 0, "column": 4}, {"row": 2, "column": 4})
+        self.assertEqual(document.lines, ["a = 3"])
+        document.remove({"row": 0, "column": 0}, {"row": 0, "column": 4})
+        self.assertEqual(document.text, "3")
+
+    def test_apply_ace_deltas(self) -> None:
+        """Tests that Ace deltas are applied in order"""
+        document = Document()
+        document.apply(
+            "insert",
+            {
+                "start": {"row": 0, "column": 0},
+                "end": {"row": 1, "column": 0},
+                "text": ["x", ""],
+            },
+        )
+        document.apply(
+            "remove",
+            {
+                "start": {"row": 0, "column": 1},
+                "end": {"row": 1, "column": 0},
+                "text": ["", ""],
+            },
+        )
+        self.assertEqual(document.lines, ["x"])
+
+    def test_clamp(self) -> None:
+        """Tests that positions out of the document are clamped"""
+        document = Document(["abc"])
+        document.insert({"row": 5, "column": 10}, ["d"])
+        self.assertEqual(document.lines, ["abcd"])
+
+    def test_reject_malformed(self) -> None:
+        """Tests that deltas with text that is not lines, or bad positions, are rejected"""
+        document = Document(["abc"])
+        for start, text in (
+            ({"row": 0, "column": 0}, [1]),
+            ({"row": 0, "column": 0}, "d"),
+            ([0, 0], ["d"]),
+        ):
+            with self.assertRaises(TypeError):
+                document.insert(start, text)  # type: ignore
+        self.assertEqual(document.lines, ["abc"])
+        self.assertEqual(document.text, "abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from sirenity.code import SandboxError, SandboxExecutor, SandboxTimeoutError
+
+
+class TestSandboxExecutor(unittest.IsolatedAsyncioTestCase):
+    """Tests SandboxExecutor"""
+
+    executor: SandboxExecutor
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Creates an executor shared by the tests"""
+        cls.executor = SandboxExecutor(workers=2, timeout=0.5, cpu_limit=1)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Stops the worker processes"""
+        cls.executor.close()
+
+    async def test_run(self) -> None:
+        """Tests that the output of a submission is returned"""
+        self.assertEqual(await self.executor.run("print(1 + 2)"), "3\n")
+
+    async def test_run_all(self) -> None:
+        """Tests that submissions are run in parallel, each with its own output"""
+        results = await self.executor.run_all(
+            {1: "print(1)", 2: "print(2)", 3: "import os"}
+        )
+        self.assertEqual(results[1], "1\n")
+        self.assertEqual(results[2], "2\n")
+        self.assertIsInstance(results[3], SandboxError)
+
+    async def test_frames_refused(self) -> None:
+        """Tests that submissions cannot reach the globals of the worker through frames"""
+        with self.assertRaises(SandboxError):
+            await self.executor.run(
+                "g = (g.gi_frame.f_back.f_back.f_globals for x in [1])\n"
+                "print(list(g)[0]['os'])"
+            )
+
+    async def test_timeout(self) -> None:
+        """Tests that submissions running for too long are stopped"""
+        with self.assertRaises(SandboxTimeoutError):
+            await self.executor.run("x = 0\nfor i in range(10 ** 10):\n    x = x + i")
+        self.assertEqual(await self.executor.run("print(4)"), "4\n")
+
+    async def test_stuck_worker_spares_other_rooms(self) -> None:
+        """Tests that replacing the pool for a stuck worker reruns other submissions"""
+        executor = SandboxExecutor(workers=1, timeout=0.5, cpu_limit=1)
+        try:
+            await executor.start()
+            # Summing a range runs in C, so the worker cannot stop itself
+            stuck = asyncio.ensure_future(executor.run("print(sum(range(10 ** 12)))"))
+            await asyncio.sleep(0.1)
+            other = asyncio.ensure_future(executor.run("print(2)"))
+            with self.assertRaises(SandboxTimeoutError):
+                await stuck
+            self.assertEqual(await other, "2\n")
+        finally:
+            executor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
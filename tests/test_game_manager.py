@@ -0,0 +1,312 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from typing import Any
+
+from sirenity.broker import InProcessBroker, Journal
+from sirenity.client import Client
+from sirenity.euler import AsyncProblemManager
+from sirenity.game_manager import GameManager
+from sirenity.message import Message
+
+from .helpers import FakeWebSocket, problem_database
+
+
+class FakeExecutor:
+    """Records the code it is asked to run"""
+
+    def __init__(self) -> None:
+        self.runs: list[dict[int, str]] = []
+
+    async def run_all(self, codes: dict[int, str]) -> dict[int, str]:
+        """Records code and returns no output"""
+        self.runs.append(codes)
+        return {problem_id: "" for problem_id in codes}
+
+
+class TestGameManager(unittest.IsolatedAsyncioTestCase):
+    """Tests GameManager"""
+
+    async def asyncSetUp(self) -> None:
+        """Creates a game with two players"""
+        self.problem_manager = AsyncProblemManager(problem_database(), pool_size=1)
+        self.game = GameManager(
+            problem_manager=self.problem_manager,
+            people_per_game=3,
+            cursor_interval=0.01,
+        )
+        await self.game.open()
+        self.first, self.second = FakeWebSocket(), FakeWebSocket()
+        self.first_id, self.first_token = await self.game.add_client(self.first)  # type: ignore
+        await self.game.add_client(self.second)  # type: ignore
+
+    async def asyncTearDown(self) -> None:
+        """Closes the problem database"""
+        self.problem_manager.close()
+
+    def message(
+        self, action: str, data: dict[str, Any], problem_id: int = 0
+    ) -> Message:
+        """Returns a message from the first player"""
+        return Message(
+            json.dumps(
+                {
+                    "action": action,
+                    "user_id": self.first_id,
+                    "token": self.first_token,
+                    "data": data,
+                    "problem_id": problem_id,
+                }
+            )
+        )
+
+    async def test_cursor_moves_coalesced(self) -> None:
+        """Tests that only the latest cursor move of a tick is sent"""
+        for column in range(3):
+            await self.game.broadcast(
+                self.first_id,
+                self.message("cursorMove", {"pos": {"row": 0, "column": column}}),
+            )
+        await asyncio.sleep(0.05)
+        moves = [
+            frame for frame in self.second.frames() if frame["action"] == "cursorMove"
+        ]
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(moves[0]["data"]["pos"]["column"], 2)
+        self.assertNotIn("cursorMove", self.first.actions())
+
+    async def test_edits_sent_and_applied(self) -> None:
+        """Tests that edits are sent straight away and applied to the document"""
+        edit = {
+            "start": {"row": 0, "column": 0},
+            "end": {"row": 0, "column": 5},
+            "text": ["print"],
+        }
+        await self.game.broadcast(self.first_id, self.message("insert", edit))
+        await asyncio.sleep(0)
+        self.assertEqual(self.second.actions(), ["insert"])
+        self.assertEqual(self.game.documents[0].lines, ["print"])
+
+        await self.game.request_code(self.first_id)
+        await asyncio.sleep(0)
+        self.assertEqual(self.first.frames()[-1]["data"]["code"]["0"], ["print"])
+
+    async def test_batch(self) -> None:
+        """Tests that a batch of edits is sent as one frame and applied in order"""
+        ops = [
+            {
+                "action": "insert",
+                "problem_id": 0,
+                "data": {"start": {"row": 0, "column": 0}, "text": ["ab"]},
+            },
+            {
+                "action": "remove",
+                "problem_id": 0,
+                "data": {
+                    "start": {"row": 0, "column": 0},
+                    "end": {"row": 0, "column": 1},
+                },
+            },
+            {
+                "action": "insert",
+                "problem_id": 1,
+                "data": {"start": {"row": 0, "column": 0}, "text": ["c"]},
+            },
+        ]
+        await self.game.broadcast(
+            self.first_id, self.message("batch", {"ops": ops}, -1)
+        )
+        await asyncio.sleep(0)
+        self.assertEqual(self.second.actions(), ["batch"])
+        self.assertEqual(self.second.frames()[0]["data"]["ops"], ops)
+        self.assertEqual(self.game.documents[0].lines, ["b"])
+        self.assertEqual(self.game.documents[1].lines, ["c"])
+
+    async def test_malformed_batch(self) -> None:
+        """Tests that a batch with malformed edits applies the others"""
+        ops = [
+            {"action": "insert", "data": {"start": {"row": 0, "column": 0}}},
+            {"action": "insert", "problem_id": 0},
+            {
+                "action": "insert",
+                "problem_id": 0,
+                "data": {"start": {"row": 0, "column": 0}, "text": ["ok"]},
+            },
+        ]
+        await self.game.handle_message(
+            self.first_id, self.message("batch", {"ops": ops}, -1)
+        )
+        self.assertEqual(self.game.documents[0].lines, ["ok"])
+
+    async def test_malformed_insert_not_applied(self) -> None:
+        """Tests that an insert of text that is not lines leaves the code runnable"""
+        edit = {"start": {"row": 0, "column": 0}, "text": [1]}
+        await self.game.handle_message(self.first_id, self.message("insert", edit))
+        self.assertEqual(self.game.documents[0].lines, [""])
+        self.assertEqual(self.game.get_code()[0], "")
+
+    async def test_code_consensus(self) -> None:
+        """Tests that the code submitted by the most players is run"""
+        self.game.documents[1].lines = ["print(1)"]
+        for client_id, lines in ((1, ["a"]), (2, ["b"]), (3, ["a"]), (3, ["b"])):
+            self.game.handle_event(
+                {"type": "submit", "client": client_id, "code": {"0": lines}}
+            )
+        code = self.game.get_code()
+        self.assertEqual(code[0], "a")
+        self.assertEqual(code[1], "print(1)")
+
+    async def test_malformed_submission(self) -> None:
+        """Tests that code for unknown problems, or that is not text, is dropped"""
+        events: list[dict] = []
+        self.game.broker.handlers[self.game.channel] = events.append  # type: ignore
+        code = {"x": ["a"], "0": ["a", 1], "1": "b\nc", "99": ["d"], "2": ["e"]}
+        await self.game.handle_message(
+            self.first_id, self.message("submitCode", {"code": code})
+        )
+        self.assertEqual(events[-1]["code"], {1: ["b", "c"], 2: ["e"]})
+        self.game.handle_event(events[-1])
+        self.game.handle_event({"type": "submit", "client": 2, "code": {"x": ["a"]}})
+        self.assertEqual(self.game.get_code()[2], "e")
+
+    async def test_submit_timeout(self) -> None:
+        """Tests that the code is run when a player does not submit in time"""
+        executor = FakeExecutor()
+        self.game.executor = executor  # type: ignore
+        self.game.is_leader = True
+        self.game.submit_timeout = 0.01
+        self.game.handle_event({"type": "game_end"})
+        await self.game.handle_message(
+            self.first_id, self.message("submitCode", {"code": {"0": ["a"]}})
+        )
+        self.assertEqual(executor.runs, [])
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(executor.runs), 1)
+        self.assertEqual(executor.runs[0][0], "a")
+        self.assertIn("code_results", self.second.actions())
+
+    async def test_sender_bound_to_connection(self) -> None:
+        """Tests that relayed messages carry the ID of the connection they came from"""
+        message = self.message("chat_message", {"message": "hi"})
+        message.text = message.text.replace('"user_id"', '"spoofed"')
+        message.text = message.text[:-1] + ', "user_id": 99}'
+        await self.game.handle_message(self.first_id, message)
+        await asyncio.sleep(0)
+        self.assertEqual(self.second.frames()[-1]["user_id"], self.first_id)
+        self.assertNotIn("token", self.second.frames()[-1])
+
+    async def test_resume(self) -> None:
+        """Tests that a reconnecting player keeps their ID and the room"""
+        websocket = FakeWebSocket()
+        resumed = await self.game.resume_client(websocket, self.first_token)  # type: ignore
+        self.assertEqual(resumed, (self.first_id, self.first_token))
+        self.assertIsNone(await self.game.resume_client(websocket, "unknown"))  # type: ignore
+        # The old connection closing does not remove the player
+        old = Client(id=self.first_id, token="", websocket=self.first)  # type: ignore
+        await self.game.remove_client(self.first_id, old)
+        self.assertIn(self.first_id, self.game.members)
+        self.assertEqual(len(self.game.members), 2)
+        await self.game.remove_client(self.first_id, self.game.clients[self.first_id])
+        self.assertNotIn(self.first_id, self.game.members)
+
+    async def test_resume_after_game_end(self) -> None:
+        """Tests that a player resuming after the game ended is told their role and can vote"""
+        self.game.handle_event(
+            {"type": "roles", "bugposter": self.first_id, "leader": 0}
+        )
+        self.game.handle_event({"type": "game_end"})
+        websocket = FakeWebSocket()
+        await self.game.resume_client(websocket, self.first_token)  # type: ignore
+        self.game.send_state(self.first_id)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        role, game_end = websocket.frames()
+        self.assertEqual(role["data"]["role"], "Bugposter")
+        self.assertEqual(game_end["action"], "game_end")
+        self.assertEqual(game_end["data"]["users"], self.game.members)
+
+    async def test_restore(self) -> None:
+        """Tests that a game restored after a restart is resumed and timed again"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        broker = InProcessBroker(Journal(directory.name))
+        await broker.connect()
+        game = GameManager(
+            problem_manager=self.problem_manager, people_per_game=2, broker=broker
+        )
+        await game.open()
+        problems = list(game.problems)
+        client_id, token = await game.add_client(FakeWebSocket())  # type: ignore
+        await game.add_client(FakeWebSocket())  # type: ignore
+        await asyncio.sleep(0)
+        self.assertTrue(game.is_leader)
+        edit = {"start": {"row": 0, "column": 0}, "text": ["print"]}
+        await game.broadcast(client_id, self.message("insert", edit))
+        game.close(release=False)
+        await broker.close()
+
+        broker = InProcessBroker(Journal(directory.name))
+        await broker.connect()
+        restored = GameManager(
+            problem_manager=self.problem_manager,
+            problems=problems,
+            people_per_game=2,
+            broker=broker,
+        )
+        await restored.open()
+        self.assertTrue(restored.started)
+        self.assertEqual(restored.members, [1, 2])
+        self.assertEqual(restored.documents[0].lines, ["print"])
+        self.assertFalse(restored.is_leader)
+        self.assertIsNone(restored.timer)
+        websocket = FakeWebSocket()
+        resumed = await restored.resume_client(websocket, token)  # type: ignore
+        self.assertEqual(resumed, (client_id, token))
+        self.assertTrue(restored.is_leader)
+        self.assertIsNotNone(restored.timer)
+        restored.close(release=False)
+        await broker.close()
+
+    async def test_vote_counts_members(self) -> None:
+        """Tests that the vote ends once every player in the room voted"""
+        self.game.handle_event({"type": "game_end"})
+        await self.game.vote(3, self.message("vote", {"voted": 1}))
+        await self.game.vote(self.first_id, self.message("vote", {"voted": 2}))
+        self.assertEqual(self.game.voted, [self.first_id])
+        self.assertFalse(self.game.closed)
+        await self.game.vote(2, self.message("vote", {"voted": 1}))
+        self.assertTrue(self.game.closed)
+
+    async def test_reconnect_after_everyone_left(self) -> None:
+        """Tests that a room everyone left waits for them to reconnect before it is torn down"""
+        self.game.reconnect_grace = 0.01
+        await self.game.remove_client(2)
+        await self.game.remove_client(self.first_id)
+        self.assertFalse(self.game.closed)
+        await self.game.resume_client(FakeWebSocket(), self.first_token)  # type: ignore
+        await asyncio.sleep(0.05)
+        self.assertFalse(self.game.closed)
+        self.assertEqual(self.game.members, [self.first_id])
+
+        await self.game.remove_client(self.first_id)
+        await asyncio.sleep(0.05)
+        self.assertTrue(self.game.closed)
+
+    async def test_heartbeat(self) -> None:
+        """Tests that dead clients are removed, and a vote does not wait for them"""
+        self.game.handle_event({"type": "game_end"})
+        await self.game.handle_message(
+            self.first_id, self.message("vote", {"voted": 2})
+        )
+        self.game.clients[2].last_received -= 10
+        await self.game.heartbeat(5)
+        # The first player voted, so the vote ends once the second is removed
+        self.assertTrue(self.game.closed)
+        await asyncio.sleep(0)
+        self.assertEqual(self.first.actions()[-2:], ["ping", "result"])
+        self.assertNotIn("ping", self.second.actions())
+
+
+if __name__ == "__main__":
+    unittest.main()
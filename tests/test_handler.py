@@ -0,0 +1,64 @@
+import unittest
+
+from sirenity.code import CodeHandler
+from sirenity.code.handler import ALLOWED_NODES, compile_code, safe_builtins
+
+
+class TestCodeHandler(unittest.TestCase):
+    """Tests CodeHandler"""
+
+    def test_safe_run(self) -> None:
+        """Tests that allowed code is run and its output returned"""
+        code = (
+            "import math\ntotal = 0\nfor i in range(4):\n"
+            "    if i % 2:\n        total += i\nprint(math.floor(total))"
+        )
+        self.assertEqual(CodeHandler(code).safe_run(), "4\n")
+
+    def test_nested_nodes_checked(self) -> None:
+        """Tests that nodes below the top level of the code are checked"""
+        for code in (
+            "for i in range(1):\n    import os",
+            "print(().__class__)",
+            "print(__import__('os'))",
+            "x = lambda: 1",
+        ):
+            with self.subTest(code=code), self.assertRaises(ValueError):
+                CodeHandler(code).validate()
+
+    def test_builtins_refused(self) -> None:
+        """Tests that builtins reaching past the checks are refused"""
+        for code in (
+            'eval("__im" + "port__(\'os\')")',
+            "open('/etc/passwd')",
+            "print(getattr((), 'count'))",
+            "f = exec\nf('1')",
+            "print(vars())",
+            "g = (g.gi_frame.f_back.f_back.f_globals for x in [1])\nd = list(g)[0]",
+        ):
+            with self.subTest(code=code), self.assertRaises(ValueError):
+                CodeHandler(code).validate()
+
+    def test_safe_builtins(self) -> None:
+        """Tests that submissions run without the forbidden builtins"""
+        for code in ("open('/etc/passwd')", "eval('1')", "import os"):
+            compiled = compile(code, "<submission>", "exec")
+            with self.subTest(code=code), self.assertRaises((NameError, ImportError)):
+                exec(compiled, {"__builtins__": safe_builtins()})
+        namespace = {"__builtins__": safe_builtins()}
+        exec("import math\nx = math.floor(2.5)", namespace)
+        self.assertEqual(namespace["x"], 2)
+
+    def test_allowed_nodes(self) -> None:
+        """Tests that the allowlist is loaded without newlines"""
+        self.assertIsInstance(ALLOWED_NODES, frozenset)
+        self.assertIn("Assign", ALLOWED_NODES)
+
+    def test_compiled_code_cached(self) -> None:
+        """Tests that the same code is only compiled once"""
+        code = "print(5 * 5)"
+        self.assertIs(compile_code(code), compile_code(code))
+
+
+if __name__ == "__main__":
+    unittest.main()
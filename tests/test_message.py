@@ -0,0 +1,139 @@
+import json
+import unittest
+
+from sirenity.encoding import MSGPACK, packb, unpackb
+from sirenity.message import (
+    Action, Edit, Frame, Message, compact, expand, strip_token
+)
+
+EDIT = {
+    "action": "batch",
+    "problem_id": -1,
+    "data": {
+        "ops": [
+            {
+                "action": "insert",
+                "problem_id": 2,
+                "data": {
+                    "start": {"row": 0, "column": 4},
+                    "end": {"row": 0, "column": 5},
+                    "action": "insert",
+                    "lines": ["x"],
+                },
+            }
+        ]
+    },
+}
+
+
+class TestMessage(unittest.TestCase):
+    """Tests Message and Frame"""
+
+    def test_parse_message(self) -> None:
+        """Tests that the fields of a message are parsed"""
+        message = Message(
+            json.dumps(
+                {
+                    "action": "insert",
+                    "user_id": 1,
+                    "token": "abc",
+                    "data": {"text": ["a"]},
+                    "problem_id": 2,
+                }
+            )
+        )
+        self.assertEqual(message.action, "insert")
+        self.assertEqual(message.user_id, 1)
+        self.assertEqual(message.token, "abc")
+        self.assertEqual(message.problem_id, 2)
+
+    def test_frame_has_no_token(self) -> None:
+        """Tests that encoding a message leaves out the token"""
+        message = Message(json.dumps({"action": "vote", "user_id": 1, "token": "abc"}))
+        frame = message.frame()
+        self.assertEqual(frame.action, "vote")
+        self.assertNotIn("token", json.loads(frame.text))
+
+    def test_frame_relays_text(self) -> None:
+        """Tests that a message is relayed as received, only without its token"""
+        text = '{"token": "ab12", "action": "insert", "data": {"text": ["token"]}}'
+        message = Message(text)
+        self.assertIs(message.action, Action.INSERT)
+        self.assertEqual(
+            message.frame().text, '{"action": "insert", "data": {"text": ["token"]}}'
+        )
+        self.assertIs(message.frame(), message.frame())
+        self.assertEqual(strip_token('{"a": 1, "token": "ff"}'), '{"a": 1}')
+        # A token that cannot be told apart is left to the encoder
+        self.assertIsNone(strip_token('{"token": "ff", "data": {"token": "ff"}}'))
+
+    def test_frame_from_dictionary(self) -> None:
+        """Tests that a frame decodes back to the dictionary it was made from"""
+        dictionary = {"action": "role", "data": {"role": "Bugposter"}}
+        frame = Frame.from_dictionary(dictionary)
+        self.assertEqual(frame.action, "role")
+        self.assertEqual(json.loads(frame.text), dictionary)
+
+    def test_edits(self) -> None:
+        """Tests that edits are read from single edits and batches"""
+        single = Message(json.dumps({"action": "insert", "problem_id": 1, "data": {}}))
+        self.assertEqual(single.edits(), [Edit("insert", 1, {})])
+        batch = Message(
+            json.dumps(
+                {
+                    "action": "batch",
+                    "problem_id": -1,
+                    "data": {
+                        "ops": [
+                            {"action": "remove", "problem_id": 2, "data": {}},
+                            {"action": "vote", "problem_id": 2, "data": {}},
+                        ]
+                    },
+                }
+            )
+        )
+        self.assertEqual(batch.edits(), [Edit("remove", 2, {})])
+        self.assertEqual(Message(json.dumps({"action": "vote"})).edits(), [])
+
+    def test_malformed_edits(self) -> None:
+        """Tests that malformed edits are skipped instead of raising"""
+        ops = [
+            {"action": "insert", "data": {}},
+            {"action": "insert", "problem_id": 1},
+            {"action": "insert", "problem_id": "1", "data": {}},
+            {"action": "remove", "problem_id": 1, "data": []},
+            {"problem_id": 1, "data": {}},
+            {"action": "insert", "problem_id": 3, "data": {}},
+        ]
+        batch = Message(json.dumps({"action": "batch", "data": {"ops": ops}}))
+        self.assertEqual(batch.edits(), [Edit("insert", 3, {})])
+        for data in ({"ops": 1}, {"ops": {"action": "insert"}}, {}):
+            message = Message(json.dumps({"action": "batch", "data": data}))
+            self.assertEqual(message.edits(), [])
+        single = Message(json.dumps({"action": "insert", "data": {}}))
+        self.assertEqual(single.edits(), [])
+
+    def test_compact(self) -> None:
+        """Tests that compact messages expand back to the messages they were"""
+        packed = compact(EDIT)
+        self.assertEqual(packed["a"], 2)
+        self.assertEqual(packed["d"]["o"][0]["d"]["s"], {"r": 0, "c": 4})
+        self.assertEqual(expand(packed), EDIT)
+        self.assertEqual(expand(compact({"action": "unknown"})), {"action": "unknown"})
+        self.assertEqual(expand([1]), {})
+
+    @unittest.skipUnless(MSGPACK, "msgpack is not installed")
+    def test_binary(self) -> None:
+        """Tests that binary messages are relayed as JSON and encoded once"""
+        message = Message(packb(compact({**EDIT, "token": "ff", "user_id": 9})))
+        message.user_id = 3
+        self.assertIsNone(message.token)
+        self.assertEqual(len(message.edits()), 1)
+        frame = message.frame()
+        self.assertEqual(json.loads(frame.text), {**EDIT, "user_id": 3})
+        self.assertIs(frame.binary, frame.binary)
+        self.assertEqual(expand(unpackb(frame.binary)), {**EDIT, "user_id": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import types
+import unittest
+
+from sirenity import metrics
+from sirenity.message import Action
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests the metrics and their text format"""
+
+    def test_counter(self) -> None:
+        """Tests that counters are rendered by labels and can forget them"""
+        counter = metrics.Counter("test_total", "A counter", ("room",))
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        counter.inc('b"')
+        lines = list(counter.render())
+        self.assertEqual(
+            lines[:2], ["# HELP test_total A counter", "# TYPE test_total counter"]
+        )
+        self.assertIn('test_total{room="a"} 3', lines)
+        self.assertIn('test_total{room="b\\""} 1', lines)
+        counter.remove("a")
+        self.assertNotIn('test_total{room="a"} 3', list(counter.render()))
+
+    def test_histogram(self) -> None:
+        """Tests that histogram buckets are cumulative"""
+        histogram = metrics.Histogram("test_seconds", "A histogram", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        lines = list(histogram.samples())
+        self.assertEqual(
+            lines,
+            [
+                'test_seconds_bucket{le="0.1"} 1',
+                'test_seconds_bucket{le="1.0"} 2',
+                'test_seconds_bucket{le="+Inf"} 3',
+                "test_seconds_sum 5.55",
+                "test_seconds_count 3",
+            ],
+        )
+
+    def test_messages(self) -> None:
+        """Tests that messages are counted by action, made up actions together"""
+        metrics.observe_message("room", Action.INSERT, 0.001)
+        metrics.observe_message("room", "made up", 0.001)
+        self.assertGreaterEqual(metrics.MESSAGES.values[("insert",)], 1)
+        self.assertGreaterEqual(metrics.MESSAGES.values[("other",)], 1)
+        self.assertNotIn(("made up",), metrics.MESSAGES.values)
+
+    def test_watch_rooms(self) -> None:
+        """Tests that gauges read the rooms when rendered"""
+        client = types.SimpleNamespace(outbox=[1, 2])
+        rooms = {"a": types.SimpleNamespace(clients={1: client, 2: client})}
+        metrics.watch_rooms(rooms)
+        text = metrics.render()
+        self.assertIn("sirenity_rooms 1\n", text)
+        self.assertIn("sirenity_clients 2\n", text)
+        self.assertIn("sirenity_queued_frames 4\n", text)
+        self.assertIn("sirenity_max_queued_frames 2\n", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
+import asyncio
+import io
 import sqlite3
 import tempfile
 import unittest
 from typing import ClassVar
 
-from sirenity.euler import Problem, ProblemManager, ProblemNotFoundError
+from sirenity.euler import (
+    AsyncProblemManager, Problem, ProblemManager, ProblemNotFoundError
+)
 
 
 class TestProblemManager(unittest.TestCase):
@@ -70,6 +74,73 @@ class TestProblemManager(unittest.TestCase):
             <= max_difficulty
         )
 
+    def test_random_problems(self) -> None:
+        """Tests that distinct problems are returned, failing if there are not enough"""
+        for i in range(5):
+            self.manager.add_problem(
+                Problem(
+                    id=1000 + i,
+                    prompt="Problem prompt",
+                    solution="solution",
+                    difficulty=500 + i,
+                )
+            )
+        problems = self.manager.get_random_problems(
+            4, min_difficulty=500, max_difficulty=504, exclude={1000}
+        )
+        self.assertEqual(len({problem.id for problem in problems}), 4)
+        self.assertNotIn(1000, [problem.id for problem in problems])
+        with self.assertRaises(ProblemNotFoundError):
+            self.manager.get_random_problems(6, min_difficulty=500, max_difficulty=504)
+
+    def test_cache_invalidated(self) -> None:
+        """Tests that problems added after the cache is loaded are found"""
+        self.manager.get_at_id(1)
+        other = ProblemManager(self.database_location)
+        self.assertIs(other.cache, self.manager.cache)
+        other.add_problem(
+            Problem(id=2000, prompt="Problem prompt", solution="other", difficulty=2)
+        )
+        self.assertTrue(self.manager.check_solution("other", 2000))
+        self.assertEqual(
+            self.manager.get_json(2000), self.manager.get_at_id(2000).json()
+        )
+
+    def test_async_problem_manager(self) -> None:
+        """Tests that queries run in threads and problems added there are found"""
+
+        async def query() -> None:
+            manager = AsyncProblemManager(self.database_location, pool_size=2)
+            await manager.add_problem(
+                Problem(
+                    id=3000, prompt="Problem prompt", solution="async", difficulty=3
+                )
+            )
+            self.assertTrue(await manager.check_solution("async", 3000))
+            problems = await manager.get_random_problems(
+                1, min_difficulty=3, max_difficulty=3
+            )
+            self.assertEqual(problems[0].id, 3000)
+            manager.close()
+
+        asyncio.run(query())
+
+    def test_load_problems(self) -> None:
+        """Tests that importing the same CSV file twice updates the problems"""
+        source = io.StringIO(
+            "id,prompt,solution,difficulty\n"
+            + "".join(f"{4000 + i},Problem prompt,{i},4\n" for i in range(5))
+        )
+        reports: list[int] = []
+        imported = self.manager.load_problems(
+            source, batch_size=2, progress=lambda rows, rate: reports.append(rows)
+        )
+        self.assertEqual(imported, 5)
+        self.assertEqual(reports, [2, 4, 5])
+        source.seek(0)
+        self.manager.load_problems(source)
+        self.assertTrue(self.manager.check_solution("3", 4003))
+
     @classmethod
     def setUpClass(cls):
         """Prepares tests"""
@@ -0,0 +1,58 @@
+import asyncio
+import time
+import unittest
+
+from sirenity import profiler
+from sirenity.profiler import Profile, ProfileRunningError
+
+
+def busy_handler(seconds: float) -> None:
+    """Blocks the event loop"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfile(unittest.IsolatedAsyncioTestCase):
+    """Tests Profile"""
+
+    async def test_run(self) -> None:
+        """Tests that stacks, loop lag and handlers of the window are reported"""
+
+        async def block() -> None:
+            await asyncio.sleep(0.02)
+            busy_handler(0.1)
+            profiler.current.record_handler("insert", "room", 1, 0.1)  # type: ignore
+            profiler.current.record_handler("vote", "room", 2, 0.001)  # type: ignore
+
+        task = asyncio.create_task(block())
+        report = await Profile(interval=0.002).run(0.2)
+        await task
+        self.assertIsNone(profiler.current)
+        self.assertGreater(report["samples"], 0)
+        self.assertIn("busy_handler (test_profiler.py:", report["stacks"])
+        self.assertGreaterEqual(report["loop_lag_ms"]["max"], 50)
+        self.assertEqual(list(report["handlers"]), ["insert", "vote"])
+        self.assertEqual(report["longest_handlers"][0]["client"], 1)
+
+    async def test_one_at_a_time(self) -> None:
+        """Tests that profiles do not overlap"""
+        task = asyncio.create_task(Profile().run(0.05))
+        await asyncio.sleep(0)
+        with self.assertRaises(ProfileRunningError):
+            await Profile().run(0.05)
+        await task
+
+    def test_longest(self) -> None:
+        """Tests that only the longest handler calls are kept"""
+        profile = Profile()
+        for i in range(profiler.LONGEST_HANDLERS + 5):
+            profile.record_handler("insert", "room", i, i / 1000)
+        longest = profile.report(1)["longest_handlers"]
+        self.assertEqual(len(longest), profiler.LONGEST_HANDLERS)
+        self.assertEqual(longest[0]["client"], profiler.LONGEST_HANDLERS + 4)
+        self.assertEqual(profile.report(1)["handlers"]["insert"]["count"], 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import tempfile
+import unittest
+
+from sirenity.broker import InProcessBroker, Journal
+from sirenity.client import OverflowPolicy
+from sirenity.game_manager import AMOUNT_OF_PROBLEMS
+from sirenity.room_manager import RoomManager, RoomNotFoundError
+
+from .helpers import FakeWebSocket, problem_database
+
+
+class TestRoomManager(unittest.IsolatedAsyncioTestCase):
+    """Tests RoomManager"""
+
+    def setUp(self) -> None:
+        """Prepares a database with enough problems for a game"""
+        self.database = problem_database()
+        self.room_manager = RoomManager(self.database)
+
+    async def asyncTearDown(self) -> None:
+        """Tears down the rooms and closes the problem database"""
+        self.room_manager.close()
+
+    async def test_create_and_get_room(self) -> None:
+        """Tests that created rooms can be found by id"""
+        room = await self.room_manager.create_room(name="Room", people_per_game=3)
+        self.assertIs(await self.room_manager.get_room(room.room_id), room)
+        self.assertEqual(room.people_per_game, 3)
+        self.assertEqual(len(room.problems), AMOUNT_OF_PROBLEMS)
+
+    async def test_get_error(self) -> None:
+        """Tests that an error is thrown for rooms that do not exist"""
+        with self.assertRaises(RoomNotFoundError):
+            await self.room_manager.get_room("missing")
+
+    async def test_find_room(self) -> None:
+        """Tests that matchmaking fills open rooms before creating new ones"""
+        room = await self.room_manager.create_room()
+        self.assertIs(await self.room_manager.find_room(), room)
+        room.started = True
+        self.assertIsNot(await self.room_manager.find_room(), room)
+
+    async def test_close_room(self) -> None:
+        """Tests that closed rooms are forgotten and their state freed"""
+        room = await self.room_manager.create_room()
+        room.votes[1] = 0
+        room.close()
+        self.assertNotIn(room.room_id, self.room_manager.rooms)
+        self.assertEqual(room.votes, {})
+        self.assertEqual(room.problems, [])
+
+    async def test_client_settings(self) -> None:
+        """Tests that the queue settings are given to the clients of created and loaded rooms"""
+        room_manager = RoomManager(
+            self.database,
+            broker=self.room_manager.broker,
+            queue_size=2,
+            overflow_policy=OverflowPolicy.DISCONNECT,
+        )
+        try:
+            created = await room_manager.create_room()
+            loaded = await room_manager.get_room(
+                (await self.room_manager.create_room()).room_id
+            )
+            for room in (created, loaded):
+                client_id, _ = await room.add_client(FakeWebSocket())  # type: ignore
+                client = room.clients[client_id]
+                self.assertEqual(client.queue_size, 2)
+                self.assertIs(client.overflow_policy, OverflowPolicy.DISCONNECT)
+        finally:
+            room_manager.close()
+
+    async def test_shut_down(self) -> None:
+        """Tests that rooms survive the server closing the connections before shutting down"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        broker = InProcessBroker(Journal(directory.name))
+        await broker.connect()
+        room_manager = RoomManager(self.database, broker=broker)
+        room = await room_manager.create_room(people_per_game=2)
+        clients = [await room.add_client(FakeWebSocket()) for _ in range(2)]  # type: ignore
+        await asyncio.sleep(0)
+        room_manager.shut_down()
+        for client_id, _ in clients:
+            await room.remove_client(client_id, room.clients[client_id])
+        self.assertFalse(room.closed)
+        room_manager.close()
+        await broker.close()
+
+        broker = InProcessBroker(Journal(directory.name))
+        await broker.connect()
+        room_manager = RoomManager(self.database, broker=broker)
+        try:
+            restored = await room_manager.get_room(room.room_id)
+            self.assertEqual(restored.members, [1, 2])
+            self.assertTrue(restored.started)
+        finally:
+            room_manager.close()
+            await broker.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
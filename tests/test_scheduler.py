@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from sirenity.scheduler import Scheduler
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    """Tests Scheduler"""
+
+    async def asyncSetUp(self) -> None:
+        """Creates a scheduler recording the callbacks run"""
+        self.scheduler = Scheduler()
+        self.ran: list[str] = []
+
+    async def test_order(self) -> None:
+        """Tests that deadlines run in order, coroutine functions included"""
+
+        async def record(name: str) -> None:
+            self.ran.append(name)
+
+        self.scheduler.call_later(0.03, self.ran.append, "c")
+        self.scheduler.call_later(0.01, self.ran.append, "a")
+        self.scheduler.call_later(0.02, record, "b")
+        await asyncio.sleep(0.06)
+        self.assertEqual(self.ran, ["a", "b", "c"])
+
+    async def test_cancel(self) -> None:
+        """Tests that cancelled deadlines do not run"""
+        deadline = self.scheduler.call_later(0.01, self.ran.append, "a")
+        deadline.cancel()
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.ran, [])
+        self.assertEqual(len(self.scheduler), 0)
+
+    async def test_pause_and_extend(self) -> None:
+        """Tests that paused deadlines keep the time they had left"""
+        deadline = self.scheduler.call_later(0.02, self.ran.append, "a")
+        deadline.pause()
+        await asyncio.sleep(0.04)
+        self.assertEqual(self.ran, [])
+        self.assertAlmostEqual(deadline.remaining(), 0.02, delta=0.005)
+        deadline.extend(0.02)
+        deadline.resume()
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.ran, [])
+        await asyncio.sleep(0.04)
+        self.assertEqual(self.ran, ["a"])
+
+    async def test_extend_earlier(self) -> None:
+        """Tests that a deadline moved earlier runs at its new time"""
+        deadline = self.scheduler.call_later(1, self.ran.append, "a")
+        deadline.extend(-0.99)
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.ran, ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import asyncio
+import io
+import pathlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sirenity.euler import ProblemManager
+from sirenity.setup.setup_project_euler import (
+    Downloader, ResponseCache, download_problems
+)
+
+PAGES = {
+    "/Solutions.md": "1. 233168\n2. 4613732\n3.\n4. 906609\n",
+    "/minimal=1": "<p>Multiples of 3 or 5</p>",
+    "/minimal=2": '<p>Even Fibonacci numbers</p><img src="project/images/p002.png">',
+    "/minimal=4": "<p>Largest palindrome product</p>",
+}
+TOOLTIP = '<span class="tooltiptext_right">Published;Solved by 1;Difficulty rating: {}%</span>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves Project Euler pages, failing the first request for problem 2"""
+
+    requests: list[str] = []
+    # Pages answered with a page missing what the problem is parsed from
+    broken: set[str] = set()
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Sends a page"""
+        self.requests.append(self.path)
+        if self.path == "/minimal=2" and self.requests.count(self.path) == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.path in self.broken:
+            text = "<p>Down for maintenance</p>"
+        elif self.path.startswith("/problem="):
+            text = TOOLTIP.format(self.path.split("=")[1])
+        elif self.path in PAGES:
+            text = PAGES[self.path]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+    def log_message(self, *args) -> None:
+        """Keeps the test output quiet"""
+
+
+class TestDownloader(unittest.TestCase):
+    """Tests downloading Project Euler problems from a local server"""
+
+    def setUp(self) -> None:
+        """Starts the server and prepares a cache and database"""
+        StubHandler.requests = []
+        StubHandler.broken = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = pathlib.Path(self.directory.name) / "cache"
+        self.manager = ProblemManager(str(pathlib.Path(self.directory.name) / "db"))
+
+    def tearDown(self) -> None:
+        """Stops the server and removes the files"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.manager.close()
+        self.directory.cleanup()
+
+    def download(self) -> int:
+        """Downloads the problems from the server"""
+
+        async def download() -> int:
+            downloader = Downloader(
+                ResponseCache(self.cache_dir), requests_per_second=0, backoff=0.01
+            )
+            try:
+                return await download_problems(
+                    self.manager,
+                    downloader,
+                    outfile,
+                    base_url=self.base_url,
+                    solutions_url=f"{self.base_url}/Solutions.md",
+                )
+            finally:
+                downloader.close()
+
+        outfile = io.StringIO()
+        return asyncio.run(download())
+
+    def test_download(self) -> None:
+        """Tests that problems are downloaded, retried and imported"""
+        self.assertEqual(self.download(), 3)
+        self.assertEqual(self.manager.get_number_of_problems(), 3)
+        problem = self.manager.get_at_id(2)
+        self.assertEqual(problem.solution, "4613732")
+        self.assertEqual(problem.difficulty, 2)
+        self.assertIn(f"{self.base_url}/project/images/p002.png", problem.prompt)
+        self.assertEqual(StubHandler.requests.count("/minimal=2"), 2)
+
+    def test_resume(self) -> None:
+        """Tests that pages already downloaded are not requested again"""
+        self.download()
+        sent = len(StubHandler.requests)
+        self.assertEqual(self.download(), 3)
+        self.assertEqual(len(StubHandler.requests), sent)
+
+    def test_skip_broken_page(self) -> None:
+        """Tests that a page that cannot be parsed skips its problem, until a later run"""
+        StubHandler.broken = {"/problem=4"}
+        self.assertEqual(self.download(), 2)
+        self.assertEqual(self.manager.get_number_of_problems(), 2)
+        StubHandler.broken = set()
+        self.assertEqual(self.download(), 3)
+        self.assertEqual(self.manager.get_at_id(4).difficulty, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import gzip
+import pathlib
+import tempfile
+import unittest
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from sirenity.static_files import (
+    IMMUTABLE, REVALIDATE, PrecompressedStaticFiles, negotiate
+)
+
+
+class TestPrecompressedStaticFiles(unittest.TestCase):
+    """Tests PrecompressedStaticFiles"""
+
+    def setUp(self) -> None:
+        """Serves a directory with a script and a sound"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = root = pathlib.Path(self.directory.name)
+        self.script = b"console.log('sirenity');\n" * 100
+        (root / "app.js").write_bytes(self.script)
+        (root / "theme.mp3").write_bytes(b"\xff\xfb" * 100)
+        self.static = PrecompressedStaticFiles(directory=root)
+        app = Starlette(routes=[Mount("/static", self.static, name="static")])
+        self.client = TestClient(app)
+
+    def tearDown(self) -> None:
+        """Removes the directory"""
+        self.directory.cleanup()
+
+    def test_negotiate(self) -> None:
+        """Tests that refused encodings are not picked"""
+        variants = {"gzip": b""}
+        self.assertEqual(negotiate("gzip, deflate", variants), "gzip")
+        self.assertEqual(negotiate("*", variants), "gzip")
+        self.assertIsNone(negotiate("gzip;q=0, identity", variants))
+        self.assertIsNone(negotiate("", variants))
+
+    def test_compressed(self) -> None:
+        """Tests that compressed variants are sent to clients accepting them"""
+        response = self.client.get(
+            "/static/app.js", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.content, self.script)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["cache-control"], REVALIDATE)
+        asset = self.static.assets[str(self.root.resolve() / "app.js")]
+        self.assertEqual(gzip.decompress(asset.variants["gzip"]), self.script)
+
+    def test_identity(self) -> None:
+        """Tests that files are sent as they are otherwise"""
+        response = self.client.get(
+            "/static/app.js", headers={"Accept-Encoding": "identity"}
+        )
+        self.assertEqual(response.content, self.script)
+        self.assertNotIn("content-encoding", response.headers)
+        sound = self.client.get("/static/theme.mp3")
+        self.assertNotIn("content-encoding", sound.headers)
+
+    def test_versioned(self) -> None:
+        """Tests that hashed URLs are immutable and ETags are revalidated"""
+        version = self.static.version("app.js")
+        response = self.client.get(f"/static/app.js?v={version}")
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE)
+        cached = self.client.get(
+            "/static/app.js",
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+        self.assertEqual(cached.status_code, 304)
+        self.assertIsNone(self.static.version("missing.js"))
+
+
+if __name__ == "__main__":
+    unittest.main()